@@ -0,0 +1,319 @@
+"""
+SSE transport 부하 테스트 스크립트
+로컬에서 스텁 지오코더와 함께 서버(--sse)를 띄우고, 여러 MCP 클라이언트가 동시에 도구를 호출하도록 하여
+처리량, 지연 시간 백분위수, 오류율, 서버 메모리(RSS)를 측정합니다.
+
+사용법:
+    python load_test.py --clients 20 --duration 30
+    python load_test.py --clients 50 --mix "get_photo_location=6,geofence_photos=2,batch_get_photo_locations=1"
+    python load_test.py --photos-dir "C:/Users/username/Pictures" --json
+"""
+import sys
+import os
+import json
+import time
+import base64
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Windows 콘솔 인코딩 설정
+if sys.platform == 'win32':
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BASE_DIR)
+
+from stub_geocoder import StubGeocoder
+
+DEFAULT_MIX = "get_photo_location=5,get_photo_location_from_base64=2,geofence_photos=2,batch_get_photo_locations=1"
+
+
+def create_sample_photos(directory: Path, count: int) -> List[Path]:
+    """서울 주변 임의 좌표의 GPS 정보를 가진 JPEG 파일을 생성합니다."""
+    import piexif
+    from PIL import Image
+
+    def to_dms(value: float):
+        value = abs(value)
+        degrees = int(value)
+        minutes = int((value - degrees) * 60)
+        seconds = round(((value - degrees) * 60 - minutes) * 60 * 100)
+        return ((degrees, 1), (minutes, 1), (seconds, 100))
+
+    rng = random.Random(0)
+    paths = []
+    for i in range(count):
+        lat = 37.5665 + rng.uniform(-0.2, 0.2)
+        lon = 126.9780 + rng.uniform(-0.2, 0.2)
+        gps_ifd = {
+            piexif.GPSIFD.GPSLatitudeRef: b"N",
+            piexif.GPSIFD.GPSLatitude: to_dms(lat),
+            piexif.GPSIFD.GPSLongitudeRef: b"E",
+            piexif.GPSIFD.GPSLongitude: to_dms(lon),
+            piexif.GPSIFD.GPSAltitudeRef: 0,
+            piexif.GPSIFD.GPSAltitude: (rng.randint(0, 5000), 100),
+        }
+        exif_bytes = piexif.dump({"0th": {}, "Exif": {}, "GPS": gps_ifd, "1st": {}, "thumbnail": None})
+        path = directory / f"photo_{i:04d}.jpg"
+        Image.new("RGB", (64, 48), (rng.randint(0, 255), 128, 128)).save(str(path), "JPEG", exif=exif_bytes)
+        paths.append(path)
+    return paths
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.strip().partition("=")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def find_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def read_rss_bytes(pid: int) -> Optional[int]:
+    """서버 프로세스(와 스캔 워커 자식 프로세스)의 RSS 합계. psutil이 없으면 /proc에서 본 프로세스만 읽습니다."""
+    try:
+        import psutil
+        process = psutil.Process(pid)
+        total = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                pass
+        return total
+    except ImportError:
+        pass
+    except Exception:
+        return None
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(pct / 100.0 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def build_arguments(tool: str, photos: List[Path], photos_dir: Path, encoded_photos: List[str],
+                    rng: random.Random) -> Dict:
+    if tool == "get_photo_location":
+        return {"image_path": str(rng.choice(photos))}
+    if tool == "get_photo_location_from_base64":
+        return {"image_base64": rng.choice(encoded_photos), "image_format": "jpg"}
+    if tool == "geofence_photos":
+        return {"directory_path": str(photos_dir), "center_latitude": 37.5665,
+                "center_longitude": 126.9780, "radius_km": rng.choice([1.0, 5.0, 20.0]),
+                "address_mode": "none"}
+    if tool == "batch_get_photo_locations":
+        return {"directory_path": str(photos_dir), "address_mode": "none"}
+    if tool == "get_resolved_addresses":
+        return {"address_handles": []}
+    raise ValueError(f"알 수 없는 도구입니다: {tool}")
+
+
+async def run_client(client_id: int, url: str, mix: Dict[str, float], deadline: float,
+                     photos: List[Path], photos_dir: Path, encoded_photos: List[str],
+                     samples: List[tuple], call_timeout: float) -> None:
+    from fastmcp import Client
+
+    rng = random.Random(client_id)
+    tools, weights = list(mix), list(mix.values())
+    try:
+        async with Client(url, timeout=call_timeout) as client:
+            while time.monotonic() < deadline:
+                tool = rng.choices(tools, weights)[0]
+                arguments = build_arguments(tool, photos, photos_dir, encoded_photos, rng)
+                start = time.monotonic()
+                ok = True
+                try:
+                    result = await client.call_tool(tool, arguments, raise_on_error=False)
+                    if result.is_error:
+                        ok = False
+                    elif result.content and getattr(result.content[0], "text", None):
+                        text = result.content[0].text
+                        ok = not text.startswith('{"error"')
+                except Exception:
+                    ok = False
+                samples.append((tool, time.monotonic() - start, ok, start))
+    except Exception as e:
+        # 연결 자체가 실패한 경우도 오류로 집계
+        samples.append(("connect", 0.0, False, time.monotonic()))
+        print(f"[WARN] 클라이언트 {client_id} 연결 실패: {e}", file=sys.stderr)
+
+
+async def sample_rss(pid: int, stop: asyncio.Event, rss_samples: List[int], interval: float = 0.5) -> None:
+    while not stop.is_set():
+        rss = read_rss_bytes(pid)
+        if rss is not None:
+            rss_samples.append(rss)
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+def wait_for_port(host: str, port: int, process: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"서버 프로세스가 종료되었습니다 (exit code {process.returncode})")
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("서버가 제한 시간 안에 시작되지 않았습니다")
+
+
+def summarize(samples: List[tuple], elapsed: float, rss_samples: List[int]) -> Dict:
+    def stats(entries: List[tuple]) -> Dict:
+        latencies = sorted(latency for _, latency, _, _ in entries)
+        errors = sum(1 for _, _, ok, _ in entries if not ok)
+        return {
+            "calls": len(entries),
+            "errors": errors,
+            "error_rate": round(errors / len(entries), 4) if entries else 0.0,
+            "throughput_per_sec": round(len(entries) / elapsed, 2) if elapsed else 0.0,
+            "latency_ms": {
+                "p50": round(percentile(latencies, 50) * 1000, 1),
+                "p90": round(percentile(latencies, 90) * 1000, 1),
+                "p99": round(percentile(latencies, 99) * 1000, 1),
+                "max": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+            },
+        }
+
+    by_tool: Dict[str, List[tuple]] = {}
+    for entry in samples:
+        by_tool.setdefault(entry[0], []).append(entry)
+    report = {"duration_sec": round(elapsed, 2), "total": stats(samples),
+              "tools": {name: stats(entries) for name, entries in sorted(by_tool.items())}}
+    if rss_samples:
+        report["server_rss_mb"] = {
+            "start": round(rss_samples[0] / 1048576, 1),
+            "peak": round(max(rss_samples) / 1048576, 1),
+            "end": round(rss_samples[-1] / 1048576, 1),
+        }
+    return report
+
+
+def print_report(report: Dict, clients: int) -> None:
+    print("=" * 78)
+    print(f"부하 테스트 결과: 클라이언트 {clients}개, {report['duration_sec']}초")
+    print("=" * 78)
+    header = f"{'도구':<34}{'호출':>7}{'처리량/s':>10}{'오류율':>8}{'p50':>8}{'p90':>8}{'p99':>8}"
+    print(header + "  (ms)")
+    rows = list(report["tools"].items()) + [("전체", report["total"])]
+    for name, entry in rows:
+        latency = entry["latency_ms"]
+        print(f"{name:<34}{entry['calls']:>7}{entry['throughput_per_sec']:>10}"
+              f"{entry['error_rate'] * 100:>7.1f}%{latency['p50']:>8}{latency['p90']:>8}{latency['p99']:>8}")
+    if "server_rss_mb" in report:
+        rss = report["server_rss_mb"]
+        print(f"\n서버 RSS: 시작 {rss['start']}MB, 최대 {rss['peak']}MB, 종료 {rss['end']}MB")
+
+
+async def run_load(args, url: str, server_pid: Optional[int], photos: List[Path], photos_dir: Path) -> Dict:
+    mix = parse_mix(args.mix)
+    encoded_photos = [base64.b64encode(p.read_bytes()).decode("ascii") for p in photos[:20]]
+    samples: List[tuple] = []
+    rss_samples: List[int] = []
+    stop = asyncio.Event()
+    # 외부 서버(--url)는 RSS를 측정할 수 없으므로 건너뜀
+    rss_task = asyncio.create_task(sample_rss(server_pid, stop, rss_samples)) if server_pid else None
+
+    start = time.monotonic()
+    deadline = start + args.duration
+    await asyncio.gather(*(
+        run_client(i, url, mix, deadline, photos, photos_dir, encoded_photos, samples, args.call_timeout)
+        for i in range(args.clients)
+    ))
+    elapsed = time.monotonic() - start
+    stop.set()
+    if rss_task is not None:
+        await rss_task
+    return summarize(samples, elapsed, rss_samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SSE transport 부하 테스트")
+    parser.add_argument("--clients", type=int, default=10, help="동시 클라이언트 수")
+    parser.add_argument("--duration", type=float, default=20.0, help="측정 시간 (초)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="도구=가중치 목록 (쉼표로 구분)")
+    parser.add_argument("--photos-dir", help="테스트에 사용할 사진 디렉토리 (없으면 임시 사진 생성)")
+    parser.add_argument("--photo-count", type=int, default=100, help="생성할 임시 사진 수")
+    parser.add_argument("--port", type=int, default=0, help="서버 포트 (0이면 빈 포트 자동 선택)")
+    parser.add_argument("--stub-latency-ms", type=float, default=20.0, help="스텁 지오코더 응답 지연")
+    parser.add_argument("--call-timeout", type=float, default=60.0, help="도구 호출 제한 시간 (초)")
+    parser.add_argument("--url", help="이미 실행 중인 서버의 SSE URL (지정하면 서버를 띄우지 않음)")
+    parser.add_argument("--json", action="store_true", help="결과를 JSON으로 출력")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="mcp-load-") as temp_dir:
+        if args.photos_dir:
+            photos_dir = Path(args.photos_dir)
+            photos = sorted(p for p in photos_dir.iterdir() if p.suffix.lower() in (".jpg", ".jpeg"))
+            if not photos:
+                print(f"[ERROR] JPEG 파일이 없습니다: {photos_dir}")
+                return 1
+        else:
+            photos_dir = Path(temp_dir)
+            photos = create_sample_photos(photos_dir, args.photo_count)
+
+        stub = StubGeocoder(latency_ms=args.stub_latency_ms).start()
+        process = None
+        try:
+            if args.url:
+                url, server_pid = args.url, None
+            else:
+                port = args.port or find_free_port()
+                env = dict(os.environ,
+                           MCP_TRANSPORT="sse", HOST="127.0.0.1", PORT=str(port),
+                           GEOCODER_URL=stub.url, GEOCODER_RATE_PER_SEC="1000")
+                process = subprocess.Popen(
+                    [sys.executable, os.path.join(BASE_DIR, "server.py"), "--sse"],
+                    env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+                )
+                wait_for_port("127.0.0.1", port, process)
+                url, server_pid = f"http://127.0.0.1:{port}/sse", process.pid
+
+            report = asyncio.run(run_load(args, url, server_pid, photos, photos_dir))
+            report["geocoder_requests"] = stub.request_count
+        finally:
+            if process is not None:
+                process.terminate()
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+            stub.stop()
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report, args.clients)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
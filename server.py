@@ -2,91 +2,548 @@
 MCP Photo Location Server
 사진 파일에서 GPS 위치 정보를 추출하는 MCP 서버
 """
-from fastmcp import FastMCP
+from fastmcp import FastMCP, Context
+from fastmcp.exceptions import ToolError
+from fastmcp.server.middleware import Middleware, MiddlewareContext
+from starlette.requests import Request
+from starlette.responses import Response
 from pathlib import Path
 import piexif
 from typing import Optional, Dict, Any, List
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from array import array
 import json
 import math
 import shutil
 import base64
 import tempfile
+import zipfile
+import tarfile
 import io
+import os
+import gzip
+import sys
+import mmap
+import time
+import queue
+import hashlib
+import threading
+import functools
+import inspect
+import fnmatch
+import bisect
+import calendar
+from datetime import date, datetime, timedelta, timezone
+import heapq
+import random
+import cProfile
+import pstats
+import contextvars
+from xml.etree import ElementTree
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+import anyio
 import httpx
 
+@asynccontextmanager
+async def _server_lifespan(server: FastMCP):
+    """서버 시작 시 스냅샷을 비동기로 불러오고, 종료 시 마지막 체크포인트를 기록합니다."""
+    _snapshot_manager.start()
+    try:
+        yield {}
+    finally:
+        await anyio.to_thread.run_sync(_snapshot_manager.checkpoint)
+
+
 # MCP 서버 인스턴스 생성
-mcp = FastMCP("Photo Location Server")
+mcp = FastMCP("Photo Location Server", lifespan=_server_lifespan)
+
+
+# 역지오코딩 클라이언트 설정
+# - GEOCODER_URL: 기본 엔드포인트 (Nominatim reverse API 호환)
+# - GEOCODER_SECONDARY_URL: 보조 엔드포인트 (설정하면 장애 시 우회, 헤지 요청 대상)
+# - GEOCODER_RATE_PER_SEC: 엔드포인트별 최대 요청 속도 (Nominatim 이용 정책: 초당 1회)
+# - GEOCODER_HEDGE_DELAY_MS: 기본 엔드포인트가 이 시간 안에 응답하지 않으면 보조 엔드포인트에도 요청
+# - GEOCODER_BREAKER_THRESHOLD / GEOCODER_BREAKER_RESET_SEC: 연속 실패 횟수와 차단 유지 시간
+GEOCODER_URL = os.getenv("GEOCODER_URL", "https://nominatim.openstreetmap.org/reverse")
+GEOCODER_SECONDARY_URL = os.getenv("GEOCODER_SECONDARY_URL", "")
+GEOCODER_RATE_PER_SEC = float(os.getenv("GEOCODER_RATE_PER_SEC", "1.0"))
+GEOCODER_HEDGE_DELAY_MS = os.getenv("GEOCODER_HEDGE_DELAY_MS", "")
+GEOCODER_BREAKER_THRESHOLD = int(os.getenv("GEOCODER_BREAKER_THRESHOLD", "5"))
+GEOCODER_BREAKER_RESET_SEC = float(os.getenv("GEOCODER_BREAKER_RESET_SEC", "30"))
+
+
+class _TokenBucket:
+    """
+    토큰 버킷 방식의 요청 속도 제한기입니다.
+    
+    토큰을 미리 예약하는 방식이라 여러 스레드가 동시에 요청해도 순서대로 간격이 벌어집니다.
+    서버가 과부하(429/503)를 알리면 속도를 절반으로 줄이고, 성공할 때마다 조금씩 원래 속도로 회복합니다.
+    """
+    
+    def __init__(self, rate_per_sec: float, capacity: float = 1.0, min_rate_per_sec: float = 0.05):
+        self._max_rate = rate_per_sec
+        self._min_rate = min(min_rate_per_sec, rate_per_sec)
+        self._rate = rate_per_sec
+        self._capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+    
+    @property
+    def rate(self) -> float:
+        return self._rate
+    
+    def _refill_locked(self, now: float) -> None:
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated_at) * self._rate)
+        self._updated_at = now
+    
+    def acquire(self, timeout: float) -> bool:
+        """토큰 하나를 예약하고 차례가 올 때까지 기다립니다. timeout 안에 차례가 오지 않으면 False."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill_locked(now)
+            wait = max(-(self._tokens - 1.0) / self._rate, 0.0)
+            if wait > timeout:
+                return False
+            self._tokens -= 1.0
+        if wait > 0:
+            time.sleep(wait)
+        return True
+    
+    def penalize(self, retry_after: Optional[float] = None) -> None:
+        """과부하 응답을 받으면 속도를 절반으로 줄이고, Retry-After 동안은 토큰을 내주지 않습니다."""
+        with self._lock:
+            self._refill_locked(time.monotonic())
+            self._rate = max(self._rate / 2.0, self._min_rate)
+            if retry_after:
+                self._tokens = min(self._tokens, -retry_after * self._rate)
+    
+    def reward(self) -> None:
+        """성공 응답마다 최대 속도의 10%씩 회복합니다."""
+        with self._lock:
+            if self._rate < self._max_rate:
+                self._refill_locked(time.monotonic())
+                self._rate = min(self._rate + self._max_rate * 0.1, self._max_rate)
+
+
+class _CircuitBreaker:
+    """
+    연속 실패가 threshold번 쌓이면 reset_sec 동안 요청을 즉시 거절하는 서킷 브레이커입니다.
+    
+    차단 시간이 지나면 한 번의 시험 요청(half-open)만 허용하고, 성공하면 닫히고 실패하면 다시 열립니다.
+    """
+    
+    def __init__(self, threshold: int, reset_sec: float):
+        self._threshold = max(threshold, 1)
+        self._reset_sec = reset_sec
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+    
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self._reset_sec:
+                return "half_open"
+            return "open"
+    
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self._reset_sec or self._probing:
+                return False
+            self._probing = True
+            return True
+    
+    def release_probe(self) -> None:
+        """시험 요청을 보내지 못한 경우 다음 호출이 시험 요청을 보낼 수 있게 합니다."""
+        with self._lock:
+            self._probing = False
+    
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+    
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self._threshold:
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+
+class _GeocodeUnavailable(Exception):
+    """엔드포인트가 응답하지 않았거나 오류를 반환함 (서킷 브레이커 실패로 집계)."""
+
+
+class _GeocodingClient:
+    """
+    역지오코딩 엔드포인트 호출을 담당하는 클라이언트 계층입니다.
+    
+    엔드포인트마다 속도 제한기와 서킷 브레이커를 두고, 연결은 하나의 httpx.Client로 재사용합니다.
+    보조 엔드포인트가 있으면 기본 엔드포인트가 차단/실패했을 때 우회하고, hedge_delay_sec가
+    설정되어 있으면 기본 엔드포인트의 응답이 늦을 때 보조 엔드포인트에도 동시에 요청해
+    먼저 도착한 응답을 사용합니다.
+    """
+    
+    def __init__(self, primary_url: str, secondary_url: str = "", rate_per_sec: float = 1.0,
+                 hedge_delay_sec: Optional[float] = None, breaker_threshold: int = 5,
+                 breaker_reset_sec: float = 30.0):
+        self._endpoints = [
+            {"url": url, "bucket": _TokenBucket(rate_per_sec),
+             "breaker": _CircuitBreaker(breaker_threshold, breaker_reset_sec)}
+            for url in (primary_url, secondary_url) if url
+        ]
+        self._hedge_delay_sec = hedge_delay_sec if len(self._endpoints) > 1 else None
+        self._http: Optional[httpx.Client] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+    
+    def _get_http(self) -> httpx.Client:
+        with self._lock:
+            if self._http is None:
+                self._http = httpx.Client(
+                    headers={"User-Agent": "MCP-Photo-Location-Server/1.0"}  # Nominatim 요구사항
+                )
+            return self._http
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="geocode-hedge")
+            return self._executor
+    
+    def status(self) -> List[Dict[str, Any]]:
+        """엔드포인트별 서킷 브레이커 상태와 현재 요청 속도."""
+        return [
+            {"url": endpoint["url"], "breaker": endpoint["breaker"].state,
+             "rate_per_sec": round(endpoint["bucket"].rate, 3)}
+            for endpoint in self._endpoints
+        ]
+    
+    def _request(self, endpoint: Dict[str, Any], latitude: float, longitude: float,
+                 deadline: float) -> Dict[str, Any]:
+        if not endpoint["breaker"].allow():
+            raise _GeocodeUnavailable("circuit open")
+        if not endpoint["bucket"].acquire(deadline - time.monotonic()):
+            # 시간 안에 요청 차례가 오지 않은 것은 엔드포인트 장애가 아니므로 실패로 집계하지 않음
+            endpoint["breaker"].release_probe()
+            raise _GeocodeUnavailable("rate limited")
+        params = {
+            "lat": latitude,
+            "lon": longitude,
+            "format": "json",
+            "addressdetails": 1,
+            "accept-language": "ko"  # 한국어 주소
+        }
+        try:
+            response = self._get_http().get(
+                endpoint["url"], params=params, timeout=max(deadline - time.monotonic(), 0.001)
+            )
+        except httpx.HTTPError as e:
+            endpoint["breaker"].record_failure()
+            raise _GeocodeUnavailable(str(e))
+        if response.status_code in (429, 503):
+            retry_after = response.headers.get("Retry-After")
+            endpoint["bucket"].penalize(float(retry_after) if retry_after and retry_after.isdigit() else None)
+        if response.status_code >= 500 or response.status_code == 429:
+            endpoint["breaker"].record_failure()
+            raise _GeocodeUnavailable(f"HTTP {response.status_code}")
+        endpoint["breaker"].record_success()
+        endpoint["bucket"].reward()
+        response.raise_for_status()
+        return response.json()
+    
+    def reverse(self, latitude: float, longitude: float, timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        사용 가능한 엔드포인트로 역지오코딩 응답(JSON)을 받아옵니다.
+        모든 엔드포인트가 차단되어 있으면 네트워크 요청 없이 즉시 None을 반환합니다.
+        """
+        deadline = time.monotonic() + timeout
+        endpoints = [e for e in self._endpoints if e["breaker"].state != "open"]
+        if not endpoints:
+            return None
+        if self._hedge_delay_sec is None or len(endpoints) < 2:
+            # 순차 시도: 기본 엔드포인트가 실패하면 남은 시간 안에서 보조 엔드포인트로 우회
+            for endpoint in endpoints:
+                if time.monotonic() >= deadline:
+                    break
+                try:
+                    return self._request(endpoint, latitude, longitude, deadline)
+                except _GeocodeUnavailable:
+                    continue
+                except Exception:
+                    return None
+            return None
+        
+        # 헤지 요청: 기본 엔드포인트가 hedge_delay 안에 응답하지 않으면 보조 엔드포인트에도 요청
+        executor = self._get_executor()
+        pending = {executor.submit(self._request, endpoints[0], latitude, longitude, deadline)}
+        done, pending = wait(pending, timeout=min(self._hedge_delay_sec, timeout))
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+        pending.add(executor.submit(self._request, endpoints[1], latitude, longitude, deadline))
+        while pending:
+            done, pending = wait(pending, timeout=max(deadline - time.monotonic(), 0),
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+        return None
+
 
+_geocoding_client = _GeocodingClient(
+    GEOCODER_URL,
+    GEOCODER_SECONDARY_URL,
+    rate_per_sec=GEOCODER_RATE_PER_SEC,
+    hedge_delay_sec=float(GEOCODER_HEDGE_DELAY_MS) / 1000.0 if GEOCODER_HEDGE_DELAY_MS else None,
+    breaker_threshold=GEOCODER_BREAKER_THRESHOLD,
+    breaker_reset_sec=GEOCODER_BREAKER_RESET_SEC
+)
 
-def reverse_geocode(latitude: float, longitude: float) -> Optional[str]:
+
+def reverse_geocode(latitude: float, longitude: float, timeout: float = 5.0) -> Optional[str]:
     """
     위도/경도 좌표를 주소로 변환합니다 (역지오코딩).
-    OpenStreetMap Nominatim API를 사용합니다.
+    OpenStreetMap Nominatim API를 사용합니다 (_GeocodingClient를 통해 속도 제한, 서킷 브레이커, 헤지 요청 적용).
     
     Args:
         latitude: 위도
         longitude: 경도
+        timeout: 요청 제한 시간 (초, 속도 제한 대기 시간 포함)
         
     Returns:
         주소 문자열 또는 None (오류 시)
     """
     try:
-        # Nominatim API 호출 (무료, API 키 불필요)
-        url = "https://nominatim.openstreetmap.org/reverse"
-        params = {
-            "lat": latitude,
-            "lon": longitude,
-            "format": "json",
-            "addressdetails": 1,
-            "accept-language": "ko"  # 한국어 주소
-        }
-        headers = {
-            "User-Agent": "MCP-Photo-Location-Server/1.0"  # Nominatim 요구사항
-        }
+        data = _geocoding_client.reverse(latitude, longitude, timeout)
+        if data is None:
+            return None
         
-        with httpx.Client(timeout=5.0) as client:
-            response = client.get(url, params=params, headers=headers)
-            response.raise_for_status()
-            data = response.json()
+        if "address" in data:
+            address = data["address"]
+            # 주소 구성 요소 추출
+            address_parts = []
             
-            if "address" in data:
-                address = data["address"]
-                # 주소 구성 요소 추출
-                address_parts = []
-                
-                # 한국 주소 형식
-                if "road" in address:
-                    address_parts.append(address["road"])
-                if "building" in address:
-                    address_parts.append(address["building"])
-                if "neighbourhood" in address or "suburb" in address:
-                    addr = address.get("neighbourhood") or address.get("suburb")
-                    if addr:
-                        address_parts.append(addr)
-                if "city" in address or "town" in address or "village" in address:
-                    addr = address.get("city") or address.get("town") or address.get("village")
-                    if addr:
-                        address_parts.append(addr)
-                if "state" in address or "province" in address:
-                    addr = address.get("state") or address.get("province")
-                    if addr:
-                        address_parts.append(addr)
-                if "country" in address:
-                    address_parts.append(address["country"])
-                
-                if address_parts:
-                    return ", ".join(address_parts)
-                else:
-                    # 주소 구성 요소가 없으면 display_name 사용
-                    return data.get("display_name", None)
-            
-            return data.get("display_name", None)
+            # 한국 주소 형식
+            if "road" in address:
+                address_parts.append(address["road"])
+            if "building" in address:
+                address_parts.append(address["building"])
+            if "neighbourhood" in address or "suburb" in address:
+                addr = address.get("neighbourhood") or address.get("suburb")
+                if addr:
+                    address_parts.append(addr)
+            if "city" in address or "town" in address or "village" in address:
+                addr = address.get("city") or address.get("town") or address.get("village")
+                if addr:
+                    address_parts.append(addr)
+            if "state" in address or "province" in address:
+                addr = address.get("state") or address.get("province")
+                if addr:
+                    address_parts.append(addr)
+            if "country" in address:
+                address_parts.append(address["country"])
             
+            if address_parts:
+                return ", ".join(address_parts)
+            else:
+                # 주소 구성 요소가 없으면 display_name 사용
+                return data.get("display_name", None)
+        
+        return data.get("display_name", None)
+        
     except Exception as e:
         # 오류 발생 시 None 반환 (주소 없이도 동작하도록)
         return None
 
 
+# 주소 해석 모드
+# - "sync": 사진마다 역지오코딩이 끝날 때까지 기다린 뒤 주소를 포함해 반환 (기본값)
+# - "deferred": 좌표만 즉시 반환하고 주소는 백그라운드에서 해석 (address_handle 제공)
+# - "none": 주소 해석을 하지 않음
+ADDRESS_MODES = ("sync", "deferred", "none")
+
+
+class _AddressResolver:
+    """
+    백그라운드 워커가 역지오코딩을 순차적으로 처리하는 지연 주소 해석기입니다.
+    
+    좌표마다 불투명한 핸들(address handle)을 발급하고 주소를 채워 넣습니다.
+    요청 속도는 역지오코딩 클라이언트의 토큰 버킷(GEOCODER_RATE_PER_SEC)이 제한합니다.
+    같은 좌표는 같은 핸들을 공유하므로 중복 요청이 발생하지 않습니다.
+    """
+    
+    def __init__(self, max_entries: int = 100000):
+        self._max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._pending: "queue.Queue[str]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self.version = 0
+    
+    @staticmethod
+    def make_handle(latitude: float, longitude: float) -> str:
+        """좌표로부터 주소 핸들을 생성합니다 (소수점 6자리, 약 10cm 단위로 동일 취급)."""
+        key = f"{latitude:.6f},{longitude:.6f}"
+        return "addr_" + hashlib.sha1(key.encode("ascii")).hexdigest()[:16]
+    
+    def submit(self, latitude: float, longitude: float) -> str:
+        """좌표의 주소 해석을 예약하고 핸들을 즉시 반환합니다."""
+        handle = self.make_handle(latitude, longitude)
+        with self._lock:
+            if handle in self._entries:
+                entry = self._entries[handle]
+                self._entries.move_to_end(handle)
+                entry["waiters"] = entry.get("waiters", 0) + 1
+                if entry["status"] == "failed":
+                    # 지오코더 장애 중 실패한 좌표는 다시 요청될 때 재시도
+                    entry["status"] = "pending"
+                    self._pending.put(handle)
+            else:
+                self._entries[handle] = {
+                    "status": "pending",
+                    "latitude": latitude,
+                    "longitude": longitude,
+                    "waiters": 1
+                }
+                self._pending.put(handle)
+                self._evict_locked()
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name="address-resolver", daemon=True
+                )
+                self._worker.start()
+        return handle
+    
+    def release(self, handles: List[str]) -> None:
+        """
+        취소된 호출이 예약한 핸들을 반납합니다.
+        더 이상 기다리는 호출이 없고 아직 해석 전인 핸들은 대기열에서 제외되어 요청되지 않습니다.
+        """
+        with self._lock:
+            for handle in handles:
+                entry = self._entries.get(handle)
+                if entry is None:
+                    continue
+                entry["waiters"] = max(entry.get("waiters", 1) - 1, 0)
+                if entry["waiters"] == 0 and entry["status"] == "pending":
+                    del self._entries[handle]
+    
+    def record(self, latitude: float, longitude: float, address: str) -> None:
+        """다른 경로(sync 모드 등)로 해석한 주소를 기록하여 같은 좌표의 재요청을 막습니다."""
+        handle = self.make_handle(latitude, longitude)
+        with self._lock:
+            entry = self._entries.setdefault(handle, {"latitude": latitude, "longitude": longitude, "waiters": 0})
+            entry["status"] = "resolved"
+            entry["address"] = address
+            self._entries.move_to_end(handle)
+            self._evict_locked()
+            self.version += 1
+    
+    def export(self) -> List[list]:
+        """스냅샷용: 해석이 끝난 좌표를 [위도, 경도, 주소] 목록으로 반환합니다."""
+        with self._lock:
+            return [[entry["latitude"], entry["longitude"], entry["address"]]
+                    for entry in self._entries.values() if entry["status"] == "resolved"]
+    
+    def lookup(self, latitude: float, longitude: float) -> Optional[str]:
+        """좌표의 주소가 이미 해석되어 있으면 반환합니다 (네트워크 요청 없음)."""
+        with self._lock:
+            entry = self._entries.get(self.make_handle(latitude, longitude))
+            if entry is not None and entry["status"] == "resolved":
+                return entry["address"]
+        return None
+    
+    def get(self, handle: str) -> Optional[Dict[str, Any]]:
+        """핸들의 현재 상태를 반환합니다. 알 수 없는 핸들이면 None."""
+        with self._lock:
+            entry = self._entries.get(handle)
+            return dict(entry) if entry is not None else None
+    
+    def _evict_locked(self) -> None:
+        # 해석이 끝난 오래된 항목부터 제거하여 메모리 사용량을 제한
+        if len(self._entries) <= self._max_entries:
+            return
+        for handle in list(self._entries):
+            if len(self._entries) <= self._max_entries:
+                break
+            if self._entries[handle]["status"] != "pending":
+                del self._entries[handle]
+    
+    def _run(self) -> None:
+        while True:
+            handle = self._pending.get()
+            with self._lock:
+                entry = self._entries.get(handle)
+                if entry is None or entry["status"] != "pending":
+                    continue
+                latitude, longitude = entry["latitude"], entry["longitude"]
+            
+            address = reverse_geocode(latitude, longitude)
+            with self._lock:
+                entry = self._entries.get(handle)
+                if entry is not None:
+                    entry["status"] = "resolved" if address else "failed"
+                    if address:
+                        entry["address"] = address
+                        self.version += 1
+
+
+_address_resolver = _AddressResolver()
+
+
+def _attach_address(result_item: Dict[str, Any], gps_data: Dict[str, Any], address_mode: str,
+                    control: Optional["_ScanControl"] = None) -> None:
+    """
+    address_mode에 따라 결과 항목에 주소(sync) 또는 주소 핸들(deferred)을 추가합니다.
+    control이 주어지면 진행 상황(주소 변환 개수)과 예약한 핸들을 기록합니다.
+    """
+    if address_mode == "none" or "latitude" not in gps_data or "longitude" not in gps_data:
+        return
+    if address_mode == "deferred":
+        handle = _address_resolver.submit(gps_data["latitude"], gps_data["longitude"])
+        result_item["address_handle"] = handle
+        if control is not None:
+            control.address_handles.append(handle)
+        return
+    address = _address_resolver.lookup(gps_data["latitude"], gps_data["longitude"])
+    if address:
+        result_item["address"] = address
+        return
+    timeout = 5.0
+    if control is not None and control.deadline is not None:
+        timeout = min(timeout, control.remaining())
+        if timeout <= 0:
+            # 시간 예산을 다 쓴 경우 주소는 백그라운드 해석으로 넘기고 핸들만 반환
+            _attach_address(result_item, gps_data, "deferred", control)
+            return
+    address = reverse_geocode(gps_data["latitude"], gps_data["longitude"], timeout)
+    if address:
+        result_item["address"] = address
+        _address_resolver.record(gps_data["latitude"], gps_data["longitude"], address)
+    elif control is not None and control.expired():
+        # 남은 예산 안에 응답이 오지 않았으면 같은 방식으로 핸들을 남겨 나중에 조회하게 함
+        _attach_address(result_item, gps_data, "deferred", control)
+        return
+    elif control is not None:
+        control.address_failures += 1
+    if control is not None:
+        control.geocoded += 1
+
+
 def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     """
     두 지점 간의 거리를 계산합니다 (Haversine 공식 사용).
@@ -119,6 +576,708 @@ def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> fl
     return distance
 
 
+# 정보 추출을 지원하는 이미지 형식
+SUPPORTED_IMAGE_FORMATS = {'.jpg', '.jpeg', '.tiff', '.tif', '.png', '.heic', '.heif', '.webp'}
+
+# 비정상적으로 큰 메타데이터 블록은 읽지 않음 (손상되었거나 악의적인 파일 방어)
+MAX_METADATA_BYTES = 16 * 1024 * 1024
+
+
+# ---------------------------------------------------------------------------
+# 컨테이너별 EXIF 위치 탐색기
+#
+# 픽셀 데이터를 디코딩하지 않고 헤더/청크 구조만 따라가며 EXIF(TIFF) 바이트를 찾습니다.
+# 탐색기는 입출력과 분리된 제너레이터로, 다음 요청을 yield 합니다.
+#   ("read", n)      -> n 바이트를 돌려받음 (파일 끝이면 더 짧을 수 있음)
+#   ("skip", n)      -> 현재 위치에서 n 바이트 건너뜀
+#   ("seek", offset) -> 파일 처음 기준 offset 위치로 이동
+# EXIF를 찾으면 TIFF 헤더(II*/MM*)로 시작하는 바이트를, 없으면 None을 return 합니다.
+# ---------------------------------------------------------------------------
+
+def _strip_exif_prefix(data: bytes) -> bytes:
+    """"Exif\\0\\0" 접두사가 있으면 제거하여 TIFF 헤더부터 시작하도록 합니다."""
+    if data.startswith(b"Exif\x00\x00"):
+        return data[6:]
+    return data
+
+
+def _locate_exif_png():
+    """PNG 청크를 순회하며 eXIf 청크를 찾습니다 (IDAT 등 픽셀 청크는 건너뜀)."""
+    signature = yield ("read", 8)
+    if signature != b"\x89PNG\r\n\x1a\n":
+        return None
+    while True:
+        header = yield ("read", 8)
+        if len(header) < 8:
+            return None
+        length = int.from_bytes(header[0:4], "big")
+        chunk_type = header[4:8]
+        if chunk_type == b"eXIf":
+            if length > MAX_METADATA_BYTES:
+                return None
+            data = yield ("read", length)
+            return _strip_exif_prefix(data) if len(data) == length else None
+        if chunk_type == b"IEND":
+            return None
+        # 청크 데이터 + CRC(4바이트) 건너뛰기
+        yield ("skip", length + 4)
+
+
+def _locate_exif_webp():
+    """RIFF 청크를 순회하며 WebP의 EXIF 청크를 찾습니다."""
+    header = yield ("read", 12)
+    if len(header) < 12 or header[0:4] != b"RIFF" or header[8:12] != b"WEBP":
+        return None
+    while True:
+        chunk_header = yield ("read", 8)
+        if len(chunk_header) < 8:
+            return None
+        fourcc = chunk_header[0:4]
+        size = int.from_bytes(chunk_header[4:8], "little")
+        padded = size + (size & 1)
+        if fourcc == b"VP8X":
+            flags = yield ("read", padded)
+            # VP8X 플래그에 EXIF 비트(0x08)가 없으면 더 볼 필요 없음
+            if len(flags) < 1 or not flags[0] & 0x08:
+                return None
+            continue
+        if fourcc == b"EXIF":
+            if size > MAX_METADATA_BYTES:
+                return None
+            data = yield ("read", size)
+            return _strip_exif_prefix(data) if len(data) == size else None
+        yield ("skip", padded)
+
+
+def _iter_isobmff_boxes(buf: bytes, start: int, end: int):
+    """메모리에 읽어 둔 ISOBMFF 영역에서 (박스 타입, 내용 시작, 내용 끝)을 순회합니다."""
+    pos = start
+    while pos + 8 <= end:
+        size = int.from_bytes(buf[pos:pos + 4], "big")
+        box_type = buf[pos + 4:pos + 8]
+        header_size = 8
+        if size == 1:
+            if pos + 16 > end:
+                return
+            size = int.from_bytes(buf[pos + 8:pos + 16], "big")
+            header_size = 16
+        elif size == 0:
+            size = end - pos
+        if size < header_size or pos + size > end:
+            return
+        yield box_type, pos + header_size, pos + size
+        pos += size
+
+
+def _find_heif_exif_extents(meta: bytes):
+    """
+    HEIF meta 박스 내용에서 Exif 아이템의 위치 정보를 찾습니다.
+    
+    Returns:
+        (construction_method, [(offset, length), ...], idat 바이트) 또는 None
+    """
+    # meta는 FullBox: version(1) + flags(3)
+    children = {}
+    for box_type, start, end in _iter_isobmff_boxes(meta, 4, len(meta)):
+        children.setdefault(box_type, (start, end))
+    if b"iinf" not in children or b"iloc" not in children:
+        return None
+    
+    # iinf: Exif 타입 아이템의 ID 찾기
+    start, end = children[b"iinf"]
+    version = meta[start]
+    pos = start + 4
+    pos += 2 if version == 0 else 4
+    exif_item_id = None
+    for box_type, infe_start, infe_end in _iter_isobmff_boxes(meta, pos, end):
+        if box_type != b"infe" or infe_end - infe_start < 4:
+            continue
+        infe_version = meta[infe_start]
+        if infe_version < 2:
+            continue
+        p = infe_start + 4
+        id_size = 2 if infe_version == 2 else 4
+        item_id = int.from_bytes(meta[p:p + id_size], "big")
+        p += id_size + 2  # item_protection_index
+        if meta[p:p + 4] == b"Exif":
+            exif_item_id = item_id
+            break
+    if exif_item_id is None:
+        return None
+    
+    # iloc: Exif 아이템의 extent 목록 찾기
+    start, end = children[b"iloc"]
+    version = meta[start]
+    pos = start + 4
+    offset_size = meta[pos] >> 4
+    length_size = meta[pos] & 0x0F
+    base_offset_size = meta[pos + 1] >> 4
+    index_size = meta[pos + 1] & 0x0F if version in (1, 2) else 0
+    pos += 2
+    count_size = 2 if version < 2 else 4
+    item_count = int.from_bytes(meta[pos:pos + count_size], "big")
+    pos += count_size
+    
+    def read_uint(size: int) -> int:
+        nonlocal pos
+        value = int.from_bytes(meta[pos:pos + size], "big") if size else 0
+        pos += size
+        return value
+    
+    for _ in range(item_count):
+        item_id = read_uint(count_size)
+        construction_method = 0
+        if version in (1, 2):
+            construction_method = read_uint(2) & 0x0F
+        read_uint(2)  # data_reference_index
+        base_offset = read_uint(base_offset_size)
+        extent_count = read_uint(2)
+        extents = []
+        for _ in range(extent_count):
+            if index_size:
+                read_uint(index_size)
+            extent_offset = read_uint(offset_size)
+            extent_length = read_uint(length_size)
+            extents.append((base_offset + extent_offset, extent_length))
+        if pos > end:
+            return None
+        if item_id == exif_item_id:
+            idat = b""
+            if construction_method == 1 and b"idat" in children:
+                idat_start, idat_end = children[b"idat"]
+                idat = meta[idat_start:idat_end]
+            return construction_method, extents, idat
+    return None
+
+
+def _locate_exif_heif():
+    """
+    ISOBMFF(HEIC/HEIF) 최상위 박스를 순회하여 meta 박스만 읽고,
+    iinf/iloc로 Exif 아이템의 위치를 찾아 해당 바이트만 읽습니다 (mdat은 건너뜀).
+    """
+    while True:
+        header = yield ("read", 8)
+        if len(header) < 8:
+            return None
+        size = int.from_bytes(header[0:4], "big")
+        box_type = header[4:8]
+        header_size = 8
+        if size == 1:
+            large = yield ("read", 8)
+            if len(large) < 8:
+                return None
+            size = int.from_bytes(large, "big")
+            header_size = 16
+        elif size == 0:
+            # 파일 끝까지 이어지는 박스 (보통 mdat) - 이후에는 meta가 없음
+            if box_type != b"meta":
+                return None
+        if size and size < header_size:
+            return None
+        
+        if box_type == b"meta":
+            if size == 0 or size - header_size > MAX_METADATA_BYTES:
+                return None
+            meta = yield ("read", size - header_size)
+            if len(meta) < size - header_size:
+                return None
+            located = _find_heif_exif_extents(meta)
+            if located is None:
+                return None
+            construction_method, extents, idat = located
+            
+            if construction_method == 1:
+                data = b"".join(idat[offset:offset + length] for offset, length in extents)
+            elif construction_method == 0:
+                parts = []
+                for offset, length in extents:
+                    if length == 0 or length > MAX_METADATA_BYTES:
+                        return None
+                    yield ("seek", offset)
+                    part = yield ("read", length)
+                    parts.append(part)
+                data = b"".join(parts)
+            else:
+                return None
+            
+            # Exif 아이템: 4바이트 TIFF 헤더 오프셋 + (Exif\0\0) + TIFF 데이터
+            if len(data) < 4:
+                return None
+            tiff_offset = int.from_bytes(data[0:4], "big")
+            return _strip_exif_prefix(data[4 + tiff_offset:]) or None
+        
+        yield ("skip", size - header_size)
+
+
+def _select_exif_locator(head: bytes):
+    """파일 앞부분(매직 넘버)으로 컨테이너 형식을 판별하여 탐색기를 선택합니다."""
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return _locate_exif_png
+    if head[0:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return _locate_exif_webp
+    if head[4:8] == b"ftyp":
+        return _locate_exif_heif
+    return None
+
+
+def _run_exif_locator(locator, f) -> Optional[bytes]:
+    """탐색 가능한(seekable) 파일 객체로 탐색기를 구동합니다."""
+    try:
+        request = next(locator)
+        while True:
+            op, arg = request
+            if op == "read":
+                request = locator.send(f.read(arg))
+            elif op == "skip":
+                f.seek(arg, os.SEEK_CUR)
+                request = locator.send(None)
+            else:
+                f.seek(arg)
+                request = locator.send(None)
+    except StopIteration as stop:
+        return stop.value
+
+
+def _locate_exif_jpeg():
+    """JPEG 마커 세그먼트를 순회하며 APP1 Exif 세그먼트를 찾습니다 (SOS 이후 이미지 데이터는 읽지 않음)."""
+    soi = yield ("read", 2)
+    if soi != b"\xff\xd8":
+        return None
+    while True:
+        marker = yield ("read", 2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        # 마커 앞의 채움 바이트(0xFF) 건너뛰기
+        while marker[1] == 0xFF:
+            next_byte = yield ("read", 1)
+            if not next_byte:
+                return None
+            marker = b"\xff" + next_byte
+        code = marker[1]
+        if code in (0xD9, 0xDA):
+            # EOI 또는 SOS(이미지 데이터 시작) - 이후에는 Exif 세그먼트가 없음
+            return None
+        if 0xD0 <= code <= 0xD7 or code == 0x01:
+            # 길이 필드가 없는 단독 마커
+            continue
+        length_bytes = yield ("read", 2)
+        if len(length_bytes) < 2:
+            return None
+        length = int.from_bytes(length_bytes, "big") - 2
+        if length < 0:
+            return None
+        if code == 0xE1:
+            data = yield ("read", length)
+            if len(data) < length:
+                return None
+            if data.startswith(b"Exif\x00\x00"):
+                return data[6:]
+            # XMP 등 다른 APP1 세그먼트
+            continue
+        yield ("skip", length)
+
+
+def _locate_exif_tiff():
+    """
+    TIFF는 파일 자체가 EXIF(TIFF) 구조이고 IFD가 파일 어디에나 있을 수 있으므로,
+    앞부분 최대 MAX_METADATA_BYTES를 그대로 EXIF 바이트로 사용합니다.
+    """
+    data = yield ("read", MAX_METADATA_BYTES)
+    return data if data[:4] in (b"II*\x00", b"MM\x00*") else None
+
+
+def _select_stream_locator(head: bytes):
+    """스트림 앞부분으로 (컨테이너 이름, 탐색기)를 선택합니다. JPEG/TIFF도 탐색기로 처리합니다."""
+    if head.startswith(b"\xff\xd8"):
+        return "jpeg", _locate_exif_jpeg
+    if head[:4] in (b"II*\x00", b"MM\x00*"):
+        return "tiff", _locate_exif_tiff
+    locator = _select_exif_locator(head)
+    names = {_locate_exif_png: "png", _locate_exif_webp: "webp", _locate_exif_heif: "heif"}
+    return (names[locator], locator) if locator is not None else (None, None)
+
+
+class _StreamExifLocator:
+    """
+    앞으로만 읽을 수 있는 바이트 스트림(HTTP 업로드 본문)으로 EXIF 탐색기를 구동합니다.
+    
+    청크가 도착하는 대로 feed()하면 탐색기가 요청한 바이트만 보관하고, 건너뛰는 영역(픽셀 데이터)과
+    탐색이 끝난 뒤의 바이트는 버퍼에 담지 않고 버립니다. 뒤로 이동(seek)은 지원하지 않습니다.
+    """
+    
+    def __init__(self):
+        self._buffer = bytearray()
+        self._position = 0
+        self._skip = 0
+        self._locator = None
+        self._request = None
+        self.container: Optional[str] = None
+        self.done = False
+        self.exif_bytes: Optional[bytes] = None
+        self.total_bytes = 0
+        self.bytes_read_at_done: Optional[int] = None
+    
+    def feed(self, chunk) -> bool:
+        """청크를 전달합니다. EXIF 탐색이 끝났으면 True (이후 청크는 크기만 셉니다)."""
+        self.total_bytes += len(chunk)
+        if self.done:
+            return True
+        if self._skip:
+            dropped = min(self._skip, len(chunk))
+            self._skip -= dropped
+            chunk = chunk[dropped:]
+        self._buffer += chunk
+        self._advance(eof=False)
+        return self.done
+    
+    def finish(self) -> None:
+        """스트림 끝: 남은 요청을 짧은 데이터로 마무리합니다."""
+        if not self.done:
+            self._advance(eof=True)
+        if not self.done:
+            self._complete(None)
+    
+    def _complete(self, exif_bytes: Optional[bytes]) -> None:
+        self.done = True
+        self.exif_bytes = exif_bytes or None
+        self.bytes_read_at_done = self.total_bytes
+        self._buffer = bytearray()
+    
+    def _advance(self, eof: bool) -> None:
+        if self._locator is None:
+            if len(self._buffer) < 16 and not eof:
+                return
+            self.container, factory = _select_stream_locator(bytes(self._buffer[:16]))
+            if factory is None:
+                self._complete(None)
+                return
+            self._locator = factory()
+            self._request = next(self._locator)
+        
+        while not self.done:
+            op, arg = self._request
+            if op == "seek":
+                if arg < self._position:
+                    self._complete(None)
+                    return
+                op, arg = "skip", arg - self._position
+            if op == "skip":
+                dropped = min(arg, len(self._buffer))
+                del self._buffer[:dropped]
+                self._skip = arg - dropped
+                self._position += arg
+                value = None
+            else:
+                if len(self._buffer) < arg and not eof:
+                    return
+                value = bytes(self._buffer[:arg])
+                del self._buffer[:arg]
+                self._position += len(value)
+            try:
+                self._request = self._locator.send(value)
+            except StopIteration as stop:
+                self._complete(stop.value)
+            except Exception:
+                self._complete(None)
+
+
+def _load_exif_dict(image_path: str) -> Dict[str, Any]:
+    """
+    이미지 파일의 EXIF를 piexif 딕셔너리 형태로 읽습니다.
+    
+    PNG(eXIf), WebP(EXIF 청크), HEIC/HEIF(meta/iloc)는 메타데이터 영역만 읽어
+    EXIF 바이트를 찾은 뒤 piexif로 파싱합니다. JPEG/TIFF는 piexif가 직접 처리합니다.
+    """
+    with open(image_path, "rb") as f:
+        head = f.read(16)
+        locator = _select_exif_locator(head)
+        if locator is not None:
+            f.seek(0)
+            exif_bytes = _run_exif_locator(locator(), f)
+    
+    if locator is None:
+        return piexif.load(image_path)
+    if not exif_bytes:
+        return {"0th": {}, "Exif": {}, "GPS": {}, "Interop": {}, "1st": {}, "thumbnail": None}
+    return piexif.load(exif_bytes)
+
+
+class _ResultCache:
+    """
+    디렉토리 도구 결과를 보관하는 프로세스 내 LRU 캐시입니다.
+    
+    키는 도구 이름 + 인자 + 디렉토리 지문(fingerprint)으로 구성되므로,
+    디렉토리 내용이 바뀌면 자동으로 다른 키가 되어 이전 결과가 재사용되지 않습니다.
+    항목 수와 전체 결과 크기(바이트) 두 가지 상한으로 메모리 사용량을 제한합니다.
+    """
+    
+    def __init__(self, max_entries: int = 64, max_bytes: int = 64 * 1024 * 1024):
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._origins: Dict[str, list] = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.version = 0
+    
+    @staticmethod
+    def make_key(tool_name: str, dir_path: Path, arguments: Dict[str, Any],
+                 include=None, exclude=None, max_depth: Optional[int] = 0) -> str:
+        """도구 인자와 디렉토리 지문으로 캐시 키를 만듭니다."""
+        args = json.dumps(arguments, sort_keys=True, ensure_ascii=False)
+        fingerprint = _recent_directory_fingerprint(dir_path, include, exclude, max_depth)
+        return f"{tool_name}|{dir_path.resolve()}|{args}|{fingerprint}"
+    
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+    
+    def put(self, key: str, value: str, origin: Optional[list] = None) -> None:
+        """
+        결과를 저장합니다. origin([디렉토리, include, exclude, 최대 깊이])을 주면 스냅샷에 포함되어
+        재시작 후 복원되고, 복원 시 지문을 다시 계산해 검증할 수 있습니다.
+        """
+        size = len(value)
+        if size > self._max_bytes or self._max_entries <= 0:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total_bytes -= len(old)
+            self._entries[key] = value
+            self._total_bytes += size
+            if origin is not None:
+                self._origins[key] = origin
+            self.version += 1
+            # 가장 오래 사용되지 않은 항목부터 제거
+            while len(self._entries) > self._max_entries or self._total_bytes > self._max_bytes:
+                evicted_key, evicted = self._entries.popitem(last=False)
+                self._origins.pop(evicted_key, None)
+                self._total_bytes -= len(evicted)
+    
+    def discard(self, key: str) -> None:
+        with self._lock:
+            value = self._entries.pop(key, None)
+            if value is not None:
+                self._total_bytes -= len(value)
+                self._origins.pop(key, None)
+                self.version += 1
+    
+    def export(self) -> List[list]:
+        """스냅샷용: origin이 있는 항목을 오래된 순서로 [키, 결과, origin] 목록으로 반환합니다."""
+        with self._lock:
+            return [[key, value, self._origins[key]] for key, value in self._entries.items()
+                    if key in self._origins]
+
+
+def _directory_fingerprint(dir_path: Path, include=None, exclude=None, max_depth: Optional[int] = 0) -> str:
+    """
+    디렉토리(트리) 내용을 값싸게 요약한 지문을 계산합니다.
+    
+    파일을 열지 않고 디렉토리 mtime과 스캔 대상 파일들의 (상대 경로, 크기, mtime)만
+    해시하므로, 파일 추가/삭제/수정을 감지하면서도 EXIF 파싱보다 훨씬 빠릅니다.
+    스캔과 동일한 include/exclude 패턴과 최대 깊이를 적용합니다.
+    """
+    options = (tuple(include or ()), tuple(exclude or ()), max_depth)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(os.stat(dir_path).st_mtime_ns).encode("ascii"))
+    entries = []
+    stack = [(str(dir_path), "", 0)]
+    while stack:
+        files, subdirs = _list_scan_entries(*stack.pop(), options)
+        stack.extend(subdirs)
+        for path, relative_path in files:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append(f"{relative_path}\0{st.st_size}\0{st.st_mtime_ns}")
+    entries.sort()
+    digest.update(str(len(entries)).encode("ascii"))
+    for item in entries:
+        digest.update(item.encode("utf-8", "surrogateescape"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+
+# 계산한 지문을 재사용하는 시간(초). 0이면 매 호출마다 트리 전체를 다시 확인
+FINGERPRINT_TTL_SEC = float(os.getenv("FINGERPRINT_TTL_SEC", "2"))
+_FINGERPRINT_MEMO_SIZE = 256
+_fingerprint_memo: "OrderedDict[tuple, tuple]" = OrderedDict()
+_fingerprint_memo_lock = threading.Lock()
+
+
+def _recent_directory_fingerprint(dir_path: Path, include=None, exclude=None, max_depth: Optional[int] = 0) -> str:
+    """
+    최근 FINGERPRINT_TTL_SEC 이내에 계산한 지문이 있으면 트리를 다시 순회하지 않고 재사용합니다.
+    
+    페이지를 연달아 요청하거나 캐시 미스 직후 스캔하는 경우 매번 전체 트리를 stat하지 않기 위함입니다.
+    최상위 디렉토리 mtime은 매번 확인하므로 최상위의 파일 추가/삭제는 즉시 반영되고,
+    하위 디렉토리 변경이나 기존 파일 수정은 최대 TTL만큼 늦게 반영될 수 있습니다.
+    """
+    if FINGERPRINT_TTL_SEC <= 0:
+        return _directory_fingerprint(dir_path, include, exclude, max_depth)
+    memo_key = (str(dir_path.resolve()), tuple(include or ()), tuple(exclude or ()), max_depth)
+    root_mtime = os.stat(dir_path).st_mtime_ns
+    now = time.monotonic()
+    with _fingerprint_memo_lock:
+        memo = _fingerprint_memo.get(memo_key)
+        if memo is not None and memo[0] > now and memo[1] == root_mtime:
+            _fingerprint_memo.move_to_end(memo_key)
+            return memo[2]
+    fingerprint = _directory_fingerprint(dir_path, include, exclude, max_depth)
+    with _fingerprint_memo_lock:
+        _fingerprint_memo[memo_key] = (now + FINGERPRINT_TTL_SEC, root_mtime, fingerprint)
+        _fingerprint_memo.move_to_end(memo_key)
+        while len(_fingerprint_memo) > _FINGERPRINT_MEMO_SIZE:
+            _fingerprint_memo.popitem(last=False)
+    return fingerprint
+
+_result_cache = _ResultCache(
+    max_entries=int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "64")),
+    max_bytes=int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+)
+
+
+# ---------------------------------------------------------------------------
+# 스냅샷 웜업
+#
+# 해석된 주소와 결과 캐시는 메모리에만 있어서 재배포/재시작 직후에는 모든 요청이
+# 처음부터 다시 계산(EXIF 파싱 + 초당 1회 역지오코딩)됩니다. 주기적으로 이 상태를
+# 파일에 체크포인트해 두고, 시작 시 백그라운드에서 불러와 바로 응답에 사용합니다.
+# 복원한 결과 캐시 항목은 디렉토리 지문을 다시 계산해 검증하고, 그 사이 바뀐
+# 디렉토리의 항목은 제거합니다 (검증 전에 들어온 요청도 캐시 키에 현재 지문이
+# 포함되므로 오래된 결과를 받지 않습니다).
+# ---------------------------------------------------------------------------
+
+# 스냅샷 파일 경로와 체크포인트 주기(초, 0이면 비활성화)
+SNAPSHOT_PATH = Path(os.getenv(
+    "SNAPSHOT_PATH", str(Path.home() / ".mcp-photo-location" / "snapshot.json.gz")
+))
+SNAPSHOT_INTERVAL_SEC = float(os.getenv("SNAPSHOT_INTERVAL_SEC", "300"))
+SNAPSHOT_FORMAT_VERSION = 1
+
+
+class _SnapshotManager:
+    """주소 해석 결과와 결과 캐시를 주기적으로 파일에 저장하고 시작 시 복원합니다."""
+    
+    def __init__(self, path: Path, interval_sec: float):
+        self._path = path
+        self._interval_sec = interval_sec
+        self._lock = threading.Lock()
+        self._started = False
+        self._saved_versions = (-1, -1)
+        self.state = "disabled" if interval_sec <= 0 else "idle"
+        self.restored_addresses = 0
+        self.restored_results = 0
+        self.invalidated_results = 0
+    
+    def start(self) -> None:
+        """백그라운드 스레드에서 복원 → 검증 → 주기적 체크포인트를 시작합니다 (한 번만)."""
+        with self._lock:
+            if self._started or self._interval_sec <= 0:
+                return
+            self._started = True
+        threading.Thread(target=self._run, name="snapshot", daemon=True).start()
+    
+    def status(self) -> Dict[str, Any]:
+        return {
+            "path": str(self._path),
+            "state": self.state,
+            "restored_addresses": self.restored_addresses,
+            "restored_results": self.restored_results,
+            "invalidated_results": self.invalidated_results
+        }
+    
+    def _run(self) -> None:
+        self.state = "loading"
+        restored = self.restore()
+        self._saved_versions = (_address_resolver.version, _result_cache.version)
+        self.state = "validating"
+        self.validate(restored)
+        self.state = "ready"
+        while True:
+            time.sleep(self._interval_sec)
+            self.checkpoint()
+    
+    def restore(self) -> List[list]:
+        """스냅샷을 읽어 주소와 결과 캐시에 채워 넣고, 검증할 결과 항목 목록을 반환합니다."""
+        try:
+            with gzip.open(self._path, "rt", encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            return []
+        except (OSError, EOFError, ValueError) as e:
+            print(f"스냅샷을 읽지 못했습니다 ({self._path}): {e}", file=sys.stderr)
+            return []
+        if not isinstance(snapshot, dict) or snapshot.get("version") != SNAPSHOT_FORMAT_VERSION:
+            return []
+        
+        for latitude, longitude, address in snapshot.get("addresses", []):
+            # 스냅샷 이후 새로 해석된 주소가 있으면 덮어쓰지 않음
+            if _address_resolver.lookup(latitude, longitude) is None:
+                _address_resolver.record(latitude, longitude, address)
+                self.restored_addresses += 1
+        results = snapshot.get("results", [])
+        for key, value, origin in results:
+            if _result_cache.get(key) is None:
+                _result_cache.put(key, value, origin)
+                self.restored_results += 1
+        return results
+    
+    def validate(self, results: List[list]) -> None:
+        """복원한 결과 항목의 디렉토리 지문을 다시 계산하여 바뀐 항목을 제거합니다."""
+        for key, _, origin in results:
+            try:
+                directory, include, exclude, max_depth = origin
+                fingerprint = _directory_fingerprint(Path(directory), include, exclude, max_depth)
+            except (OSError, ValueError, TypeError):
+                fingerprint = None
+            if key.rsplit("|", 1)[-1] != fingerprint:
+                _result_cache.discard(key)
+                self.invalidated_results += 1
+    
+    def checkpoint(self) -> bool:
+        """변경 사항이 있으면 스냅샷 파일을 원자적으로 교체합니다. 기록했으면 True."""
+        # 복원이 끝나기 전에 기록하면 이전 스냅샷의 내용을 잃으므로 기다리지 않고 건너뜀
+        if self.state not in ("validating", "ready"):
+            return False
+        with self._lock:
+            return self._write_locked()
+    
+    def _write_locked(self) -> bool:
+        versions = (_address_resolver.version, _result_cache.version)
+        if versions == self._saved_versions:
+            return False
+        snapshot = {
+            "version": SNAPSHOT_FORMAT_VERSION,
+            "saved_at": time.time(),
+            "addresses": _address_resolver.export(),
+            "results": _result_cache.export()
+        }
+        tmp_path = self._path.with_name(self._path.name + ".tmp")
+        try:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=1) as f:
+                f.write(json.dumps(snapshot, ensure_ascii=False).encode("utf-8"))
+                f.close()
+                raw.flush()
+                os.fsync(raw.fileno())
+            os.replace(tmp_path, self._path)
+        except OSError as e:
+            print(f"스냅샷을 저장하지 못했습니다 ({self._path}): {e}", file=sys.stderr)
+            return False
+        self._saved_versions = versions
+        return True
+
+
+_snapshot_manager = _SnapshotManager(SNAPSHOT_PATH, SNAPSHOT_INTERVAL_SEC)
+
+
 def extract_gps_from_exif(image_path: str) -> Optional[Dict[str, Any]]:
     """
     이미지 파일에서 EXIF GPS 데이터를 추출합니다.
@@ -130,84 +1289,1718 @@ def extract_gps_from_exif(image_path: str) -> Optional[Dict[str, Any]]:
         GPS 정보가 담긴 딕셔너리 (위도, 경도 등) 또는 None
     """
     try:
-        exif_dict = piexif.load(image_path)
-        
-        if "GPS" not in exif_dict or not exif_dict["GPS"]:
-            return None
-            
-        gps_data = exif_dict["GPS"]
-        
-        # GPS 위도 추출
-        if piexif.GPSIFD.GPSLatitude in gps_data and piexif.GPSIFD.GPSLatitudeRef in gps_data:
-            lat_ref = gps_data[piexif.GPSIFD.GPSLatitudeRef].decode('utf-8')
-            lat_tuple = gps_data[piexif.GPSIFD.GPSLatitude]
-            latitude = lat_tuple[0][0] / lat_tuple[0][1] + \
-                      lat_tuple[1][0] / lat_tuple[1][1] / 60.0 + \
-                      lat_tuple[2][0] / lat_tuple[2][1] / 3600.0
-            if lat_ref == 'S':
-                latitude = -latitude
-        else:
-            latitude = None
-            
-        # GPS 경도 추출
-        if piexif.GPSIFD.GPSLongitude in gps_data and piexif.GPSIFD.GPSLongitudeRef in gps_data:
-            lon_ref = gps_data[piexif.GPSIFD.GPSLongitudeRef].decode('utf-8')
-            lon_tuple = gps_data[piexif.GPSIFD.GPSLongitude]
-            longitude = lon_tuple[0][0] / lon_tuple[0][1] + \
-                       lon_tuple[1][0] / lon_tuple[1][1] / 60.0 + \
-                       lon_tuple[2][0] / lon_tuple[2][1] / 3600.0
-            if lon_ref == 'W':
-                longitude = -longitude
-        else:
-            longitude = None
-            
-        # 고도 추출 (있는 경우)
-        altitude = None
-        if piexif.GPSIFD.GPSAltitude in gps_data:
-            alt_tuple = gps_data[piexif.GPSIFD.GPSAltitude]
-            altitude = alt_tuple[0] / alt_tuple[1]
-            if piexif.GPSIFD.GPSAltitudeRef in gps_data and gps_data[piexif.GPSIFD.GPSAltitudeRef] == 1:
-                altitude = -altitude
-                
-        result = {}
-        if latitude is not None:
-            result["latitude"] = latitude
-        if longitude is not None:
-            result["longitude"] = longitude
-        if altitude is not None:
-            result["altitude"] = altitude
-            
-        return result if result else None
-        
+        return _gps_from_exif_dict(_load_exif_dict(image_path))
     except Exception as e:
         return {"error": str(e)}
 
 
-@mcp.tool()
-def get_photo_location(image_path: str) -> str:
-    """
-    사진 파일에서 GPS 위치 정보를 추출합니다.
+def _gps_from_exif_dict(exif_dict: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """piexif로 읽은 EXIF dict에서 GPS 정보(위도, 경도, 고도)를 추출합니다."""
+    if "GPS" not in exif_dict or not exif_dict["GPS"]:
+        return None
+        
+    gps_data = exif_dict["GPS"]
     
-    Args:
-        image_path: 이미지 파일의 경로
+    # GPS 위도 추출
+    if piexif.GPSIFD.GPSLatitude in gps_data and piexif.GPSIFD.GPSLatitudeRef in gps_data:
+        lat_ref = gps_data[piexif.GPSIFD.GPSLatitudeRef].decode('utf-8')
+        lat_tuple = gps_data[piexif.GPSIFD.GPSLatitude]
+        latitude = lat_tuple[0][0] / lat_tuple[0][1] + \
+                  lat_tuple[1][0] / lat_tuple[1][1] / 60.0 + \
+                  lat_tuple[2][0] / lat_tuple[2][1] / 3600.0
+        if lat_ref == 'S':
+            latitude = -latitude
+    else:
+        latitude = None
         
-    Returns:
-        JSON 형식의 위치 정보 (위도, 경도, 고도)
+    # GPS 경도 추출
+    if piexif.GPSIFD.GPSLongitude in gps_data and piexif.GPSIFD.GPSLongitudeRef in gps_data:
+        lon_ref = gps_data[piexif.GPSIFD.GPSLongitudeRef].decode('utf-8')
+        lon_tuple = gps_data[piexif.GPSIFD.GPSLongitude]
+        longitude = lon_tuple[0][0] / lon_tuple[0][1] + \
+                   lon_tuple[1][0] / lon_tuple[1][1] / 60.0 + \
+                   lon_tuple[2][0] / lon_tuple[2][1] / 3600.0
+        if lon_ref == 'W':
+            longitude = -longitude
+    else:
+        longitude = None
+        
+    # 고도 추출 (있는 경우)
+    altitude = None
+    if piexif.GPSIFD.GPSAltitude in gps_data:
+        alt_tuple = gps_data[piexif.GPSIFD.GPSAltitude]
+        altitude = alt_tuple[0] / alt_tuple[1]
+        if piexif.GPSIFD.GPSAltitudeRef in gps_data and gps_data[piexif.GPSIFD.GPSAltitudeRef] == 1:
+            altitude = -altitude
+            
+    result = {}
+    if latitude is not None:
+        result["latitude"] = latitude
+    if longitude is not None:
+        result["longitude"] = longitude
+    if altitude is not None:
+        result["altitude"] = altitude
+        
+    return result if result else None
+
+
+# 촬영 시각으로 사용할 EXIF 태그 (우선순위 순)
+_TAKEN_AT_TAGS = (
+    ("Exif", piexif.ExifIFD.DateTimeOriginal),
+    ("Exif", piexif.ExifIFD.DateTimeDigitized),
+    ("0th", piexif.ImageIFD.DateTime),
+)
+
+
+def _parse_exif_datetime(value) -> Optional[float]:
     """
-    path = Path(image_path)
-    
-    if not path.exists():
-        return json.dumps({"error": f"파일을 찾을 수 없습니다: {image_path}"}, ensure_ascii=False)
+    EXIF 날짜 문자열("YYYY:MM:DD HH:MM:SS")을 초 단위 값으로 변환합니다.
+    EXIF에는 시간대가 없으므로 촬영지 벽시계 시각을 UTC로 간주한 값입니다.
+    """
+    if isinstance(value, bytes):
+        value = value.decode("ascii", "replace")
+    try:
+        parsed = datetime.strptime(value.strip("\x00 "), "%Y:%m:%d %H:%M:%S")
+    except (ValueError, TypeError, AttributeError):
+        return None
+    return float(calendar.timegm(parsed.timetuple()))
+
+
+def _extract_catalog_metadata(image_path: str) -> Optional[Dict[str, Any]]:
+    """위치 카탈로그 색인용: GPS 정보에 촬영 시각(taken_at, 초)을 더해 반환합니다 (EXIF는 한 번만 읽음)."""
+    try:
+        exif_dict = _load_exif_dict(image_path)
+        gps_data = _gps_from_exif_dict(exif_dict)
+        if gps_data:
+            for ifd, tag in _TAKEN_AT_TAGS:
+                taken_at = _parse_exif_datetime((exif_dict.get(ifd) or {}).get(tag))
+                if taken_at is not None:
+                    gps_data["taken_at"] = taken_at
+                    break
+        return gps_data
+    except Exception as e:
+        return {"error": str(e)}
+
+
+# ---------------------------------------------------------------------------
+# 진행 상황 보고와 취소
+# ---------------------------------------------------------------------------
+
+# 진행 알림 전송 간격 (초)
+PROGRESS_INTERVAL_SEC = float(os.getenv("PROGRESS_INTERVAL_SEC", "0.5"))
+
+# 워커 결과를 기다리는 동안 취소 여부를 확인하는 간격 (초)
+CANCEL_POLL_INTERVAL_SEC = 0.1
+
+
+class _ScanCancelled(Exception):
+    """클라이언트가 요청을 취소하여 파이프라인을 중단할 때 발생하는 예외"""
+
+
+class _ScanControl:
+    """
+    오래 걸리는 디렉토리 작업의 진행 상황과 취소 신호를 공유하는 객체입니다.
+    
+    파이프라인 스레드가 스캔/파싱/주소 변환 개수를 갱신하고, 비동기 도구 래퍼가 이를 읽어
+    MCP 진행 알림으로 보냅니다. 래퍼가 cancel()을 호출하면 파이프라인의 다음 check()에서
+    _ScanCancelled가 발생합니다.
+    """
+    
+    def __init__(self):
+        self.scanned = 0
+        self.parsed = 0
+        self.geocoded = 0
+        self.written = 0
+        self.address_failures = 0
+        self.address_handles: List[str] = []
+        self.deadline: Optional[float] = None
+        self._cancelled = threading.Event()
+    
+    def set_deadline(self, deadline_ms: Optional[int]) -> None:
+        """호출 시점부터 deadline_ms 밀리초의 시간 예산을 설정합니다 (None이면 제한 없음)."""
+        if deadline_ms is not None:
+            self.deadline = time.monotonic() + deadline_ms / 1000.0
+    
+    def remaining(self) -> float:
+        """남은 시간 예산 (초). 예산이 없으면 무한대."""
+        if self.deadline is None:
+            return math.inf
+        return max(self.deadline - time.monotonic(), 0.0)
+    
+    def expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+    
+    def record_parsed(self, count: int) -> None:
+        """샤딩 스캔처럼 나열과 파싱이 함께 끝나는 경우 두 개수를 같이 늘립니다."""
+        self.parsed += count
+        self.scanned = max(self.scanned, self.parsed)
+    
+    @property
+    def addresses_complete(self) -> bool:
+        """
+        주소가 빠진 항목(sync 주소 변환 실패, 아직 해석되지 않은 주소 핸들)이 없으면 True.
+        지오코더 장애 중의 결과가 캐시/스냅샷에 남아 복구 후에도 주소 없이 반환되지 않도록,
+        결과 캐시는 이 경우에만 저장합니다.
+        """
+        return self.address_failures == 0 and not self.address_handles
+    
+    def record_written(self, count: int) -> None:
+        """파일을 수정하는 작업(지오태깅)에서 기록을 마친 파일 수를 늘립니다."""
+        self.written += count
+    
+    def cancel(self) -> None:
+        self._cancelled.set()
+    
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+    
+    def check(self) -> None:
+        if self._cancelled.is_set():
+            raise _ScanCancelled()
+    
+    def progress_message(self) -> str:
+        message = f"스캔 {self.scanned}개, 파싱 {self.parsed}개, 주소 변환 {self.geocoded}개"
+        if self.written:
+            message += f", 기록 {self.written}개"
+        return message
+
+
+async def _run_with_progress(ctx: Optional[Context], impl, *args, **kwargs) -> str:
+    """
+    동기 구현(impl)을 워커 스레드에서 실행하면서 진행 상황을 MCP 진행 알림으로 보냅니다.
+    
+    클라이언트가 요청을 취소하면 즉시 반환하고 파이프라인에 취소 신호를 전달하여,
+    남은 스캔 작업과 대기 중인 지오코딩 요청이 더 이상 처리되지 않도록 합니다.
+    """
+    control = _ScanControl()
+    
+    async def report_progress() -> None:
+        last = None
+        while True:
+            await anyio.sleep(PROGRESS_INTERVAL_SEC)
+            snapshot = (control.scanned, control.parsed, control.geocoded, control.written)
+            if snapshot == last:
+                continue
+            last = snapshot
+            try:
+                await ctx.report_progress(
+                    progress=control.parsed + control.geocoded + control.written,
+                    message=control.progress_message()
+                )
+            except Exception:
+                # 진행 알림 실패는 작업 결과에 영향을 주지 않음
+                return
+    
+    try:
+        async with anyio.create_task_group() as task_group:
+            if ctx is not None:
+                task_group.start_soon(report_progress)
+            call = functools.partial(impl, *args, control=control, **kwargs)
+            profiler = _active_profile.get()
+            if profiler is not None:
+                # 실제 작업은 워커 스레드에서 실행되므로 그 스레드 안에서 프로파일링
+                call = functools.partial(profiler.run, call)
+            result = await anyio.to_thread.run_sync(call, abandon_on_cancel=True)
+            task_group.cancel_scope.cancel()
+        return result
+    except BaseException:
+        # 취소(또는 오류) 시 워커 스레드에 중단 신호 전달
+        control.cancel()
+        raise
+
+
+# ---------------------------------------------------------------------------
+# 동시 실행 제한 (격벽)
+#
+# 여러 사용자가 하나의 SSE 서버를 공유할 때, 큰 디렉토리를 스캔하는 호출이 CPU와
+# 역지오코딩 할당량을 모두 차지하면 사진 한 장을 조회하는 가벼운 호출까지 뒤에서
+# 기다리게 됩니다. 도구를 "scan"(디렉토리 스캔)과 "lookup"(단일 사진/핸들 조회)
+# 두 격벽으로 나누어 각각 동시 실행 수와 대기열 길이를 제한하고, 대기열이 가득 차면
+# 기다리게 하지 않고 즉시 거절합니다. 스캔 격벽은 동시에 실행되는 스캔 수를 제한하므로
+# 스캔 프로세스 풀, 작업 스레드, 지오코딩 토큰 예약도 그만큼만 사용합니다.
+# 도구별 상한(TOOL_MAX_CONCURRENT)과 클라이언트별 상한(CLIENT_MAX_CONCURRENT)을
+# 추가로 둘 수 있습니다.
+# ---------------------------------------------------------------------------
+
+# 디렉토리를 스캔하는 도구 (나머지 도구는 lookup 격벽)
+SCAN_TOOLS = frozenset({
+    "batch_get_photo_locations", "geofence_photos", "build_location_catalog",
+    "photo_density_tiles", "query_photos", "geotag_photos_from_gpx", "group_photo_bursts"
+})
+
+
+def _parse_tool_limits(spec: str) -> Dict[str, int]:
+    """"도구이름=상한,도구이름=상한" 형식의 환경 변수를 파싱합니다."""
+    limits = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, _, value = item.partition("=")
+        limits[name.strip()] = int(value)
+    return limits
+
+
+class _Bulkhead:
+    """동시 실행 수와 대기열 길이를 제한하는 격벽 (이벤트 루프 안에서만 사용)."""
+    
+    def __init__(self, name: str, max_concurrent: int, max_queue: int):
+        self.name = name
+        self.max_concurrent = max(max_concurrent, 1)
+        self.max_queue = max(max_queue, 0)
+        self.active = 0
+        self.rejected = 0
+        self._waiters: "deque[anyio.Event]" = deque()
+    
+    async def acquire(self) -> bool:
+        """실행 슬롯을 얻을 때까지 기다립니다. 대기열이 가득 차 있으면 즉시 False."""
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+            return True
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            return False
+        event = anyio.Event()
+        self._waiters.append(event)
+        try:
+            await event.wait()
+        except BaseException:
+            if event.is_set():
+                # 슬롯을 넘겨받은 직후 취소되면 다음 대기자에게 다시 넘김
+                self.release()
+            else:
+                self._waiters.remove(event)
+            raise
+        return True
+    
+    def release(self) -> None:
+        if self._waiters:
+            # 슬롯을 반납하지 않고 가장 오래 기다린 호출에게 그대로 넘김
+            self._waiters.popleft().set()
+        else:
+            self.active -= 1
+    
+    def status(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "queued": len(self._waiters),
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected
+        }
+
+
+class _ConcurrencyLimitMiddleware(Middleware):
+    """모든 도구 호출에 클라이언트별 → 도구별 → 격벽 순서로 동시 실행 제한을 적용합니다."""
+    
+    def __init__(self, scan: _Bulkhead, lookup: _Bulkhead, tool_limits: Dict[str, int],
+                 client_max_concurrent: int):
+        self.scan = scan
+        self.lookup = lookup
+        self.tools = {
+            name: _Bulkhead(name, limit, scan.max_queue if name in SCAN_TOOLS else lookup.max_queue)
+            for name, limit in tool_limits.items()
+        }
+        self.client_max_concurrent = client_max_concurrent
+        self._client_active: Dict[str, int] = {}
+    
+    @staticmethod
+    def _client_key(context: MiddlewareContext) -> str:
+        ctx = context.fastmcp_context
+        if ctx is None:
+            return "local"
+        try:
+            return ctx.client_id or ctx.session_id
+        except RuntimeError:
+            return "local"
+    
+    @staticmethod
+    def _reject(message: str, tool_name: str, limiter: Dict[str, Any]) -> ToolError:
+        return ToolError(json.dumps({
+            "error": message,
+            "tool": tool_name,
+            "limit": limiter,
+            "retryable": True
+        }, ensure_ascii=False))
+    
+    async def on_call_tool(self, context: MiddlewareContext, call_next):
+        tool_name = context.message.name
+        client = self._client_key(context)
+        active = self._client_active.get(client, 0)
+        if self.client_max_concurrent > 0 and active >= self.client_max_concurrent:
+            raise self._reject(
+                f"클라이언트당 동시 실행 가능한 호출 수({self.client_max_concurrent})를 초과했습니다. "
+                "진행 중인 호출이 끝난 뒤 다시 시도하세요.",
+                tool_name, {"client_max_concurrent": self.client_max_concurrent}
+            )
+        self._client_active[client] = active + 1
+        
+        held: List[_Bulkhead] = []
+        try:
+            bulkhead = self.scan if tool_name in SCAN_TOOLS else self.lookup
+            for limiter in (self.tools.get(tool_name), bulkhead):
+                if limiter is None:
+                    continue
+                if not await limiter.acquire():
+                    raise self._reject(
+                        f"서버가 과부하 상태입니다 ({limiter.name} 대기열 가득 참). 잠시 후 다시 시도하세요.",
+                        tool_name, limiter.status()
+                    )
+                held.append(limiter)
+            return await call_next(context)
+        finally:
+            for limiter in reversed(held):
+                limiter.release()
+            remaining = self._client_active[client] - 1
+            if remaining:
+                self._client_active[client] = remaining
+            else:
+                del self._client_active[client]
+    
+    def status(self) -> Dict[str, Any]:
+        return {
+            "scan": self.scan.status(),
+            "lookup": self.lookup.status(),
+            "tools": {name: limiter.status() for name, limiter in self.tools.items()},
+            "clients_active": len(self._client_active)
+        }
+
+
+_concurrency_limits = _ConcurrencyLimitMiddleware(
+    scan=_Bulkhead(
+        "scan",
+        int(os.getenv("SCAN_MAX_CONCURRENT", "2")),
+        int(os.getenv("SCAN_MAX_QUEUE", "8"))
+    ),
+    lookup=_Bulkhead(
+        "lookup",
+        int(os.getenv("LOOKUP_MAX_CONCURRENT", "16")),
+        int(os.getenv("LOOKUP_MAX_QUEUE", "64"))
+    ),
+    tool_limits=_parse_tool_limits(os.getenv("TOOL_MAX_CONCURRENT", "")),
+    client_max_concurrent=int(os.getenv("CLIENT_MAX_CONCURRENT", "4"))
+)
+mcp.add_middleware(_concurrency_limits)
+
+
+# ---------------------------------------------------------------------------
+# 도구 호출 프로파일링 (선택 기능)
+#
+# PROFILE_DIR을 설정하면 도구 호출 일부를 프로파일링하여 호출마다 파일로 남깁니다.
+# 서버를 수정하지 않고도 운영 부하에서 시간이 piexif.load, reverse_geocode, JSON 인코딩,
+# Pillow 재인코딩 중 어디에 쓰이는지 확인할 수 있습니다.
+#   cprofile: cProfile 결과(.prof, pstats/snakeviz로 열기)
+#   sample:   작업 스레드의 스택을 주기적으로 샘플링한 collapsed stack(.folded,
+#             flamegraph.pl/speedscope로 열기). 오버헤드가 작아 운영 환경에 적합
+# 샘플링 비율과 분당 최대 횟수로 프로파일링 빈도를 제한합니다. 스캔 워커 프로세스
+# 안의 파싱은 잡히지 않으므로, 파싱까지 보려면 SCAN_WORKERS=1로 실행하세요.
+# ---------------------------------------------------------------------------
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "")
+PROFILE_MODE = os.getenv("PROFILE_MODE", "cprofile")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "1.0"))
+PROFILE_MAX_PER_MIN = float(os.getenv("PROFILE_MAX_PER_MIN", "6"))
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+
+# Python 3.12부터 cProfile은 sys.monitoring 기반이라 인터프리터 전체에서 하나만 활성화할 수 있음
+_CPROFILE_EXCLUSIVE = sys.version_info >= (3, 12)
+
+# 현재 호출에 적용 중인 프로파일러 (비동기 도구 → _run_with_progress 워커 스레드로 전달)
+_active_profile: "contextvars.ContextVar[Optional[_CallProfiler]]" = contextvars.ContextVar(
+    "_active_profile", default=None
+)
+
+
+class _StackSampler:
+    """대상 스레드들의 스택을 일정 간격으로 샘플링하여 collapsed stack 횟수를 집계합니다."""
+    
+    def __init__(self, thread_id: int, interval_sec: float):
+        self._thread_ids = {thread_id}
+        self._interval_sec = interval_sec
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self.counts: Dict[str, int] = {}
+    
+    def start(self) -> None:
+        self._thread.start()
+    
+    def add_thread(self, thread_id: int) -> None:
+        self._thread_ids.add(thread_id)
+    
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+    
+    def _run(self) -> None:
+        while not self._stop.wait(self._interval_sec):
+            frames = sys._current_frames()
+            for thread_id in list(self._thread_ids):
+                frame = frames.get(thread_id)
+                stack = []
+                # 프로파일러 진입 프레임(run/attach) 아래는 제외
+                while frame is not None and frame.f_code not in _PROFILER_ENTRY_CODES:
+                    stack.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+                    frame = frame.f_back
+                if stack:
+                    key = ";".join(reversed(stack))
+                    self.counts[key] = self.counts.get(key, 0) + 1
+
+
+def _profile_mode() -> str:
+    """
+    실제로 사용할 프로파일링 방식을 반환합니다.
+    cProfile을 하나만 켤 수 있는 환경에서는 동시에 실행되는 호출과 파이프라인 보조 스레드를
+    각각 프로파일링할 수 없으므로 스택 샘플링으로 대체합니다.
+    """
+    if PROFILE_MODE == "sample" or _CPROFILE_EXCLUSIVE:
+        return "sample"
+    return "cprofile"
+
+
+def _enable_cprofile() -> Optional[cProfile.Profile]:
+    """cProfile을 켭니다. 다른 프로파일링 도구가 이미 활성화되어 있으면 None."""
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        return None
+    return profile
+
+
+class _CallProfiler:
+    """도구 호출 하나를 프로파일링하고 결과를 PROFILE_DIR에 기록합니다."""
+    
+    _sequence = 0
+    _sequence_lock = threading.Lock()
+    
+    def __init__(self, tool_name: str):
+        self.tool_name = tool_name
+        self._sampler: Optional[_StackSampler] = None
+        self._helper_profiles: List[cProfile.Profile] = []
+    
+    def run(self, fn, *args, **kwargs):
+        """현재 스레드에서 fn을 실행하며 프로파일링합니다."""
+        start = time.perf_counter()
+        if _profile_mode() == "sample":
+            self._sampler = _StackSampler(threading.get_ident(), PROFILE_SAMPLE_INTERVAL_MS / 1000.0)
+            self._sampler.start()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._sampler.stop()
+                counts = self._sampler.counts
+                self._write("folded", lambda path: self._write_folded(path, counts), start)
+        profile = _enable_cprofile()
+        if profile is None:
+            # 다른 프로파일러(디버거, 커버리지 도구 등)가 켜져 있으면 프로파일링 없이 실행
+            return fn(*args, **kwargs)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profile.disable()
+            def dump(path: str) -> None:
+                stats = pstats.Stats(profile)
+                for helper in list(self._helper_profiles):
+                    stats.add(helper)
+                stats.dump_stats(path)
+            self._write("prof", dump, start)
+    
+    def attach(self, fn, *args, **kwargs):
+        """
+        작업 스레드가 띄운 보조 스레드(파이프라인 단계 등)에서 fn을 실행하며 같은 프로파일에 포함합니다.
+        스캔/파싱 단계는 이 보조 스레드에서 실행됩니다.
+        """
+        if self._sampler is not None:
+            self._sampler.add_thread(threading.get_ident())
+            return fn(*args, **kwargs)
+        profile = _enable_cprofile()
+        if profile is None:
+            return fn(*args, **kwargs)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profile.disable()
+            self._helper_profiles.append(profile)
+    
+    @staticmethod
+    def _write_folded(path: str, counts: Dict[str, int]) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in sorted(counts.items()):
+                f.write(f"{stack} {count}\n")
+    
+    def _write(self, extension: str, writer, start: float) -> None:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with _CallProfiler._sequence_lock:
+            _CallProfiler._sequence += 1
+            sequence = _CallProfiler._sequence
+        name = (f"{time.strftime('%Y%m%dT%H%M%S')}-{self.tool_name}-{os.getpid()}-{sequence}"
+                f"-{elapsed_ms:.0f}ms.{extension}")
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            writer(os.path.join(PROFILE_DIR, name))
+        except OSError as e:
+            # 프로파일 기록 실패는 도구 결과에 영향을 주지 않음
+            print(f"프로파일을 기록하지 못했습니다 ({name}): {e}", file=sys.stderr)
+
+
+_PROFILER_ENTRY_CODES = frozenset({_CallProfiler.run.__code__, _CallProfiler.attach.__code__})
+
+# 분당 최대 프로파일링 횟수 제한 (토큰이 없으면 기다리지 않고 프로파일링 생략)
+_profile_budget = _TokenBucket(max(PROFILE_MAX_PER_MIN, 1e-6) / 60.0)
+
+
+def _start_profile(tool_name: str) -> Optional[_CallProfiler]:
+    """이번 호출을 프로파일링할지 결정합니다. 이미 프로파일링 중인 호출 안이면 중첩하지 않습니다."""
+    if not PROFILE_DIR or _active_profile.get() is not None:
+        return None
+    if random.random() >= PROFILE_SAMPLE_RATE or not _profile_budget.acquire(timeout=0.0):
+        return None
+    return _CallProfiler(tool_name)
+
+
+def _profiled(fn):
+    """
+    도구 함수를 감싸 PROFILE_DIR이 설정된 경우 호출을 프로파일링합니다.
+    동기 도구는 실행 스레드에서 바로, 비동기 도구는 _run_with_progress의 워커 스레드에서 프로파일링합니다.
+    """
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            profiler = _start_profile(fn.__name__)
+            if profiler is None:
+                return await fn(*args, **kwargs)
+            token = _active_profile.set(profiler)
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                _active_profile.reset(token)
+        return async_wrapper
+    
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        profiler = _start_profile(fn.__name__)
+        if profiler is None:
+            return fn(*args, **kwargs)
+        token = _active_profile.set(profiler)
+        try:
+            return profiler.run(fn, *args, **kwargs)
+        finally:
+            _active_profile.reset(token)
+    return wrapper
+
+
+# ---------------------------------------------------------------------------
+# 재귀 디렉토리 스캔 (멀티 프로세스 샤딩)
+#
+# 스캔 작업은 두 종류입니다.
+#   ("dir", 디렉토리 경로, 상대 경로, 깊이)  -> 디렉토리 하나를 나열하고 첫 파일 묶음을 파싱
+#   ("files", [(파일 경로, 상대 경로), ...]) -> 큰 디렉토리에서 분할된 파일 묶음을 파싱
+# 각 작업은 (GPS가 있는 사진 목록, 새로 발견한 작업 목록)을 반환하고, 새 작업은 공용 작업 큐에
+# 다시 제출됩니다. 한가한 워커가 큐에서 다음 작업을 가져가므로 SSD/네트워크 마운트처럼
+# 속도가 다른 하위 트리가 섞여 있어도 모든 코어가 계속 일하게 됩니다.
+# ---------------------------------------------------------------------------
+
+# 스캔 워커 프로세스 수 (1 이하이면 현재 프로세스에서 순차 처리)
+SCAN_WORKERS = int(os.getenv("SCAN_WORKERS", str(os.cpu_count() or 1)))
+
+# 하나의 작업이 파싱하는 최대 파일 수 (큰 디렉토리는 이 단위로 분할)
+SCAN_CHUNK_SIZE = int(os.getenv("SCAN_CHUNK_SIZE", "256"))
+
+# 스캔 워커 프로세스의 nice 값 (CPU를 두고 경쟁할 때 단일 사진 조회가 먼저 처리되도록, 0이면 조정 안 함)
+SCAN_WORKER_NICE = int(os.getenv("SCAN_WORKER_NICE", "10"))
+
+_scan_pool: Optional[ProcessPoolExecutor] = None
+_scan_pool_lock = threading.Lock()
+
+
+def _matches_any(name: str, relative_path: str, patterns) -> bool:
+    """파일/디렉토리 이름 또는 루트 기준 상대 경로가 glob 패턴 중 하나와 일치하는지 확인합니다."""
+    return any(
+        fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(relative_path, pattern)
+        for pattern in patterns
+    )
+
+
+def _list_scan_entries(dir_path: str, relative_dir: str, depth: int, options):
+    """
+    os.scandir로 디렉토리 하나를 나열하여 스캔 대상 파일과 하위 디렉토리를 구분합니다.
+    
+    Args:
+        options: (include 패턴, exclude 패턴, 최대 깊이 또는 None)
+        
+    Returns:
+        ([(파일 경로, 상대 경로), ...], [(디렉토리 경로, 상대 경로, 깊이), ...])
+    """
+    include, exclude, max_depth = options
+    files = []
+    subdirs = []
+    try:
+        with os.scandir(dir_path) as it:
+            for entry in it:
+                relative_path = f"{relative_dir}/{entry.name}" if relative_dir else entry.name
+                if exclude and _matches_any(entry.name, relative_path, exclude):
+                    continue
+                try:
+                    # 심볼릭 링크 디렉토리는 따라가지 않음 (순환 방지)
+                    if entry.is_dir(follow_symlinks=False):
+                        if max_depth is None or depth < max_depth:
+                            subdirs.append((entry.path, relative_path, depth + 1))
+                    elif entry.is_file():
+                        if os.path.splitext(entry.name)[1].lower() not in SUPPORTED_IMAGE_FORMATS:
+                            continue
+                        if include and not _matches_any(entry.name, relative_path, include):
+                            continue
+                        files.append((entry.path, relative_path))
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return files, subdirs
+
+
+def _scan_shard_task(task, options, extractor=extract_gps_from_exif):
+    """
+    스캔 작업 하나를 처리합니다 (워커 프로세스 또는 현재 프로세스에서 실행).
+    extractor는 파일 경로를 받아 GPS 정보 dict를 반환하는 모듈 수준 함수입니다.
+    
+    Returns:
+        ([(상대 경로, 파일 경로, GPS 정보), ...], [새 작업, ...], 파싱한 파일 수)
+    """
+    new_tasks = []
+    if task[0] == "dir":
+        _, dir_path, relative_dir, depth = task
+        files, subdirs = _list_scan_entries(dir_path, relative_dir, depth, options)
+        new_tasks.extend(("dir",) + subdir for subdir in subdirs)
+        # 큰 디렉토리는 파일 묶음을 별도 작업으로 분할해 다른 워커가 가져갈 수 있게 함
+        for start in range(SCAN_CHUNK_SIZE, len(files), SCAN_CHUNK_SIZE):
+            new_tasks.append(("files", files[start:start + SCAN_CHUNK_SIZE]))
+        files = files[:SCAN_CHUNK_SIZE]
+    else:
+        files = task[1]
+    
+    found = []
+    for path, relative_path in files:
+        gps_data = extractor(path)
+        if gps_data and "error" not in gps_data:
+            found.append((relative_path, path, gps_data))
+    return found, new_tasks, len(files)
+
+
+def _scan_worker_init(niceness: int) -> None:
+    """스캔 워커 프로세스의 우선순위를 낮춥니다 (nice를 지원하지 않는 플랫폼에서는 무시)."""
+    if niceness and hasattr(os, "nice"):
+        try:
+            os.nice(niceness)
+        except OSError:
+            pass
+
+
+def _get_scan_pool() -> ProcessPoolExecutor:
+    global _scan_pool
+    with _scan_pool_lock:
+        if _scan_pool is None:
+            # 풀은 프로세스 수명 동안 재사용 (워커 시작 비용은 첫 스캔에서 한 번만 발생)
+            _scan_pool = ProcessPoolExecutor(max_workers=SCAN_WORKERS, initializer=_scan_worker_init,
+                                             initargs=(SCAN_WORKER_NICE,))
+        return _scan_pool
+
+
+def _reset_scan_pool() -> None:
+    """워커가 비정상 종료된 경우 다음 호출에서 풀을 새로 만들도록 초기화합니다."""
+    global _scan_pool
+    with _scan_pool_lock:
+        _scan_pool = None
+
+
+def _iter_scanned_photos(dir_path: Path, include=None, exclude=None, max_depth: Optional[int] = 0,
+                         control: Optional["_ScanControl"] = None, extractor=extract_gps_from_exif):
+    """
+    디렉토리(트리)를 스캔하며 GPS 정보가 있는 사진을 (상대 경로, 파일 경로, GPS 정보)로 yield합니다.
+    
+    루트 디렉토리는 현재 프로세스에서 먼저 처리하고, 추가 작업(하위 디렉토리, 분할된 파일 묶음)이
+    생길 때만 워커 프로세스 풀로 분산합니다. 워커의 부분 결과는 도착하는 즉시 yield되므로
+    워커별 전체 목록 복사본을 만들지 않습니다. 취소되면 아직 시작하지 않은 작업은 모두 취소됩니다.
+    """
+    control = control or _ScanControl()
+    options = (tuple(include or ()), tuple(exclude or ()), max_depth)
+    found, tasks, parsed = _scan_shard_task(("dir", str(dir_path), "", 0), options, extractor)
+    control.record_parsed(parsed)
+    yield from found
+    
+    if SCAN_WORKERS <= 1:
+        while tasks:
+            control.check()
+            found, more, parsed = _scan_shard_task(tasks.pop(), options, extractor)
+            control.record_parsed(parsed)
+            yield from found
+            tasks.extend(more)
+        return
+    
+    pool = _get_scan_pool()
+    pending = {pool.submit(_scan_shard_task, task, options, extractor) for task in tasks}
+    try:
+        while pending:
+            done, pending = wait(pending, timeout=CANCEL_POLL_INTERVAL_SEC, return_when=FIRST_COMPLETED)
+            control.check()
+            for future in done:
+                found, more, parsed = future.result()
+                control.record_parsed(parsed)
+                for task in more:
+                    pending.add(pool.submit(_scan_shard_task, task, options, extractor))
+                yield from found
+    except BrokenProcessPool:
+        _reset_scan_pool()
+        raise
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+# ---------------------------------------------------------------------------
+# 스트리밍 파이프라인 (scan → parse → filter → geocode → encode)
+#
+# 각 단계는 제너레이터로 연결되어 한 번에 한 항목씩 흘려보내며, 단계 사이에는
+# 크기가 제한된 버퍼(병렬 파싱 창, 파싱→지오코딩 큐)만 존재합니다.
+# 따라서 페이지 크기(page_size)를 지정하면 디렉토리 크기와 무관하게 메모리 사용량이 일정합니다.
+# page_size가 없으면 응답 전체를 한 문자열로 만들어야 하므로 인코딩된 항목을 모두 모읍니다.
+# 커서는 스캔 순서의 위치이므로 각 페이지는 시작 위치까지 목록을 다시 나열합니다 (파싱은 건너뜀).
+# ---------------------------------------------------------------------------
+
+# 파싱 단계와 지오코딩 단계 사이 큐의 최대 항목 수
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "256"))
+
+# 순서 보장 파싱에서 워커에 한 번에 넘기는 파일 수
+PIPELINE_PARSE_BATCH = 32
+
+_STAGE_DONE = object()
+
+
+class _StageError:
+    """생산자 스레드에서 발생한 예외를 소비자 쪽으로 전달하기 위한 래퍼"""
+    
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+def _buffered(iterable, maxsize: int):
+    """
+    상류 제너레이터를 별도 스레드에서 실행하고 크기가 제한된 큐로 연결합니다.
+    
+    하류 단계(예: 역지오코딩)가 느린 동안에도 상류 단계(스캔/파싱)가 최대 maxsize 항목까지
+    미리 진행합니다. 소비자가 중간에 멈추면 생산자도 정리됩니다.
+    """
+    buffer: "queue.Queue[Any]" = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+    
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def produce() -> None:
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if not put(item):
+                    return
+            put(_STAGE_DONE)
+        except BaseException as exc:
+            put(_StageError(exc))
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+    
+    profiler = _active_profile.get()
+    target = produce if profiler is None else functools.partial(profiler.attach, produce)
+    producer = threading.Thread(target=target, name="pipeline-stage", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is _STAGE_DONE:
+                return
+            if isinstance(item, _StageError):
+                raise item.exc
+            yield item
+    finally:
+        stop.set()
+        producer.join()
+
+
+def _iter_scan_candidates(dir_path: Path, options, control: Optional["_ScanControl"] = None):
+    """
+    스캔 대상 파일을 결정적인 순서(전체 경로 정렬 순)로 (파일 경로, 상대 경로)로 yield합니다.
+    
+    디렉토리는 "경로 + 구분자"를 정렬 키로 사용하여, 깊이 우선 순회 결과가
+    전체 경로 문자열 정렬 순서와 같아지도록 합니다.
+    """
+    def walk(path: str, relative_dir: str, depth: int):
+        if control is not None:
+            control.check()
+        files, subdirs = _list_scan_entries(path, relative_dir, depth, options)
+        entries = [(file_path, (file_path, relative_path)) for file_path, relative_path in files]
+        entries.extend((subdir[0] + os.sep, subdir) for subdir in subdirs)
+        entries.sort(key=lambda entry: entry[0])
+        for _, value in entries:
+            if len(value) == 3:
+                yield from walk(*value)
+            else:
+                yield value
+    
+    yield from walk(str(dir_path), "", 0)
+
+
+def _parse_scan_batch(batch, extractor=extract_gps_from_exif):
+    """[(인덱스, 상대 경로, 경로), ...] 묶음의 GPS 정보를 추출합니다 (워커 프로세스에서 실행 가능)."""
+    return [
+        (index, relative_path, path, extractor(path))
+        for index, relative_path, path in batch
+    ]
+
+
+def _iter_parsed_in_order(candidates, control: Optional["_ScanControl"] = None,
+                          extractor=extract_gps_from_exif, parse_batch=None, record=None):
+    """
+    (인덱스, 상대 경로, 경로) 스트림을 파싱하여 입력 순서대로
+    (인덱스, 상대 경로, 경로, GPS 정보 또는 None)를 yield합니다.
+    
+    워커 풀을 사용할 때 동시에 처리 중인 묶음 수는 워커 수의 2배로 제한됩니다.
+    parse_batch를 주면 _parse_scan_batch 대신 사용합니다 (워커로 보낼 수 있는 모듈 수준 함수여야 함).
+    record는 처리한 항목 수를 진행 상황에 반영하는 함수입니다 (기본값: control.record_parsed).
+    """
+    control = control or _ScanControl()
+    parse_batch = parse_batch or functools.partial(_parse_scan_batch, extractor=extractor)
+    record = record or control.record_parsed
+    
+    def batches():
+        batch = []
+        for candidate in candidates:
+            batch.append(candidate)
+            if len(batch) >= PIPELINE_PARSE_BATCH:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    
+    if SCAN_WORKERS <= 1:
+        for batch in batches():
+            control.check()
+            record(len(batch))
+            yield from parse_batch(batch)
+        return
+    
+    def next_result():
+        future = window.popleft()
+        while True:
+            try:
+                results = future.result(timeout=CANCEL_POLL_INTERVAL_SEC)
+                break
+            except FuturesTimeoutError:
+                control.check()
+        record(len(results))
+        return results
+    
+    pool = _get_scan_pool()
+    window = deque()
+    try:
+        for batch in batches():
+            control.check()
+            window.append(pool.submit(parse_batch, batch))
+            if len(window) >= 2 * SCAN_WORKERS:
+                yield from next_result()
+        while window:
+            yield from next_result()
+    except BrokenProcessPool:
+        _reset_scan_pool()
+        raise
+    finally:
+        for future in window:
+            future.cancel()
+
+
+def _iter_photo_records(dir_path: Path, options, ordered: bool, start_offset: int = 0,
+                        control: Optional["_ScanControl"] = None, extractor=extract_gps_from_exif):
+    """
+    scan → parse 단계: (스캔 인덱스, 상대 경로, 경로, GPS 정보 또는 None)을 yield합니다.
+    
+    ordered=True이면 결정적 순서로 스캔하여 스캔 인덱스를 커서로 사용할 수 있고,
+    start_offset 이전 파일은 파싱 없이 건너뜁니다. ordered=False이면 멀티 프로세스 샤딩 스캔을
+    사용하며 (GPS 정보가 있는 사진만, 완료 순서대로) 스캔 인덱스는 None입니다.
+    """
+    control = control or _ScanControl()
+    if not ordered:
+        for relative_path, path, gps_data in _iter_scanned_photos(dir_path, *options, control=control,
+                                                                  extractor=extractor):
+            yield None, relative_path, path, gps_data
+        return
+    
+    def candidates():
+        for index, (path, relative_path) in enumerate(_iter_scan_candidates(dir_path, options, control)):
+            control.scanned += 1
+            if index >= start_offset:
+                yield index, relative_path, path
+    
+    yield from _iter_parsed_in_order(candidates(), control, extractor)
+
+
+# ---------------------------------------------------------------------------
+# 압축 파일(ZIP/tar) 스캔
+#
+# 압축을 풀지 않고 멤버마다 메타데이터 앞부분만 읽어 GPS를 추출합니다.
+#   zip, tar(비압축) : 멤버 위치를 알 수 있으므로 워커 프로세스들이 임의 접근으로 병렬 파싱
+#   tar.gz/bz2/xz    : 임의 접근이 불가능하므로 한 번만 순차로 읽으며, 멤버마다 메타데이터를
+#                      읽은 뒤 나머지는 버퍼링 없이 건너뜀
+# 압축 파일 안의 폴더는 디렉토리처럼 취급하여 include/exclude 패턴과 최대 깊이를 적용하고,
+# 결과 경로는 "<압축 파일 경로>/<멤버 경로>" 형식입니다.
+# ---------------------------------------------------------------------------
+
+# 순차 읽기(압축된 tar)에서 한 번에 읽는 바이트 수
+ARCHIVE_READ_CHUNK = 16 * 1024
+
+
+def _archive_kind(path: Path) -> Optional[str]:
+    """압축 파일 형식을 판별합니다: "zip", "tar"(임의 접근 가능), "tar-stream"(압축된 tar), 아니면 None."""
+    try:
+        if zipfile.is_zipfile(path):
+            return "zip"
+        if not tarfile.is_tarfile(path):
+            return None
+        try:
+            with tarfile.open(path, "r:"):
+                return "tar"
+        except tarfile.ReadError:
+            return "tar-stream"
+    except OSError:
+        return None
+
+
+def _archive_member_name(name: str) -> str:
+    """멤버 이름을 정규화합니다 (tar의 "./" 접두사 제거)."""
+    while name.startswith("./"):
+        name = name[2:]
+    return name.lstrip("/")
+
+
+def _archive_member_selected(name: str, options) -> bool:
+    """압축 파일 멤버가 스캔 대상인지 확인합니다 (상위 폴더까지 exclude 패턴 적용)."""
+    include, exclude, max_depth = options
+    parts = name.split("/")
+    if max_depth is not None and len(parts) - 1 > max_depth:
+        return False
+    if os.path.splitext(parts[-1])[1].lower() not in SUPPORTED_IMAGE_FORMATS:
+        return False
+    if exclude and any(_matches_any(parts[i], "/".join(parts[:i + 1]), exclude) for i in range(len(parts))):
+        return False
+    return not include or _matches_any(parts[-1], "/".join(parts), include)
+
+
+def _extract_gps_from_archive_member(f, seekable: bool) -> Optional[Dict[str, Any]]:
+    """
+    압축 파일 멤버의 파일 객체에서 메타데이터 영역만 읽어 GPS 정보를 추출합니다.
+    seekable이면 건너뛸 영역을 seek로 건너뛰고, 아니면 스트림 탐색기로 순차 처리합니다.
+    """
+    try:
+        if seekable:
+            _, locator = _select_stream_locator(f.read(16))
+            if locator is None:
+                return None
+            f.seek(0)
+            exif_bytes = _run_exif_locator(locator(), f)
+        else:
+            stream = _StreamExifLocator()
+            while not stream.done:
+                chunk = f.read(ARCHIVE_READ_CHUNK)
+                if not chunk:
+                    break
+                stream.feed(chunk)
+            stream.finish()
+            exif_bytes = stream.exif_bytes
+        if not exif_bytes:
+            return None
+        return _gps_from_exif_dict(piexif.load(exif_bytes))
+    except Exception as e:
+        return {"error": str(e)}
+
+
+# 워커 프로세스별로 열어 둔 ZIP (중앙 디렉토리를 묶음마다 다시 읽지 않도록)
+_open_zip_files: "OrderedDict[tuple, zipfile.ZipFile]" = OrderedDict()
+_open_zip_files_lock = threading.Lock()
+if hasattr(os, "register_at_fork"):
+    # fork된 워커가 부모의 ZipFile을 물려받으면 파일 위치를 공유하게 되므로 새로 열도록 비움
+    os.register_at_fork(after_in_child=_open_zip_files.clear)
+
+
+def _open_zip_cached(archive_path: str) -> zipfile.ZipFile:
+    st = os.stat(archive_path)
+    key = (archive_path, st.st_size, st.st_mtime_ns)
+    with _open_zip_files_lock:
+        archive = _open_zip_files.get(key)
+        if archive is None:
+            archive = zipfile.ZipFile(archive_path)
+            _open_zip_files[key] = archive
+            while len(_open_zip_files) > 4:
+                _open_zip_files.popitem(last=False)[1].close()
+        _open_zip_files.move_to_end(key)
+        return archive
+
+
+def _parse_archive_batch(archive_path: str, kind: str, batch):
+    """
+    [(인덱스, 멤버 이름, 멤버 위치), ...] 묶음의 GPS 정보를 추출합니다 (워커 프로세스에서 실행 가능).
+    멤버 위치는 zip이면 원래 멤버 이름, tar이면 (데이터 오프셋, 크기)입니다.
+    """
+    results = []
+    if kind == "zip":
+        archive = _open_zip_cached(archive_path)
+        for index, name, member_name in batch:
+            try:
+                with archive.open(member_name) as f:
+                    gps_data = _extract_gps_from_archive_member(f, seekable=f.seekable())
+            except Exception as e:
+                gps_data = {"error": str(e)}
+            results.append((index, name, f"{archive_path}/{name}", gps_data))
+        return results
+    
+    with tarfile.open(archive_path, "r:") as archive:
+        for index, name, (offset, size) in batch:
+            member = tarfile.TarInfo(name)
+            member.type = tarfile.REGTYPE
+            member.offset_data = offset
+            member.size = size
+            gps_data = _extract_gps_from_archive_member(archive.extractfile(member), seekable=True)
+            results.append((index, name, f"{archive_path}/{name}", gps_data))
+    return results
+
+
+def _iter_archive_records(archive_path: Path, kind: str, options, start_offset: int = 0,
+                          control: Optional["_ScanControl"] = None):
+    """
+    압축 파일 멤버를 압축 파일 안의 순서대로 파싱하여
+    (인덱스, 멤버 이름, 결과 경로, GPS 정보 또는 None)을 yield합니다 (_run_photo_pipeline의 source).
+    start_offset 이전 멤버는 파싱하지 않습니다.
+    """
+    control = control or _ScanControl()
+    
+    if kind == "tar-stream":
+        index = -1
+        with tarfile.open(archive_path, "r|*") as archive:
+            for member in archive:
+                name = _archive_member_name(member.name)
+                if not member.isreg() or not _archive_member_selected(name, options):
+                    continue
+                index += 1
+                control.scanned += 1
+                if index < start_offset:
+                    continue
+                control.check()
+                gps_data = _extract_gps_from_archive_member(archive.extractfile(member), seekable=False)
+                control.record_parsed(1)
+                yield index, name, f"{archive_path}/{name}", gps_data
+        return
+    
+    def candidates():
+        if kind == "zip":
+            with zipfile.ZipFile(archive_path) as archive:
+                members = [(_archive_member_name(info.filename), info.filename)
+                           for info in archive.infolist() if not info.is_dir()]
+        else:
+            with tarfile.open(archive_path, "r:") as archive:
+                members = [(_archive_member_name(member.name), (member.offset_data, member.size))
+                           for member in archive if member.isreg() and not member.issparse()]
+        index = 0
+        for name, location in members:
+            if not _archive_member_selected(name, options):
+                continue
+            control.scanned += 1
+            if index >= start_offset:
+                yield index, name, location
+            index += 1
+    
+    yield from _iter_parsed_in_order(
+        candidates(), control, parse_batch=functools.partial(_parse_archive_batch, str(archive_path), kind)
+    )
+
+
+def _query_key(tool_name: str, dir_path: Path, arguments: Dict[str, Any]) -> str:
+    """커서가 같은 질의에서만 사용되도록 도구 이름/경로/인자로 질의 키를 만듭니다."""
+    payload = json.dumps([tool_name, str(dir_path.resolve()), arguments], sort_keys=True, ensure_ascii=False)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _encode_cursor(offset: int, query_key: str) -> str:
+    """다음 페이지를 시작할 스캔 위치를 불투명한 커서 문자열로 인코딩합니다."""
+    payload = json.dumps({"offset": offset, "query": query_key}).encode("ascii")
+    return base64.urlsafe_b64encode(payload).decode("ascii")
+
+
+def _decode_cursor(cursor: str, query_key: str) -> Optional[int]:
+    """커서를 해독하여 스캔 위치를 반환합니다. 형식이 잘못되었거나 다른 질의의 커서면 None."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        offset = int(payload["offset"])
+    except Exception:
+        return None
+    if payload.get("query") != query_key or offset < 0:
+        return None
+    return offset
+
+
+def _encode_result_item(item: Dict[str, Any]) -> str:
+    """encode 단계: 결과 항목 하나를 문서 안 들여쓰기 위치에 맞춰 JSON 문자열로 인코딩합니다."""
+    return "    " + json.dumps(item, ensure_ascii=False, indent=2).replace("\n", "\n    ")
+
+
+def _encode_result_document(fields: Dict[str, Any], list_key: str, encoded_items: List[str]) -> str:
+    """
+    미리 인코딩된 항목 문자열로 결과 문서를 조립합니다.
+    json.dumps(..., ensure_ascii=False, indent=2)와 같은 형식이며, 목록은 마지막 필드입니다.
+    """
+    lines = ["{"]
+    for key, value in fields.items():
+        value_text = json.dumps(value, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+        lines.append(f"  {json.dumps(key, ensure_ascii=False)}: {value_text},")
+    if encoded_items:
+        lines.append(f"  {json.dumps(list_key, ensure_ascii=False)}: [")
+        lines.append(",\n".join(encoded_items))
+        lines.append("  ]")
+    else:
+        lines.append(f"  {json.dumps(list_key, ensure_ascii=False)}: []")
+    lines.append("}")
+    return "\n".join(lines)
+
+
+def _run_photo_pipeline(dir_path: Path, options, build_item, address_mode: str,
+                        page_size: Optional[int] = None, start_offset: Optional[int] = None,
+                        query_key: str = "", control: Optional["_ScanControl"] = None,
+                        source=None):
+    """
+    scan → parse → filter → geocode → encode 파이프라인을 실행합니다.
+    
+    Args:
+        options: (include 패턴, exclude 패턴, 최대 깊이)
+        source: scan → parse 단계 대신 사용할 (인덱스, 상대 경로, 경로, GPS 정보) 이터레이터
+            (위치 카탈로그 조회 등, 인덱스 순서로 yield해야 함)
+        build_item: filter 단계. (상대 경로, 경로, GPS 정보)를 받아 결과 항목 dict 또는 None(제외)을 반환
+        address_mode: geocode 단계의 주소 해석 모드
+        page_size: 페이지당 최대 항목 수 (None이면 전체 - 인코딩된 결과를 모두 메모리에 모음)
+        start_offset: 커서에서 해독한 스캔 시작 위치 (None이면 처음부터).
+            시작 위치 이전 파일도 다시 나열하므로 페이지마다 O(전체 파일 수)의 scandir 비용이 듬
+        control: 진행 상황 기록, 취소 신호(취소되면 _ScanCancelled 발생), 시간 예산
+        
+    Returns:
+        (인코딩된 항목 문자열 목록, 다음 페이지 커서 또는 None, 시간 예산 초과로 중단되었는지 여부)
+    """
+    control = control or _ScanControl()
+    # 페이지 단위 조회와 시간 예산이 있는 호출은 커서 위치가 의미를 갖도록 결정적 순서로 스캔
+    ordered = page_size is not None or start_offset is not None or control.deadline is not None
+    if source is not None:
+        ordered = True
+        records = source
+    else:
+        records = _buffered(
+            _iter_photo_records(dir_path, options, ordered, start_offset or 0, control),
+            PIPELINE_QUEUE_SIZE
+        )
+    
+    encoded = []
+    next_cursor = None
+    partial = False
+    try:
+        for index, relative_path, path, gps_data in records:
+            control.check()
+            if control.expired():
+                # 시간 예산 초과: 새 작업을 시작하지 않고 지금까지의 결과와 재개 커서 반환
+                next_cursor = _encode_cursor(index, query_key)
+                partial = True
+                break
+            if not gps_data or "error" in gps_data:
+                continue
+            result_item = build_item(relative_path, path, gps_data)
+            if result_item is None:
+                continue
+            if page_size is not None and len(encoded) >= page_size:
+                # 다음 페이지는 이 항목부터 시작
+                next_cursor = _encode_cursor(index, query_key)
+                break
+            _attach_address(result_item, gps_data, address_mode, control)
+            encoded.append((path, _encode_result_item(result_item)))
+    except _ScanCancelled:
+        # 취소된 호출이 예약한 지오코딩 요청은 더 이상 처리하지 않음
+        _address_resolver.release(control.address_handles)
+        raise
+    finally:
+        records.close()
+    
+    if not ordered:
+        # 워커 완료 순서와 무관하게 항상 경로 순서로 반환
+        encoded.sort(key=lambda entry: entry[0])
+    return [text for _, text in encoded], next_cursor, partial
+
+
+# ---------------------------------------------------------------------------
+# 위치 카탈로그 (열 지향 압축 저장소)
+#
+# 추출한 위치를 사진마다 dict로 들고 있지 않고, 열(column)마다 하나의 연속된 배열에 저장합니다.
+#   latitude / longitude / altitude : float64 (고도가 없으면 NaN)
+#   taken_at                        : float64, EXIF 촬영 시각 (초, 없으면 NaN)
+#   lat_order / time_order          : uint32, 위도/촬영 시각 순으로 정렬한 행 번호 (조회용 인덱스)
+#   dir_id                          : uint32, 중복 제거된 디렉토리 테이블의 번호
+#   name_offsets + names            : 파일 이름 문자열 테이블 (UTF-8)
+#   dir_offsets + dirs              : 디렉토리 문자열 테이블 (UTF-8)
+# 파일 형식은 [매직 8바이트][헤더 길이 8바이트][JSON 헤더][8바이트 정렬된 열 데이터...]이며,
+# 시작 시 mmap으로 열고 memoryview.cast로 열을 바로 참조하므로 복사 없이 즉시 로드됩니다.
+# 사진 한 장당 약 56바이트 + 파일 이름 길이만 사용합니다.
+# ---------------------------------------------------------------------------
+
+# 카탈로그 파일 경로
+LOCATION_CATALOG_PATH = Path(os.getenv(
+    "LOCATION_CATALOG_PATH", str(Path.home() / ".mcp-photo-location" / "catalog.bin")
+))
+
+# 카탈로그 조회 중 취소 여부를 확인하고 진행 상황을 갱신하는 행 간격
+CATALOG_SCAN_STRIDE = 65536
+
+
+def _nan_last(value: float) -> float:
+    """정렬 키: NaN(값 없음)을 가장 뒤로 보냅니다."""
+    return math.inf if math.isnan(value) else value
+
+
+class _SortedColumnView:
+    """정렬 인덱스를 거쳐 열을 정렬된 순서로 보여주는 읽기 전용 시퀀스 (bisect용, 복사 없음)."""
+    
+    def __init__(self, values: memoryview, order: memoryview):
+        self._values = values
+        self._order = order
+    
+    def __len__(self) -> int:
+        return len(self._order)
+    
+    def __getitem__(self, index: int) -> float:
+        return _nan_last(self._values[self._order[index]])
+
+
+class _LocationStore:
+    """
+    사진 위치를 열 단위 배열로 저장하는 불변 카탈로그입니다.
+    
+    build()로 메모리에서 만들거나 open()으로 파일을 mmap하여 열며, 조회는 배열을 직접 순회합니다.
+    교체할 때는 새 저장소를 만들어 참조를 바꾸므로 조회 중인 호출에는 영향이 없습니다.
+    """
+    
+    MAGIC = b"MCPLOC\x00\x01"
+    COLUMNS = (
+        ("latitude", "d"),
+        ("longitude", "d"),
+        ("altitude", "d"),
+        ("taken_at", "d"),
+        ("lat_order", "I"),
+        ("time_order", "I"),
+        ("dir_id", "I"),
+        ("name_offsets", "Q"),
+        ("names", "B"),
+        ("dir_offsets", "Q"),
+        ("dirs", "B"),
+    )
+    
+    def __init__(self, columns: Dict[str, memoryview], roots: List[str], generation: str,
+                 source: Optional[str] = None, mapping: Optional[mmap.mmap] = None,
+                 mapping_view: Optional[memoryview] = None):
+        self._columns = columns
+        self._mapping = mapping
+        self._mapping_view = mapping_view
+        self.roots = roots
+        self.generation = generation
+        self.source = source
+        self.latitude = columns["latitude"]
+        self.longitude = columns["longitude"]
+        self.altitude = columns["altitude"]
+        self.taken_at = columns["taken_at"]
+        self.dir_id = columns["dir_id"]
+        self._directories = [
+            bytes(columns["dirs"][columns["dir_offsets"][i]:columns["dir_offsets"][i + 1]]).decode("utf-8")
+            for i in range(len(columns["dir_offsets"]) - 1)
+        ]
+    
+    def __len__(self) -> int:
+        return len(self.latitude)
+    
+    @property
+    def nbytes(self) -> int:
+        return sum(column.nbytes for column in self._columns.values())
+    
+    @classmethod
+    def build(cls, entries, roots: List[str], presorted: bool = False) -> "_LocationStore":
+        """
+        (디렉토리, 파일 이름, 위도, 경도, 고도 또는 None, 촬영 시각 또는 None) 항목들로 저장소를 만듭니다.
+        행은 경로 순서로 정렬되어 조회 결과와 커서가 결정적입니다. presorted이면 entries가 이미
+        (디렉토리, 파일 이름) 순서라고 보고 목록으로 모으지 않고 한 번에 하나씩 열 배열에 추가합니다.
+        
+        조회와 달리 색인은 메모리에서 이루어집니다. 열 배열(사진 한 장당 약 65바이트 + 파일 이름) 외에,
+        정렬 인덱스를 만드는 동안 Python 정수/실수 목록이 잠시 사진 한 장당 약 90바이트를 더 사용합니다.
+        """
+        if not presorted:
+            entries = sorted(entries, key=lambda entry: (entry[0], entry[1]))
+        arrays = {name: array(typecode) for name, typecode in cls.COLUMNS}
+        directory_ids: Dict[str, int] = {}
+        names = bytearray()
+        arrays["name_offsets"].append(0)
+        for directory, name, latitude, longitude, altitude, taken_at in entries:
+            if directory not in directory_ids:
+                directory_ids[directory] = len(directory_ids)
+            arrays["latitude"].append(latitude)
+            arrays["longitude"].append(longitude)
+            arrays["altitude"].append(math.nan if altitude is None else altitude)
+            arrays["taken_at"].append(math.nan if taken_at is None else taken_at)
+            arrays["dir_id"].append(directory_ids[directory])
+            names += name.encode("utf-8")
+            arrays["name_offsets"].append(len(names))
+        arrays["names"] = array("B", names)
+        dirs = bytearray()
+        arrays["dir_offsets"].append(0)
+        for directory in directory_ids:
+            dirs += directory.encode("utf-8")
+            arrays["dir_offsets"].append(len(dirs))
+        arrays["dirs"] = array("B", dirs)
+        # 범위 조회용 정렬 인덱스 (촬영 시각이 없는 행은 맨 뒤)
+        count = len(arrays["latitude"])
+        arrays["lat_order"] = array("I", sorted(range(count), key=arrays["latitude"].__getitem__))
+        arrays["time_order"] = array("I", sorted(
+            range(count), key=lambda row: _nan_last(arrays["taken_at"][row])
+        ))
+        columns = {name: memoryview(arrays[name]) for name, _ in cls.COLUMNS}
+        return cls(columns, sorted(roots), os.urandom(8).hex())
+    
+    @classmethod
+    def open(cls, path: Path) -> "_LocationStore":
+        """카탈로그 파일을 mmap으로 엽니다. 형식이 맞지 않으면 ValueError."""
+        with open(path, "rb") as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapping)
+        if bytes(view[:8]) != cls.MAGIC:
+            raise ValueError("카탈로그 파일 형식이 아닙니다")
+        header_length = int.from_bytes(view[8:16], "little")
+        header = json.loads(bytes(view[16:16 + header_length]).decode("utf-8"))
+        if header.get("byteorder") != sys.byteorder:
+            raise ValueError("다른 바이트 순서로 만든 카탈로그입니다")
+        columns = {}
+        for name, typecode in cls.COLUMNS:
+            spec = header["columns"].get(name)
+            if spec is None or spec["type"] != typecode:
+                raise ValueError(f"카탈로그에 열이 없습니다: {name}")
+            end = spec["offset"] + spec["nbytes"]
+            if end > len(view):
+                raise ValueError("카탈로그 파일이 잘렸습니다")
+            columns[name] = view[spec["offset"]:end].cast(typecode)
+        return cls(columns, header["roots"], header["generation"], str(path), mapping, view)
+    
+    def close(self) -> None:
+        """mmap을 닫습니다 (Windows에서 매핑된 파일을 교체하기 전에 필요)."""
+        if self._mapping is None:
+            return
+        for column in self._columns.values():
+            column.release()
+        self._mapping_view.release()
+        self._mapping.close()
+        self._mapping = None
+    
+    def save(self, path: Path) -> None:
+        """임시 파일에 쓴 뒤 교체하여 원자적으로 저장합니다."""
+        relative_offsets = {}
+        offset = 0
+        for name, _ in self.COLUMNS:
+            relative_offsets[name] = offset
+            offset += (self._columns[name].nbytes + 7) // 8 * 8
+        # 열 위치는 헤더 길이에 따라 달라지므로 헤더가 들어갈 공간이 정해질 때까지 반복
+        data_start = 16
+        while True:
+            header = {
+                "byteorder": sys.byteorder, "count": len(self), "roots": self.roots,
+                "generation": self.generation,
+                "columns": {
+                    name: {"type": typecode, "offset": data_start + relative_offsets[name],
+                           "nbytes": self._columns[name].nbytes}
+                    for name, typecode in self.COLUMNS
+                }
+            }
+            header_bytes = json.dumps(header).encode("utf-8")
+            needed = (16 + len(header_bytes) + 7) // 8 * 8
+            if needed <= data_start:
+                break
+            data_start = needed
+        
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(prefix=path.name + ".", suffix=".tmp", dir=str(path.parent))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(self.MAGIC)
+                f.write(len(header_bytes).to_bytes(8, "little"))
+                f.write(header_bytes)
+                f.write(b"\0" * (data_start - 16 - len(header_bytes)))
+                for name, _ in self.COLUMNS:
+                    column = self._columns[name]
+                    f.write(column)
+                    f.write(b"\0" * ((8 - column.nbytes % 8) % 8))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+    
+    def directory(self, row: int) -> str:
+        return self._directories[self.dir_id[row]]
+    
+    def name(self, row: int) -> str:
+        offsets = self._columns["name_offsets"]
+        return bytes(self._columns["names"][offsets[row]:offsets[row + 1]]).decode("utf-8")
+    
+    def path(self, row: int) -> str:
+        return os.path.join(self.directory(row), self.name(row))
+    
+    def taken_at_of(self, row: int) -> Optional[float]:
+        value = self.taken_at[row]
+        return None if math.isnan(value) else value
+    
+    def location(self, row: int) -> Dict[str, Any]:
+        """행의 위치를 extract_gps_from_exif와 같은 형식의 dict로 반환합니다."""
+        location = {"latitude": self.latitude[row], "longitude": self.longitude[row]}
+        altitude = self.altitude[row]
+        if not math.isnan(altitude):
+            location["altitude"] = altitude
+        return location
+    
+    def covers(self, dir_path: Path) -> bool:
+        """dir_path가 카탈로그에 색인된 루트 디렉토리 아래에 있는지 확인합니다."""
+        target = str(dir_path)
+        return any(target == root or target.startswith(root.rstrip(os.sep) + os.sep) for root in self.roots)
+    
+    def directory_ids_under(self, dir_path: Path) -> set:
+        """dir_path와 그 하위 디렉토리의 디렉토리 번호 집합."""
+        target = str(dir_path)
+        prefix = target.rstrip(os.sep) + os.sep
+        return {
+            index for index, directory in enumerate(self._directories)
+            if directory == target or directory.startswith(prefix)
+        }
+    
+    def iter_within_radius(self, center_latitude: float, center_longitude: float, radius_km: float,
+                           inside: bool = True, dir_ids: Optional[set] = None, start: int = 0,
+                           control: Optional["_ScanControl"] = None):
+        """
+        반경 내(inside=True) 또는 반경 외 행을 (행 번호, 거리 km)로 yield합니다.
+        위도 열과 경도 열을 복사 없이 순회하며, 반경 내 조회는 위도 차이로 먼저 걸러낸 뒤에만
+        Haversine 거리를 계산합니다.
+        """
+        latitude_margin = radius_km / 111.19 + 1e-9
+        latitudes = self.latitude[start:]
+        longitudes = self.longitude[start:]
+        dir_column = self.dir_id[start:]
+        row = start
+        for latitude, longitude, dir_id in zip(latitudes, longitudes, dir_column):
+            if control is not None and row % CATALOG_SCAN_STRIDE == 0:
+                control.check()
+                control.scanned = row
+            if dir_ids is None or dir_id in dir_ids:
+                if abs(latitude - center_latitude) > latitude_margin:
+                    if not inside:
+                        yield row, calculate_distance(center_latitude, center_longitude, latitude, longitude)
+                else:
+                    distance = calculate_distance(center_latitude, center_longitude, latitude, longitude)
+                    if (distance <= radius_km) == inside:
+                        yield row, distance
+            row += 1
+        if control is not None:
+            control.scanned = row
+    
+    def candidate_rows(self, latitude_range=None, time_range=None):
+        """
+        조회 계획: 위도 범위와 촬영 시각 범위 중 정렬 인덱스로 더 적은 행을 고르는 쪽을 선택합니다.
+        
+        Returns:
+            (사용한 인덱스 이름 "latitude" | "taken_at" | "scan", 후보 행 번호 시퀀스)
+        """
+        best_name, best_rows = "scan", range(len(self))
+        for name, bounds, values, order in (
+            ("latitude", latitude_range, self.latitude, self._columns["lat_order"]),
+            ("taken_at", time_range, self.taken_at, self._columns["time_order"]),
+        ):
+            if bounds is None:
+                continue
+            view = _SortedColumnView(values, order)
+            low = bisect.bisect_left(view, bounds[0]) if bounds[0] is not None else 0
+            high = bisect.bisect_right(view, bounds[1]) if bounds[1] is not None else \
+                bisect.bisect_left(view, math.inf)
+            if high - low < len(best_rows):
+                best_name, best_rows = name, order[low:high]
+        return best_name, best_rows
+    
+    def merged_with(self, other: "_LocationStore", replaced_root: str) -> "_LocationStore":
+        """replaced_root 아래 행을 other의 행으로 바꾼 새 저장소를 만듭니다."""
+        replaced = self.directory_ids_under(Path(replaced_root))
+        
+        def entries(store, skip):
+            for row in range(len(store)):
+                if store.dir_id[row] in skip:
+                    continue
+                altitude = store.altitude[row]
+                yield (store.directory(row), store.name(row), store.latitude[row],
+                       store.longitude[row], None if math.isnan(altitude) else altitude,
+                       store.taken_at_of(row))
+        
+        # 두 저장소 모두 경로 순서이므로 병합하며 바로 새 열 배열에 추가 (전체 행을 튜플 목록으로 모으지 않음)
+        merged = heapq.merge(entries(self, replaced), entries(other, set()), key=lambda entry: (entry[0], entry[1]))
+        prefix = replaced_root.rstrip(os.sep) + os.sep
+        roots = [root for root in self.roots if root != replaced_root and not root.startswith(prefix)]
+        return _LocationStore.build(merged, roots + other.roots, presorted=True)
+
+
+def _load_location_catalog() -> Optional[_LocationStore]:
+    """시작 시 카탈로그 파일이 있으면 mmap으로 엽니다 (없거나 손상되었으면 None)."""
+    try:
+        if LOCATION_CATALOG_PATH.is_file():
+            return _LocationStore.open(LOCATION_CATALOG_PATH)
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+
+_location_catalog: Optional[_LocationStore] = _load_location_catalog()
+_location_catalog_lock = threading.Lock()
+
+
+# ---------------------------------------------------------------------------
+# 밀도 히트맵 타일 피라미드
+#
+# 웹 메르카토르(슬리피 맵) 타일 좌표로 사진 수를 집계합니다. 가장 높은 줌 레벨에서만 좌표를
+# 타일로 변환하고, 낮은 줌 레벨은 바로 위 레벨의 타일 4개를 합쳐 만듭니다 ((x, y) -> (x//2, y//2)).
+# 만든 피라미드는 원본(카탈로그 세대 또는 디렉토리 지문)별로 보관하여 다른 줌 요청에 재사용합니다.
+# ---------------------------------------------------------------------------
+
+# 지원하는 최대 줌 레벨
+HEATMAP_MAX_ZOOM = 20
+
+# 웹 메르카토르가 표현할 수 있는 위도 한계
+_MERCATOR_MAX_LATITUDE = 85.05112878
+
+
+def _tile_xy(latitude: float, longitude: float, zoom: int):
+    """위도/경도를 해당 줌 레벨의 타일 좌표 (x, y)로 변환합니다."""
+    n = 1 << zoom
+    latitude = max(min(latitude, _MERCATOR_MAX_LATITUDE), -_MERCATOR_MAX_LATITUDE)
+    x = int((longitude + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(latitude))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def _tile_bounds(x: int, y: int, zoom: int) -> List[float]:
+    """타일의 [남, 서, 북, 동] 경계 (위도/경도)."""
+    n = 1 << zoom
+    
+    def tile_latitude(tile_y: int) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1.0 - 2.0 * tile_y / n))))
+    
+    return [tile_latitude(y + 1), x / n * 360.0 - 180.0, tile_latitude(y), (x + 1) / n * 360.0 - 180.0]
+
+
+class _TilePyramid:
+    """
+    줌 레벨별 타일 사진 수 {(x, y): 개수}를 보관하는 피라미드입니다.
+    base_zoom 레벨만 좌표로부터 계산하고, 그 아래 레벨은 위 레벨에서 합산합니다.
+    """
+    
+    def __init__(self, base_zoom: int):
+        self.base_zoom = base_zoom
+        self.levels: Dict[int, Dict[tuple, int]] = {base_zoom: {}}
+        self.total = 0
+    
+    def add(self, latitude: float, longitude: float) -> None:
+        tile = _tile_xy(latitude, longitude, self.base_zoom)
+        base = self.levels[self.base_zoom]
+        base[tile] = base.get(tile, 0) + 1
+        self.total += 1
+    
+    def finish(self) -> "_TilePyramid":
+        """base_zoom 아래 모든 레벨을 위 레벨의 타일 4개씩 합쳐서 만듭니다."""
+        for zoom in range(self.base_zoom - 1, -1, -1):
+            level: Dict[tuple, int] = {}
+            for (x, y), count in self.levels[zoom + 1].items():
+                parent = (x >> 1, y >> 1)
+                level[parent] = level.get(parent, 0) + count
+            self.levels[zoom] = level
+        return self
+    
+    def cells(self, zoom: int, bounds: Optional[List[float]] = None, max_cells: Optional[int] = None):
+        """
+        줌 레벨의 타일 목록을 사진 수가 많은 순서로 반환합니다.
+        bounds([남, 서, 북, 동])가 주어지면 그 영역과 겹치는 타일만 포함합니다.
+        서 > 동이면 날짜변경선(경도 ±180)을 넘는 영역으로 보고 [서, 180]과 [-180, 동] 두 구간을 포함합니다.
+        """
+        level = self.levels[zoom]
+        tiles = level.items()
+        if bounds is not None:
+            south, west, north, east = bounds
+            x_min, y_max = _tile_xy(south, west, zoom)
+            x_max, y_min = _tile_xy(north, east, zoom)
+            if west <= east:
+                tiles = [(tile, count) for tile, count in tiles
+                         if x_min <= tile[0] <= x_max and y_min <= tile[1] <= y_max]
+            else:
+                tiles = [(tile, count) for tile, count in tiles
+                         if (tile[0] >= x_min or tile[0] <= x_max) and y_min <= tile[1] <= y_max]
+        tiles = sorted(tiles, key=lambda entry: (-entry[1], entry[0]))
+        truncated = max_cells is not None and len(tiles) > max_cells
+        if truncated:
+            tiles = tiles[:max_cells]
+        return tiles, truncated
+
+
+# 원본별 피라미드 캐시 (키: 원본 식별자, 값: _TilePyramid)
+_tile_pyramids: "OrderedDict[str, _TilePyramid]" = OrderedDict()
+_tile_pyramids_lock = threading.Lock()
+_TILE_PYRAMID_CACHE_SIZE = 8
+
+
+@mcp.tool()
+@_profiled
+def get_photo_location(image_path: str, deadline_ms: Optional[int] = None) -> str:
+    """
+    사진 파일에서 GPS 위치 정보를 추출합니다.
+    
+    Args:
+        image_path: 이미지 파일의 경로
+        deadline_ms: 호출당 시간 예산 (밀리초). 주소 변환이 예산 안에 끝나지 않으면
+            주소 대신 address_handle을 partial=true와 함께 반환
+        
+    Returns:
+        JSON 형식의 위치 정보 (위도, 경도, 고도)
+    """
+    control = _ScanControl()
+    control.set_deadline(deadline_ms)
+    path = Path(image_path)
+    
+    if deadline_ms is not None and deadline_ms <= 0:
+        return json.dumps({"error": "deadline_ms는 0보다 커야 합니다."}, ensure_ascii=False)
+    
+    if not path.exists():
+        return json.dumps({"error": f"파일을 찾을 수 없습니다: {image_path}"}, ensure_ascii=False)
     
     if not path.is_file():
         return json.dumps({"error": f"파일이 아닙니다: {image_path}"}, ensure_ascii=False)
     
     # 지원하는 이미지 형식 확인
-    supported_formats = {'.jpg', '.jpeg', '.tiff', '.tif', '.png'}
-    if path.suffix.lower() not in supported_formats:
+    if path.suffix.lower() not in SUPPORTED_IMAGE_FORMATS:
         return json.dumps({
             "error": f"지원하지 않는 파일 형식입니다: {path.suffix}",
-            "supported_formats": list(supported_formats)
+            "supported_formats": sorted(SUPPORTED_IMAGE_FORMATS)
         }, ensure_ascii=False)
     
     gps_data = extract_gps_from_exif(str(path))
@@ -221,27 +3014,29 @@ def get_photo_location(image_path: str) -> str:
     if "error" in gps_data:
         return json.dumps(gps_data, ensure_ascii=False)
     
-    # 주소 정보 가져오기
-    address = None
-    if "latitude" in gps_data and "longitude" in gps_data:
-        address = reverse_geocode(gps_data["latitude"], gps_data["longitude"])
-    
     result = {
         "image_path": str(path),
         "location": gps_data,
         "google_maps_url": f"https://www.google.com/maps?q={gps_data.get('latitude')},{gps_data.get('longitude')}"
     }
     
-    if address:
-        result["address"] = address
+    # 주소 정보 가져오기 (시간 예산이 있으면 남은 시간 안에서만)
+    _attach_address(result, gps_data, "sync", control)
+    if deadline_ms is not None:
+        result["partial"] = "address_handle" in result
     
     return json.dumps(result, ensure_ascii=False, indent=2)
 
 
-def _get_photo_location_from_base64_impl(image_base64: str, image_format: str = "jpg") -> str:
+def _get_photo_location_from_base64_impl(image_base64: str, image_format: str = "jpg",
+                                         deadline_ms: Optional[int] = None) -> str:
     """
     Base64로 인코딩된 이미지 데이터에서 GPS 위치 정보를 추출하는 내부 구현 함수.
     """
+    if deadline_ms is not None and deadline_ms <= 0:
+        return json.dumps({"error": "deadline_ms는 0보다 커야 합니다."}, ensure_ascii=False)
+    control = _ScanControl()
+    control.set_deadline(deadline_ms)
     try:
         # data URI 형식 처리 (data:image/jpeg;base64,...)
         if image_base64.startswith("data:"):
@@ -256,6 +3051,8 @@ def _get_photo_location_from_base64_impl(image_base64: str, image_format: str =
                     image_format = "png"
                 elif mime_type in ["tiff", "tif"]:
                     image_format = "tiff"
+                elif mime_type in ["heic", "heif", "webp"]:
+                    image_format = mime_type
         else:
             encoded = image_base64
         
@@ -263,7 +3060,7 @@ def _get_photo_location_from_base64_impl(image_base64: str, image_format: str =
         image_data = base64.b64decode(encoded)
         
         # 지원하는 이미지 형식 확인
-        supported_formats = {'jpg', 'jpeg', 'tiff', 'tif', 'png'}
+        supported_formats = {'jpg', 'jpeg', 'tiff', 'tif', 'png', 'heic', 'heif', 'webp'}
         if image_format.lower() not in supported_formats:
             return json.dumps({
                 "error": f"지원하지 않는 이미지 형식입니다: {image_format}",
@@ -276,7 +3073,10 @@ def _get_photo_location_from_base64_impl(image_base64: str, image_format: str =
             'jpeg': '.jpg',
             'png': '.png',
             'tiff': '.tiff',
-            'tif': '.tif'
+            'tif': '.tif',
+            'heic': '.heic',
+            'heif': '.heif',
+            'webp': '.webp'
         }
         suffix = suffix_map.get(image_format.lower(), '.jpg')
         
@@ -297,11 +3097,6 @@ def _get_photo_location_from_base64_impl(image_base64: str, image_format: str =
             if "error" in gps_data:
                 return json.dumps(gps_data, ensure_ascii=False)
             
-            # 주소 정보 가져오기
-            address = None
-            if "latitude" in gps_data and "longitude" in gps_data:
-                address = reverse_geocode(gps_data["latitude"], gps_data["longitude"])
-            
             result = {
                 "image_format": image_format,
                 "image_size_bytes": len(image_data),
@@ -309,8 +3104,10 @@ def _get_photo_location_from_base64_impl(image_base64: str, image_format: str =
                 "google_maps_url": f"https://www.google.com/maps?q={gps_data.get('latitude')},{gps_data.get('longitude')}"
             }
             
-            if address:
-                result["address"] = address
+            # 주소 정보 가져오기 (시간 예산이 있으면 남은 시간 안에서만)
+            _attach_address(result, gps_data, "sync", control)
+            if deadline_ms is not None:
+                result["partial"] = "address_handle" in result
             
             return json.dumps(result, ensure_ascii=False, indent=2)
             
@@ -323,158 +3120,1405 @@ def _get_photo_location_from_base64_impl(image_base64: str, image_format: str =
                 
     except base64.binascii.Error:
         return json.dumps({
-            "error": "잘못된 Base64 인코딩입니다."
+            "error": "잘못된 Base64 인코딩입니다."
+        }, ensure_ascii=False)
+    except Exception as e:
+        return json.dumps({
+            "error": f"이미지 처리 중 오류 발생: {str(e)}"
+        }, ensure_ascii=False)
+
+
+@mcp.tool()
+@_profiled
+def get_photo_location_from_base64(image_base64: str, image_format: str = "jpg",
+                                   deadline_ms: Optional[int] = None) -> str:
+    """
+    Base64로 인코딩된 이미지 데이터에서 GPS 위치 정보를 추출합니다.
+    
+    Args:
+        image_base64: Base64로 인코딩된 이미지 데이터 (data URI 형식 또는 순수 base64 문자열)
+        image_format: 이미지 형식 ("jpg", "jpeg", "png", "tiff", "tif", "heic", "heif", "webp"), 기본값: "jpg"
+        deadline_ms: 호출당 시간 예산 (밀리초). 주소 변환이 예산 안에 끝나지 않으면
+            주소 대신 address_handle을 partial=true와 함께 반환
+        
+    Returns:
+        JSON 형식의 위치 정보 (위도, 경도, 고도)
+    """
+    return _get_photo_location_from_base64_impl(image_base64, image_format, deadline_ms)
+
+
+# ---------------------------------------------------------------------------
+# 바이너리 업로드 엔드포인트 (SSE/HTTP transport 전용)
+#
+# get_photo_location_from_base64는 이미지를 base64로 33% 부풀려 JSON-RPC 메시지에 담아야 하고,
+# 서버는 전체 문자열을 버퍼링하고 디코딩한 뒤 임시 파일에 씁니다. 업로드 경로는 원본 바이트
+# (또는 여러 파일을 담은 multipart/form-data)를 받아 도착하는 대로 EXIF 탐색기에 전달하고,
+# 메타데이터를 다 읽는 즉시 GPS를 추출합니다. 나머지 본문(픽셀 데이터)은 버퍼에 담지 않고 버립니다.
+#
+#   curl --data-binary @IMG_001.jpg "http://localhost:8000/upload?address_mode=none"
+#   curl -F file=@a.jpg -F file=@b.heic http://localhost:8000/upload
+# ---------------------------------------------------------------------------
+
+UPLOAD_ROUTE_PATH = os.getenv("UPLOAD_ROUTE_PATH", "/upload")
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(512 * 1024 * 1024)))
+UPLOAD_MAX_FILES = int(os.getenv("UPLOAD_MAX_FILES", "100"))
+
+
+def _json_response(payload: Dict[str, Any], status_code: int = 200, indent: Optional[int] = 2) -> Response:
+    return Response(json.dumps(payload, ensure_ascii=False, indent=indent), status_code=status_code,
+                    media_type="application/json")
+
+
+def _import_multipart():
+    """
+    업로드 경로에서만 쓰는 python-multipart를 첫 요청 때 불러옵니다.
+    stdio transport만 쓰는 환경에서는 이 패키지가 없어도 서버가 시작됩니다.
+    """
+    try:
+        from python_multipart import multipart
+    except ImportError:
+        # python-multipart 0.0.13 미만은 multipart 모듈 이름을 사용
+        from multipart import multipart
+    return multipart
+
+
+def _upload_location_result(stream: _StreamExifLocator) -> tuple:
+    """탐색이 끝난 스트림에서 결과 항목과 GPS 정보(없으면 None)를 만듭니다."""
+    result: Dict[str, Any] = {"image_format": stream.container}
+    if stream.container is None:
+        result["error"] = "지원하지 않는 이미지 형식입니다."
+        result["supported_formats"] = ["jpeg", "tiff", "png", "webp", "heic/heif"]
+        return result, None
+    result["metadata_bytes_read"] = stream.bytes_read_at_done
+    if stream.exif_bytes is None:
+        result["message"] = "이 이미지에는 GPS 위치 정보가 없습니다."
+        return result, None
+    try:
+        gps_data = _gps_from_exif_dict(piexif.load(stream.exif_bytes))
+    except Exception as e:
+        result["error"] = f"EXIF 파싱 중 오류 발생: {str(e)}"
+        return result, None
+    if gps_data is None:
+        result["message"] = "이 이미지에는 GPS 위치 정보가 없습니다."
+        return result, None
+    result["location"] = gps_data
+    result["google_maps_url"] = f"https://www.google.com/maps?q={gps_data.get('latitude')},{gps_data.get('longitude')}"
+    return result, gps_data
+
+
+@mcp.custom_route(UPLOAD_ROUTE_PATH, methods=["POST"])
+async def upload_photo_location(request: Request) -> Response:
+    """
+    업로드된 이미지 바이트에서 GPS 위치 정보를 추출합니다.
+    
+    본문이 multipart/form-data이면 파일 파트마다, 그 외에는 본문 전체를 이미지 하나로 처리합니다.
+    쿼리 파라미터: address_mode ("sync", "deferred", "none", 기본값: "sync"), deadline_ms
+    """
+    address_mode = request.query_params.get("address_mode", "sync")
+    if address_mode not in ADDRESS_MODES:
+        return _json_response({"error": "address_mode는 'sync', 'deferred', 'none' 중 하나여야 합니다."}, 400)
+    deadline_ms = None
+    if "deadline_ms" in request.query_params:
+        try:
+            deadline_ms = int(request.query_params["deadline_ms"])
+        except ValueError:
+            deadline_ms = 0
+        if deadline_ms <= 0:
+            return _json_response({"error": "deadline_ms는 0보다 커야 합니다."}, 400)
+    
+    try:
+        multipart_module = _import_multipart()
+    except ImportError:
+        return _json_response({"error": "업로드 경로를 사용하려면 python-multipart 패키지를 설치하세요."}, 501)
+    
+    # 업로드도 단일 사진 조회와 같은 lookup 격벽을 사용
+    bulkhead = _concurrency_limits.lookup
+    if not await bulkhead.acquire():
+        return _json_response({
+            "error": f"서버가 과부하 상태입니다 ({bulkhead.name} 대기열 가득 참). 잠시 후 다시 시도하세요.",
+            "limit": bulkhead.status(),
+            "retryable": True
+        }, 503)
+    try:
+        control = _ScanControl()
+        control.set_deadline(deadline_ms)
+        parse_options_header = multipart_module.parse_options_header
+        content_type, params = parse_options_header(request.headers.get("content-type", ""))
+        multipart = content_type == b"multipart/form-data" and b"boundary" in params
+        
+        files: List[Dict[str, Any]] = []
+        current: Dict[str, Any] = {}
+        header: Dict[str, bytearray] = {"field": bytearray(), "value": bytearray()}
+        skipped_files = 0
+        total_bytes = 0
+        part_open = False
+        malformed = None
+        
+        async with anyio.create_task_group() as task_group:
+            def on_done(entry: Dict[str, Any]) -> None:
+                # 메타데이터를 다 읽는 즉시 GPS를 추출하고, 나머지 본문을 받는 동안 주소 변환 시작
+                result, gps_data = _upload_location_result(entry["stream"])
+                entry["result"] = result
+                if gps_data is not None and address_mode != "none":
+                    task_group.start_soon(functools.partial(
+                        anyio.to_thread.run_sync, _attach_address, result, gps_data, address_mode, control
+                    ))
+            
+            def feed(entry: Dict[str, Any], chunk) -> None:
+                if entry["stream"].feed(chunk) and entry.get("result") is None:
+                    on_done(entry)
+            
+            def finish(entry: Dict[str, Any]) -> None:
+                entry["stream"].finish()
+                if entry.get("result") is None:
+                    on_done(entry)
+                entry["result"]["image_size_bytes"] = entry["stream"].total_bytes
+            
+            def on_part_begin() -> None:
+                nonlocal part_open
+                part_open = True
+                current.clear()
+            
+            def on_header_end() -> None:
+                name = bytes(header["field"]).strip().lower()
+                if name == b"content-disposition":
+                    _, disposition = parse_options_header(bytes(header["value"]))
+                    if b"filename" in disposition:
+                        current["filename"] = disposition[b"filename"].decode("utf-8", "replace")
+                header["field"].clear()
+                header["value"].clear()
+            
+            def on_headers_finished() -> None:
+                nonlocal skipped_files
+                # 파일이 아닌 폼 필드와 최대 개수를 넘는 파일은 읽지 않고 버림
+                if "filename" not in current:
+                    return
+                if len(files) >= UPLOAD_MAX_FILES:
+                    skipped_files += 1
+                    return
+                current["stream"] = _StreamExifLocator()
+                files.append(current.copy())
+                current["entry"] = files[-1]
+            
+            def on_part_data(data: bytes, start: int, end: int) -> None:
+                if "entry" in current:
+                    feed(current["entry"], memoryview(data)[start:end])
+            
+            def on_part_end() -> None:
+                nonlocal part_open
+                part_open = False
+                if "entry" in current:
+                    finish(current["entry"])
+            
+            parser = None
+            if multipart:
+                parser = multipart_module.MultipartParser(params[b"boundary"], {
+                    "on_part_begin": on_part_begin,
+                    "on_header_field": lambda data, start, end: header["field"].extend(data[start:end]),
+                    "on_header_value": lambda data, start, end: header["value"].extend(data[start:end]),
+                    "on_header_end": on_header_end,
+                    "on_headers_finished": on_headers_finished,
+                    "on_part_data": on_part_data,
+                    "on_part_end": on_part_end
+                })
+            else:
+                files.append({"stream": _StreamExifLocator()})
+            
+            async for chunk in request.stream():
+                total_bytes += len(chunk)
+                if total_bytes > UPLOAD_MAX_BYTES:
+                    task_group.cancel_scope.cancel()
+                    return _json_response({
+                        "error": f"업로드 크기 제한({UPLOAD_MAX_BYTES}바이트)을 초과했습니다."
+                    }, 413)
+                if parser is not None:
+                    try:
+                        parser.write(chunk)
+                    except multipart_module.MultipartParseError as e:
+                        malformed = str(e)
+                        break
+                else:
+                    feed(files[0], chunk)
+            if parser is not None:
+                if malformed is None:
+                    parser.finalize()
+                    # finalize()는 잘린 본문에도 오류를 내지 않으므로, 끝나지 않은 파트를 직접 확인
+                    if part_open:
+                        malformed = "마지막 파트가 끝나기 전에 본문이 끝났습니다."
+                if malformed is not None:
+                    task_group.cancel_scope.cancel()
+                    return _json_response({
+                        "error": f"multipart 본문이 잘렸거나 형식이 잘못되었습니다: {malformed}"
+                    }, 400)
+            else:
+                finish(files[0])
+        
+        for entry in files:
+            if deadline_ms is not None and "location" in entry["result"]:
+                entry["result"]["partial"] = "address_handle" in entry["result"]
+        
+        if not multipart:
+            result = files[0]["result"]
+            return _json_response(result, 400 if "error" in result else 200)
+        
+        results = []
+        for entry in files:
+            results.append({"filename": entry["filename"], **entry["result"]})
+        return _json_response({
+            "total_files": len(results),
+            "images_with_location": sum(1 for item in results if "location" in item),
+            "skipped_files": skipped_files,
+            "total_bytes": total_bytes,
+            "results": results
+        })
+    finally:
+        bulkhead.release()
+
+
+def _batch_get_photo_locations_impl(
+    directory_path: str,
+    address_mode: str = "sync",
+    recursive: bool = False,
+    include_patterns: Optional[List[str]] = None,
+    exclude_patterns: Optional[List[str]] = None,
+    max_depth: Optional[int] = None,
+    page_size: Optional[int] = None,
+    cursor: Optional[str] = None,
+    deadline_ms: Optional[int] = None,
+    control: Optional[_ScanControl] = None
+) -> str:
+    """
+    디렉토리 내의 모든 사진 파일에서 GPS 위치 정보를 일괄 추출하는 내부 구현 함수.
+    control로 진행 상황을 기록하고 취소 신호를 받습니다.
+    """
+    dir_path = Path(directory_path)
+    
+    if not dir_path.exists():
+        return json.dumps({"error": f"디렉토리를 찾을 수 없습니다: {directory_path}"}, ensure_ascii=False)
+    
+    # ZIP/tar 압축 파일이면 압축을 풀지 않고 멤버를 직접 스캔
+    archive_kind = _archive_kind(dir_path) if dir_path.is_file() else None
+    if not dir_path.is_dir() and archive_kind is None:
+        return json.dumps({"error": f"디렉토리 또는 ZIP/tar 압축 파일이 아닙니다: {directory_path}"}, ensure_ascii=False)
+    
+    if address_mode not in ADDRESS_MODES:
+        return json.dumps({
+            "error": "address_mode는 'sync', 'deferred', 'none' 중 하나여야 합니다."
+        }, ensure_ascii=False)
+    
+    if max_depth is not None and max_depth < 0:
+        return json.dumps({"error": "max_depth는 0 이상이어야 합니다."}, ensure_ascii=False)
+    
+    if page_size is not None and page_size < 1:
+        return json.dumps({"error": "page_size는 1 이상이어야 합니다."}, ensure_ascii=False)
+    
+    if deadline_ms is not None and deadline_ms <= 0:
+        return json.dumps({"error": "deadline_ms는 0보다 커야 합니다."}, ensure_ascii=False)
+    
+    control = control or _ScanControl()
+    control.set_deadline(deadline_ms)
+    
+    depth_limit = max_depth if recursive else 0
+    options = (tuple(include_patterns or ()), tuple(exclude_patterns or ()), depth_limit)
+    query_key = _query_key("batch_get_photo_locations", dir_path, {
+        "address_mode": address_mode,
+        "options": options
+    })
+    
+    start_offset = None
+    if cursor is not None:
+        start_offset = _decode_cursor(cursor, query_key)
+        if start_offset is None:
+            return json.dumps({"error": "유효하지 않은 cursor입니다. 같은 인자로 받은 next_cursor를 사용하세요."}, ensure_ascii=False)
+    
+    # 같은 인자 + 변경 없는 디렉토리이면 캐시된 결과 반환
+    cache_key = _ResultCache.make_key(
+        "batch_get_photo_locations", dir_path,
+        {"address_mode": address_mode, "page_size": page_size, "cursor": cursor,
+         "deadline": deadline_ms is not None, "options": options},
+        *options
+    )
+    cached = _result_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    def build_item(relative_path: str, path: str, gps_data: Dict[str, Any]) -> Dict[str, Any]:
+        result_item = {
+            "filename": os.path.basename(path),
+            "path": path,
+            "location": gps_data,
+            "google_maps_url": f"https://www.google.com/maps?q={gps_data.get('latitude')},{gps_data.get('longitude')}"
+        }
+        if recursive:
+            result_item["relative_path"] = relative_path
+        return result_item
+    
+    source = None
+    if archive_kind is not None:
+        source = _buffered(
+            _iter_archive_records(dir_path, archive_kind, options, start_offset or 0, control),
+            PIPELINE_QUEUE_SIZE
+        )
+    encoded_items, next_cursor, partial = _run_photo_pipeline(
+        dir_path, options, build_item, address_mode, page_size, start_offset, query_key, control, source
+    )
+    
+    fields = {
+        "directory": str(dir_path),
+        "total_images": len(encoded_items)
+    }
+    if archive_kind is not None:
+        fields["archive"] = "tar" if archive_kind == "tar-stream" else archive_kind
+    if page_size is not None or cursor is not None or deadline_ms is not None:
+        fields["page_size"] = page_size
+        fields["next_cursor"] = next_cursor
+    if deadline_ms is not None:
+        fields["partial"] = partial
+    
+    output = _encode_result_document(fields, "images_with_location", encoded_items)
+    if not partial and control.addresses_complete:
+        _result_cache.put(cache_key, output, [str(dir_path.resolve()), *options])
+    return output
+
+
+def _geofence_photos_impl(
+    directory_path: str,
+    center_latitude: float,
+    center_longitude: float,
+    radius_km: float,
+    filter_mode: str = "inside",
+    address_mode: str = "sync",
+    page_size: Optional[int] = None,
+    cursor: Optional[str] = None,
+    deadline_ms: Optional[int] = None,
+    use_catalog: bool = False,
+    control: Optional[_ScanControl] = None
+) -> str:
+    """
+    지오펜싱으로 반경 내/외 사진을 필터링하는 내부 구현 함수.
+    control로 진행 상황을 기록하고 취소 신호를 받습니다.
+    use_catalog=True이면 파일 시스템 대신 위치 카탈로그의 배열을 직접 조회합니다.
+    """
+    dir_path = Path(directory_path)
+    catalog = _location_catalog if use_catalog else None
+    
+    if use_catalog:
+        dir_path = dir_path.resolve()
+        if catalog is None or not catalog.covers(dir_path):
+            return json.dumps({
+                "error": f"위치 카탈로그에 색인되지 않은 디렉토리입니다: {directory_path}. build_location_catalog를 먼저 실행하세요."
+            }, ensure_ascii=False)
+    elif not dir_path.exists():
+        return json.dumps({"error": f"디렉토리를 찾을 수 없습니다: {directory_path}"}, ensure_ascii=False)
+    
+    elif not dir_path.is_dir():
+        return json.dumps({"error": f"디렉토리가 아닙니다: {directory_path}"}, ensure_ascii=False)
+    
+    if filter_mode not in ["inside", "outside"]:
+        return json.dumps({
+            "error": "filter_mode는 'inside' 또는 'outside'여야 합니다."
+        }, ensure_ascii=False)
+    
+    if address_mode not in ADDRESS_MODES:
+        return json.dumps({
+            "error": "address_mode는 'sync', 'deferred', 'none' 중 하나여야 합니다."
+        }, ensure_ascii=False)
+    
+    if page_size is not None and page_size < 1:
+        return json.dumps({"error": "page_size는 1 이상이어야 합니다."}, ensure_ascii=False)
+    
+    if deadline_ms is not None and deadline_ms <= 0:
+        return json.dumps({"error": "deadline_ms는 0보다 커야 합니다."}, ensure_ascii=False)
+    
+    control = control or _ScanControl()
+    control.set_deadline(deadline_ms)
+    
+    arguments = {
+        "center_latitude": center_latitude,
+        "center_longitude": center_longitude,
+        "radius_km": radius_km,
+        "filter_mode": filter_mode,
+        "address_mode": address_mode
+    }
+    if catalog is not None:
+        # 카탈로그가 교체되면 이전 카탈로그의 커서는 무효
+        arguments["catalog"] = catalog.generation
+    query_key = _query_key("geofence_photos", dir_path, arguments)
+    
+    start_offset = None
+    if cursor is not None:
+        start_offset = _decode_cursor(cursor, query_key)
+        if start_offset is None:
+            return json.dumps({"error": "유효하지 않은 cursor입니다. 같은 인자로 받은 next_cursor를 사용하세요."}, ensure_ascii=False)
+    
+    # 같은 인자 + 변경 없는 디렉토리이면 캐시된 결과 반환
+    # (카탈로그 조회는 디렉토리를 순회하지 않는 것이 목적이므로 지문 기반 캐시를 사용하지 않음)
+    cache_key = None
+    if catalog is None:
+        cache_key = _ResultCache.make_key(
+            "geofence_photos", dir_path,
+            dict(arguments, page_size=page_size, cursor=cursor, deadline=deadline_ms is not None)
+        )
+        cached = _result_cache.get(cache_key)
+        if cached is not None:
+            return cached
+    
+    def build_item(relative_path: str, path: str, gps_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if "latitude" not in gps_data or "longitude" not in gps_data:
+            return None
+        distance = calculate_distance(
+            center_latitude,
+            center_longitude,
+            gps_data["latitude"],
+            gps_data["longitude"]
+        )
+        
+        is_inside = distance <= radius_km
+        
+        if (filter_mode == "inside" and not is_inside) or (filter_mode == "outside" and is_inside):
+            return None
+        return {
+            "filename": os.path.basename(path),
+            "path": path,
+            "location": gps_data,
+            "distance_km": round(distance, 2),
+            "google_maps_url": f"https://www.google.com/maps?q={gps_data.get('latitude')},{gps_data.get('longitude')}"
+        }
+    
+    source = None
+    if catalog is not None:
+        def catalog_records():
+            rows = catalog.iter_within_radius(
+                center_latitude, center_longitude, radius_km, filter_mode == "inside",
+                catalog.directory_ids_under(dir_path), start_offset or 0, control
+            )
+            for row, _ in rows:
+                path = catalog.path(row)
+                yield row, os.path.relpath(path, str(dir_path)), path, catalog.location(row)
+        source = catalog_records()
+    
+    encoded_items, next_cursor, partial = _run_photo_pipeline(
+        dir_path, ((), (), 0), build_item, address_mode, page_size, start_offset, query_key, control,
+        source
+    )
+    
+    fields = {
+        "directory": str(dir_path),
+        "center": {
+            "latitude": center_latitude,
+            "longitude": center_longitude
+        },
+        "radius_km": radius_km,
+        "filter_mode": filter_mode,
+        "total_matching_images": len(encoded_items)
+    }
+    if page_size is not None or cursor is not None or deadline_ms is not None:
+        fields["page_size"] = page_size
+        fields["next_cursor"] = next_cursor
+    if deadline_ms is not None:
+        fields["partial"] = partial
+    
+    output = _encode_result_document(fields, "images", encoded_items)
+    if cache_key is not None and not partial and control.addresses_complete:
+        _result_cache.put(cache_key, output, [str(dir_path.resolve()), (), (), 0])
+    return output
+
+
+@mcp.tool()
+@_profiled
+async def batch_get_photo_locations(
+    directory_path: str,
+    address_mode: str = "sync",
+    recursive: bool = False,
+    include_patterns: Optional[List[str]] = None,
+    exclude_patterns: Optional[List[str]] = None,
+    max_depth: Optional[int] = None,
+    page_size: Optional[int] = None,
+    cursor: Optional[str] = None,
+    deadline_ms: Optional[int] = None,
+    ctx: Optional[Context] = None
+) -> str:
+    """
+    디렉토리 내의 모든 사진 파일에서 GPS 위치 정보를 일괄 추출합니다.
+    진행 상황(스캔/파싱/주소 변환 개수)을 MCP 진행 알림으로 보내며, 클라이언트가 취소하면 즉시 중단합니다.
+    
+    Args:
+        directory_path: 이미지 파일들이 있는 디렉토리 경로, 또는 ZIP/tar(.tar.gz 등) 압축 파일 경로
+            (압축을 풀지 않고 멤버의 메타데이터만 읽음, 결과 경로는 "<압축 파일>/<멤버 경로>")
+        address_mode: 주소 해석 모드
+            - "sync": 모든 주소를 해석한 뒤 반환 (기본값)
+            - "deferred": 좌표를 즉시 반환하고 address_handle을 제공
+              (get_resolved_addresses로 나중에 주소 조회)
+            - "none": 주소를 해석하지 않음
+        recursive: True인 경우 하위 디렉토리까지 재귀적으로 스캔 (여러 프로세스로 분산 처리)
+        include_patterns: 포함할 파일 glob 패턴 목록 (예: ["*.heic", "2024/*"]), 파일명 또는 상대 경로와 비교
+        exclude_patterns: 제외할 파일/디렉토리 glob 패턴 목록 (예: [".thumbnails", "*/cache/*"])
+        max_depth: 재귀 스캔 최대 깊이 (None이면 제한 없음, 0이면 최상위 디렉토리만)
+        page_size: 한 번에 반환할 최대 사진 수 (None이면 전체를 한 번에 반환하므로 사진이 많으면 지정 권장)
+        cursor: 이전 응답의 next_cursor (다음 페이지 조회)
+        deadline_ms: 호출당 시간 예산 (밀리초). 초과하면 지금까지의 결과를 partial=true와
+            재개용 next_cursor와 함께 반환
+        
+    Returns:
+        JSON 형식의 위치 정보 리스트 (페이지 조회/시간 예산 지정 시 next_cursor 포함)
+    """
+    return await _run_with_progress(
+        ctx, _batch_get_photo_locations_impl,
+        directory_path, address_mode, recursive, include_patterns, exclude_patterns,
+        max_depth, page_size, cursor, deadline_ms
+    )
+
+
+@mcp.tool()
+@_profiled
+async def geofence_photos(
+    directory_path: str,
+    center_latitude: float,
+    center_longitude: float,
+    radius_km: float,
+    filter_mode: str = "inside",
+    address_mode: str = "sync",
+    page_size: Optional[int] = None,
+    cursor: Optional[str] = None,
+    deadline_ms: Optional[int] = None,
+    use_catalog: bool = False,
+    ctx: Optional[Context] = None
+) -> str:
+    """
+    지오펜싱(Geofencing) 기능: 특정 위치를 중심으로 반경 내/외에 있는 사진을 필터링합니다.
+    진행 상황을 MCP 진행 알림으로 보내며, 클라이언트가 취소하면 즉시 중단합니다.
+    
+    지오펜싱이란?
+    - 특정 지리적 경계(geographic boundary)를 정의하는 기술
+    - 지정한 중심점에서 반경 거리 내에 있는지 밖에 있는지 판단
+    - 예: "서울시청에서 5km 반경 내 사진", "집 주변 1km 내 사진" 등
+    
+    Args:
+        directory_path: 이미지 파일들이 있는 디렉토리 경로
+        center_latitude: 중심점의 위도
+        center_longitude: 중심점의 경도
+        radius_km: 반경 (킬로미터)
+        filter_mode: "inside" (반경 내) 또는 "outside" (반경 외)
+        address_mode: 주소 해석 모드 ("sync", "deferred", "none"), 기본값: "sync"
+            "deferred"인 경우 address_handle을 반환하며 get_resolved_addresses로 조회
+        page_size: 한 번에 반환할 최대 사진 수 (None이면 전체를 한 번에 반환하므로 사진이 많으면 지정 권장)
+        cursor: 이전 응답의 next_cursor (다음 페이지 조회)
+        deadline_ms: 호출당 시간 예산 (밀리초). 초과하면 지금까지의 결과를 partial=true와
+            재개용 next_cursor와 함께 반환
+        use_catalog: True인 경우 파일을 다시 읽지 않고 위치 카탈로그(build_location_catalog)에서 조회
+            (카탈로그에 색인된 하위 디렉토리 포함)
+        
+    Returns:
+        JSON 형식의 필터링된 사진 목록 (페이지 조회/시간 예산 지정 시 next_cursor 포함)
+    """
+    return await _run_with_progress(
+        ctx, _geofence_photos_impl,
+        directory_path, center_latitude, center_longitude, radius_km,
+        filter_mode, address_mode, page_size, cursor, deadline_ms, use_catalog
+    )
+
+
+def _build_location_catalog_impl(
+    directory_path: str,
+    recursive: bool = True,
+    include_patterns: Optional[List[str]] = None,
+    exclude_patterns: Optional[List[str]] = None,
+    max_depth: Optional[int] = None,
+    control: Optional[_ScanControl] = None
+) -> str:
+    """
+    디렉토리의 사진 위치를 추출하여 위치 카탈로그에 색인하는 내부 구현 함수.
+    같은 디렉토리를 다시 색인하면 그 디렉토리 아래 항목만 교체됩니다.
+    """
+    global _location_catalog
+    dir_path = Path(directory_path)
+    
+    if not dir_path.exists():
+        return json.dumps({"error": f"디렉토리를 찾을 수 없습니다: {directory_path}"}, ensure_ascii=False)
+    
+    if not dir_path.is_dir():
+        return json.dumps({"error": f"디렉토리가 아닙니다: {directory_path}"}, ensure_ascii=False)
+    
+    if max_depth is not None and max_depth < 0:
+        return json.dumps({"error": "max_depth는 0 이상이어야 합니다."}, ensure_ascii=False)
+    
+    control = control or _ScanControl()
+    dir_path = dir_path.resolve()
+    depth_limit = max_depth if recursive else 0
+    options = (tuple(include_patterns or ()), tuple(exclude_patterns or ()), depth_limit)
+    
+    entries = []
+    records = _iter_photo_records(dir_path, options, False, control=control, extractor=_extract_catalog_metadata)
+    for _, _, path, gps_data in records:
+        control.check()
+        if not gps_data or "latitude" not in gps_data or "longitude" not in gps_data:
+            continue
+        directory, name = os.path.split(path)
+        entries.append((directory, name, gps_data["latitude"], gps_data["longitude"],
+                        gps_data.get("altitude"), gps_data.get("taken_at")))
+    
+    with _location_catalog_lock:
+        store = _LocationStore.build(entries, [str(dir_path)])
+        previous = _location_catalog
+        if previous is not None:
+            store = previous.merged_with(store, str(dir_path))
+        try:
+            store.save(LOCATION_CATALOG_PATH)
+        except PermissionError:
+            # Windows에서는 mmap으로 열린 파일을 교체할 수 없으므로 이전 매핑을 닫고 다시 시도
+            if previous is None:
+                raise
+            _location_catalog = None
+            previous.close()
+            store.save(LOCATION_CATALOG_PATH)
+        _location_catalog = _LocationStore.open(LOCATION_CATALOG_PATH)
+        catalog = _location_catalog
+    
+    return json.dumps({
+        "directory": str(dir_path),
+        "indexed_images": len(entries),
+        "catalog_path": str(LOCATION_CATALOG_PATH),
+        "catalog_images": len(catalog),
+        "catalog_roots": catalog.roots,
+        "catalog_bytes": catalog.nbytes
+    }, ensure_ascii=False, indent=2)
+
+
+@mcp.tool()
+@_profiled
+async def build_location_catalog(
+    directory_path: str,
+    recursive: bool = True,
+    include_patterns: Optional[List[str]] = None,
+    exclude_patterns: Optional[List[str]] = None,
+    max_depth: Optional[int] = None,
+    ctx: Optional[Context] = None
+) -> str:
+    """
+    디렉토리의 사진 위치를 추출하여 디스크의 위치 카탈로그(열 지향 압축 저장소)에 색인합니다.
+    색인 후에는 geofence_photos(use_catalog=True)가 파일을 다시 읽지 않고 카탈로그에서 바로 조회합니다.
+    카탈로그는 서버 시작 시 mmap으로 즉시 로드됩니다 (LOCATION_CATALOG_PATH).
+    
+    Args:
+        directory_path: 색인할 디렉토리 경로 (다시 색인하면 이 디렉토리 아래 항목만 교체)
+        recursive: True인 경우 하위 디렉토리까지 재귀적으로 색인 (기본값)
+        include_patterns: 포함할 파일 glob 패턴 목록
+        exclude_patterns: 제외할 파일/디렉토리 glob 패턴 목록
+        max_depth: 재귀 스캔 최대 깊이 (None이면 제한 없음)
+        
+    Returns:
+        JSON 형식의 색인 결과 (색인한 사진 수, 카탈로그 전체 사진 수와 크기)
+    """
+    return await _run_with_progress(
+        ctx, _build_location_catalog_impl,
+        directory_path, recursive, include_patterns, exclude_patterns, max_depth
+    )
+
+
+def _photo_density_tiles_impl(
+    directory_path: str,
+    zoom_levels: Optional[List[int]] = None,
+    recursive: bool = True,
+    use_catalog: bool = False,
+    bounds: Optional[List[float]] = None,
+    max_cells: int = 5000,
+    control: Optional[_ScanControl] = None
+) -> str:
+    """
+    사진 좌표를 줌 레벨별 타일 개수로 집계하는 내부 구현 함수.
+    같은 원본의 피라미드가 있고 요청한 줌 레벨을 포함하면 다시 스캔하지 않습니다.
+    """
+    zoom_levels = sorted(set(zoom_levels if zoom_levels is not None else [4, 8, 12]))
+    dir_path = Path(directory_path)
+    catalog = _location_catalog if use_catalog else None
+    
+    if not zoom_levels or any(zoom < 0 or zoom > HEATMAP_MAX_ZOOM for zoom in zoom_levels):
+        return json.dumps({"error": f"zoom_levels는 0~{HEATMAP_MAX_ZOOM} 사이의 정수 목록이어야 합니다."}, ensure_ascii=False)
+    
+    if bounds is not None and (len(bounds) != 4 or bounds[0] > bounds[2]):
+        return json.dumps({
+            "error": "bounds는 [남, 서, 북, 동] 형식이어야 합니다 (남 <= 북, 서 > 동이면 날짜변경선을 넘는 영역)."
+        }, ensure_ascii=False)
+    
+    if max_cells < 1:
+        return json.dumps({"error": "max_cells는 1 이상이어야 합니다."}, ensure_ascii=False)
+    
+    if use_catalog:
+        dir_path = dir_path.resolve()
+        if catalog is None or not catalog.covers(dir_path):
+            return json.dumps({
+                "error": f"위치 카탈로그에 색인되지 않은 디렉토리입니다: {directory_path}. build_location_catalog를 먼저 실행하세요."
+            }, ensure_ascii=False)
+    elif not dir_path.exists():
+        return json.dumps({"error": f"디렉토리를 찾을 수 없습니다: {directory_path}"}, ensure_ascii=False)
+    
+    elif not dir_path.is_dir():
+        return json.dumps({"error": f"디렉토리가 아닙니다: {directory_path}"}, ensure_ascii=False)
+    
+    control = control or _ScanControl()
+    options = ((), (), None if recursive else 0)
+    if catalog is not None:
+        source_key = f"catalog:{catalog.generation}:{dir_path}"
+    else:
+        source_key = f"fs:{dir_path.resolve()}:{_recent_directory_fingerprint(dir_path, *options)}"
+    
+    base_zoom = zoom_levels[-1]
+    with _tile_pyramids_lock:
+        pyramid = _tile_pyramids.get(source_key)
+        if pyramid is not None:
+            _tile_pyramids.move_to_end(source_key)
+    
+    if pyramid is None or pyramid.base_zoom < base_zoom:
+        pyramid = _TilePyramid(base_zoom)
+        if catalog is not None:
+            # 카탈로그 배열을 복사 없이 순회
+            dir_ids = catalog.directory_ids_under(dir_path)
+            for row, (latitude, longitude, dir_id) in enumerate(
+                    zip(catalog.latitude, catalog.longitude, catalog.dir_id)):
+                if row % CATALOG_SCAN_STRIDE == 0:
+                    control.check()
+                    control.scanned = row
+                if dir_id in dir_ids:
+                    pyramid.add(latitude, longitude)
+            control.scanned = len(catalog)
+        else:
+            for _, _, _, gps_data in _iter_photo_records(dir_path, options, False, control=control):
+                control.check()
+                if gps_data and "latitude" in gps_data and "longitude" in gps_data:
+                    pyramid.add(gps_data["latitude"], gps_data["longitude"])
+        pyramid.finish()
+        with _tile_pyramids_lock:
+            _tile_pyramids[source_key] = pyramid
+            _tile_pyramids.move_to_end(source_key)
+            while len(_tile_pyramids) > _TILE_PYRAMID_CACHE_SIZE:
+                _tile_pyramids.popitem(last=False)
+    
+    levels = []
+    for zoom in zoom_levels:
+        tiles, truncated = pyramid.cells(zoom, bounds, max_cells)
+        max_count = tiles[0][1] if tiles else 0
+        cells = []
+        for (x, y), count in tiles:
+            south, west, north, east = _tile_bounds(x, y, zoom)
+            cells.append({
+                "x": x,
+                "y": y,
+                "count": count,
+                "weight": round(count / max_count, 4),
+                "center": {"latitude": round((south + north) / 2, 6), "longitude": round((west + east) / 2, 6)},
+                "bounds": [round(south, 6), round(west, 6), round(north, 6), round(east, 6)]
+            })
+        levels.append({
+            "zoom": zoom,
+            "tile_count": len(pyramid.levels[zoom]),
+            "max_count": max_count,
+            "truncated": truncated,
+            "cells": cells
+        })
+    
+    return json.dumps({
+        "directory": str(dir_path),
+        "total_images": pyramid.total,
+        "levels": levels
+    }, ensure_ascii=False, indent=2)
+
+
+@mcp.tool()
+@_profiled
+async def photo_density_tiles(
+    directory_path: str,
+    zoom_levels: Optional[List[int]] = None,
+    recursive: bool = True,
+    use_catalog: bool = False,
+    bounds: Optional[List[float]] = None,
+    max_cells: int = 5000,
+    ctx: Optional[Context] = None
+) -> str:
+    """
+    사진 좌표를 지도 타일(웹 메르카토르 z/x/y)별 사진 수로 집계하여 히트맵용 셀을 반환합니다.
+    주소 변환을 하지 않고 좌표 목록도 반환하지 않으므로 대량의 사진도 작은 응답으로 시각화할 수 있습니다.
+    가장 높은 줌 레벨만 좌표로 계산하고 낮은 줌 레벨은 위 레벨을 합쳐 만들며, 만든 피라미드는
+    재사용됩니다 (디렉토리나 카탈로그가 바뀌면 다시 계산).
+    
+    Args:
+        directory_path: 이미지 파일들이 있는 디렉토리 경로
+        zoom_levels: 집계할 줌 레벨 목록 (0~20), 기본값: [4, 8, 12]
+        recursive: True인 경우 하위 디렉토리 포함 (기본값)
+        use_catalog: True인 경우 파일을 다시 읽지 않고 위치 카탈로그에서 집계
+        bounds: [남, 서, 북, 동] 위도/경도 영역 (주어지면 겹치는 타일만 반환).
+            서 > 동이면 날짜변경선을 넘는 영역 (예: [-20, 170, -10, -170])
+        max_cells: 줌 레벨당 반환할 최대 타일 수 (사진 수가 많은 순), 기본값: 5000
+        
+    Returns:
+        JSON 형식의 줌 레벨별 타일 목록 (타일 좌표, 사진 수, 0~1 가중치, 중심 좌표, 경계)
+    """
+    return await _run_with_progress(
+        ctx, _photo_density_tiles_impl,
+        directory_path, zoom_levels, recursive, use_catalog, bounds, max_cells
+    )
+
+
+# query_photos 정렬 기준
+QUERY_SORT_KEYS = ("path", "taken_at", "altitude", "distance")
+
+
+def _parse_query_time(value: str, end_of_day: bool = False) -> float:
+    """
+    ISO 8601 날짜/시각 문자열을 카탈로그 촬영 시각 값(벽시계 기준 초)으로 변환합니다. 시간대는 무시합니다.
+    end_of_day가 True이고 값이 날짜만이면(예: "2024-05-01") 그날의 마지막 순간을 반환하므로,
+    상한(taken_before)으로 쓰면 그날 촬영한 사진이 모두 포함됩니다.
+    """
+    try:
+        day = date.fromisoformat(value)
+    except ValueError:
+        parsed = datetime.fromisoformat(value).replace(tzinfo=None)
+        return float(calendar.timegm(parsed.timetuple()))
+    if end_of_day:
+        # 다음 날 0시 직전 (EXIF 촬영 시각은 초 단위이므로 1마이크로초 앞이면 충분)
+        return calendar.timegm((day + timedelta(days=1)).timetuple()) - 1e-6
+    return float(calendar.timegm(day.timetuple()))
+
+
+def _longitude_in(longitude: float, west: float, east: float) -> bool:
+    """경도가 [서, 동] 구간에 있는지 확인합니다. 서 > 동이면 날짜변경선을 넘는 구간으로 봅니다."""
+    if west <= east:
+        return west <= longitude <= east
+    return longitude >= west or longitude <= east
+
+
+def _format_taken_at(value: float) -> str:
+    return datetime.fromtimestamp(value, timezone.utc).replace(tzinfo=None).isoformat()
+
+
+def _query_photos_impl(
+    directory_path: Optional[str] = None,
+    bbox: Optional[List[float]] = None,
+    center_latitude: Optional[float] = None,
+    center_longitude: Optional[float] = None,
+    radius_km: Optional[float] = None,
+    taken_after: Optional[str] = None,
+    taken_before: Optional[str] = None,
+    min_altitude: Optional[float] = None,
+    max_altitude: Optional[float] = None,
+    filename_pattern: Optional[str] = None,
+    has_address: Optional[bool] = None,
+    sort_by: str = "path",
+    descending: bool = False,
+    limit: int = 100,
+    address_mode: str = "none",
+    control: Optional[_ScanControl] = None
+) -> str:
+    """
+    위치 카탈로그에서 여러 조건을 한 번에 적용해 사진을 조회하는 내부 구현 함수.
+    위도 범위(bbox/반경)나 촬영 시각 범위는 정렬 인덱스로 후보를 줄이고, 나머지 조건은 후보 행에만 적용합니다.
+    """
+    catalog = _location_catalog
+    if catalog is None:
+        return json.dumps({"error": "위치 카탈로그가 없습니다. build_location_catalog를 먼저 실행하세요."}, ensure_ascii=False)
+    
+    dir_path = None
+    dir_ids = None
+    if directory_path is not None:
+        dir_path = Path(directory_path).resolve()
+        if not catalog.covers(dir_path):
+            return json.dumps({
+                "error": f"위치 카탈로그에 색인되지 않은 디렉토리입니다: {directory_path}. build_location_catalog를 먼저 실행하세요."
+            }, ensure_ascii=False)
+        dir_ids = catalog.directory_ids_under(dir_path)
+    
+    if bbox is not None and (len(bbox) != 4 or bbox[0] > bbox[2]):
+        return json.dumps({
+            "error": "bbox는 [남, 서, 북, 동] 형식이어야 합니다 (남 <= 북, 서 > 동이면 날짜변경선을 넘는 영역)."
         }, ensure_ascii=False)
-    except Exception as e:
+    
+    has_center = center_latitude is not None and center_longitude is not None
+    if (center_latitude is None) != (center_longitude is None) or (radius_km is not None and not has_center):
+        return json.dumps({"error": "반경 조회에는 center_latitude, center_longitude가 모두 필요합니다."}, ensure_ascii=False)
+    
+    if sort_by not in QUERY_SORT_KEYS:
+        return json.dumps({"error": f"sort_by는 {', '.join(QUERY_SORT_KEYS)} 중 하나여야 합니다."}, ensure_ascii=False)
+    
+    if sort_by == "distance" and not has_center:
+        return json.dumps({"error": "distance 정렬에는 center_latitude, center_longitude가 필요합니다."}, ensure_ascii=False)
+    
+    if limit < 1:
+        return json.dumps({"error": "limit는 1 이상이어야 합니다."}, ensure_ascii=False)
+    
+    if address_mode not in ADDRESS_MODES:
         return json.dumps({
-            "error": f"이미지 처리 중 오류 발생: {str(e)}"
+            "error": "address_mode는 'sync', 'deferred', 'none' 중 하나여야 합니다."
         }, ensure_ascii=False)
+    
+    try:
+        after = _parse_query_time(taken_after) if taken_after is not None else None
+        before = _parse_query_time(taken_before, end_of_day=True) if taken_before is not None else None
+    except ValueError:
+        return json.dumps({"error": "taken_after/taken_before는 ISO 8601 형식이어야 합니다 (예: 2024-05-01T09:00:00)."}, ensure_ascii=False)
+    
+    control = control or _ScanControl()
+    
+    # 인덱스로 밀어 넣을 범위 조건
+    latitude_range = None
+    if bbox is not None:
+        latitude_range = (bbox[0], bbox[2])
+    if radius_km is not None:
+        margin = radius_km / 111.19 + 1e-9
+        low, high = center_latitude - margin, center_latitude + margin
+        if latitude_range is not None:
+            low, high = max(low, latitude_range[0]), min(high, latitude_range[1])
+        latitude_range = (low, high)
+    time_range = (after, before) if after is not None or before is not None else None
+    plan, rows = catalog.candidate_rows(latitude_range, time_range)
+    
+    latitudes, longitudes = catalog.latitude, catalog.longitude
+    matches = []
+    for position, row in enumerate(rows):
+        if position % CATALOG_SCAN_STRIDE == 0:
+            control.check()
+            control.scanned = position
+        if dir_ids is not None and catalog.dir_id[row] not in dir_ids:
+            continue
+        latitude, longitude = latitudes[row], longitudes[row]
+        if bbox is not None and not (bbox[0] <= latitude <= bbox[2] and _longitude_in(longitude, bbox[1], bbox[3])):
+            continue
+        if time_range is not None:
+            taken_at = catalog.taken_at[row]
+            if math.isnan(taken_at) or (after is not None and taken_at < after) \
+                    or (before is not None and taken_at > before):
+                continue
+        if min_altitude is not None or max_altitude is not None:
+            altitude = catalog.altitude[row]
+            if math.isnan(altitude) or (min_altitude is not None and altitude < min_altitude) \
+                    or (max_altitude is not None and altitude > max_altitude):
+                continue
+        distance = None
+        if has_center:
+            distance = calculate_distance(center_latitude, center_longitude, latitude, longitude)
+            if radius_km is not None and distance > radius_km:
+                continue
+        if filename_pattern is not None and not fnmatch.fnmatch(catalog.name(row), filename_pattern):
+            continue
+        if has_address is not None and (_address_resolver.lookup(latitude, longitude) is not None) != has_address:
+            continue
+        matches.append((row, distance))
+    control.scanned = len(rows)
+    
+    # 정렬: 값이 없는 항목(NaN)은 방향과 관계없이 맨 뒤
+    sign = -1 if descending else 1
+    if sort_by == "path":
+        sort_key = lambda match: sign * match[0]
+    elif sort_by == "distance":
+        sort_key = lambda match: sign * match[1]
+    else:
+        column = catalog.taken_at if sort_by == "taken_at" else catalog.altitude
+        sort_key = lambda match: (math.isnan(column[match[0]]), sign * _nan_last(column[match[0]]), match[0])
+    selected = heapq.nsmallest(limit, matches, key=sort_key)
+    
+    images = []
+    for row, distance in selected:
+        location = catalog.location(row)
+        item = {
+            "filename": catalog.name(row),
+            "path": catalog.path(row),
+            "location": location
+        }
+        taken_at = catalog.taken_at_of(row)
+        if taken_at is not None:
+            item["taken_at"] = _format_taken_at(taken_at)
+        if distance is not None:
+            item["distance_km"] = round(distance, 2)
+        item["google_maps_url"] = f"https://www.google.com/maps?q={location['latitude']},{location['longitude']}"
+        if address_mode == "none":
+            # 이미 알고 있는 주소는 네트워크 요청 없이 포함
+            address = _address_resolver.lookup(location["latitude"], location["longitude"])
+            if address:
+                item["address"] = address
+        else:
+            _attach_address(item, location, address_mode, control)
+        images.append(item)
+    
+    return json.dumps({
+        "directory": str(dir_path) if dir_path is not None else None,
+        "query_plan": {"index": plan, "candidates": len(rows), "catalog_images": len(catalog)},
+        "total_matching_images": len(matches),
+        "returned": len(images),
+        "images": images
+    }, ensure_ascii=False, indent=2)
 
 
 @mcp.tool()
-def get_photo_location_from_base64(image_base64: str, image_format: str = "jpg") -> str:
+@_profiled
+async def query_photos(
+    directory_path: Optional[str] = None,
+    bbox: Optional[List[float]] = None,
+    center_latitude: Optional[float] = None,
+    center_longitude: Optional[float] = None,
+    radius_km: Optional[float] = None,
+    taken_after: Optional[str] = None,
+    taken_before: Optional[str] = None,
+    min_altitude: Optional[float] = None,
+    max_altitude: Optional[float] = None,
+    filename_pattern: Optional[str] = None,
+    has_address: Optional[bool] = None,
+    sort_by: str = "path",
+    descending: bool = False,
+    limit: int = 100,
+    address_mode: str = "none",
+    ctx: Optional[Context] = None
+) -> str:
     """
-    Base64로 인코딩된 이미지 데이터에서 GPS 위치 정보를 추출합니다.
+    위치 카탈로그(build_location_catalog)에서 여러 조건을 조합해 사진을 조회합니다.
+    파일 시스템을 스캔하지 않고, 위도/촬영 시각 정렬 인덱스로 후보를 줄인 뒤 나머지 조건을 적용합니다.
+    주소 변환은 반환하는 사진(limit개)에만 수행합니다.
     
     Args:
-        image_base64: Base64로 인코딩된 이미지 데이터 (data URI 형식 또는 순수 base64 문자열)
-        image_format: 이미지 형식 ("jpg", "jpeg", "png", "tiff", "tif"), 기본값: "jpg"
+        directory_path: 이 디렉토리(하위 포함) 아래 사진만 조회 (None이면 카탈로그 전체)
+        bbox: [남, 서, 북, 동] 위도/경도 영역. 서 > 동이면 날짜변경선을 넘는 영역 (예: [-20, 170, -10, -170])
+        center_latitude: 중심점 위도 (반경 조회 또는 거리 정렬용)
+        center_longitude: 중심점 경도
+        radius_km: 중심점으로부터의 반경 (킬로미터)
+        taken_after: 이 시각 이후 촬영 (ISO 8601, 예: "2024-05-01" 또는 "2024-05-01T09:00:00", 경계 포함)
+        taken_before: 이 시각 이전 촬영 (ISO 8601, 경계 포함. 날짜만 주면 그날 전체 포함)
+        min_altitude: 최소 고도 (미터)
+        max_altitude: 최대 고도 (미터)
+        filename_pattern: 파일 이름 glob 패턴 (예: "IMG_*.heic")
+        has_address: True면 주소가 이미 해석된 사진만, False면 해석되지 않은 사진만
+        sort_by: 정렬 기준 ("path", "taken_at", "altitude", "distance"), 기본값: "path"
+        descending: 내림차순 정렬 여부
+        limit: 반환할 최대 사진 수, 기본값: 100
+        address_mode: 반환하는 사진의 주소 해석 모드 ("sync", "deferred", "none"), 기본값: "none"
+            ("none"이어도 이미 해석된 주소는 포함)
         
     Returns:
-        JSON 형식의 위치 정보 (위도, 경도, 고도)
+        JSON 형식의 조회 결과 (사용한 인덱스와 후보 수, 전체 일치 수, 사진 목록)
     """
-    return _get_photo_location_from_base64_impl(image_base64, image_format)
+    return await _run_with_progress(
+        ctx, _query_photos_impl,
+        directory_path, bbox, center_latitude, center_longitude, radius_km, taken_after, taken_before,
+        min_altitude, max_altitude, filename_pattern, has_address, sort_by, descending, limit, address_mode
+    )
 
 
-@mcp.tool()
-def batch_get_photo_locations(directory_path: str) -> str:
+# ---------------------------------------------------------------------------
+# 시공간 근접 사진 묶기 (연속 촬영, 중복 업로드)
+#
+# 촬영 시각순으로 정렬한 뒤 한 번 훑으면서, max_interval_sec 창 안의 사진만 공간 해시(위도/경도 격자)에
+# 둡니다. 새 사진은 주변 3x3 격자의 사진과만 거리를 비교하고, 가까운 쌍은 union-find로 같은 그룹에
+# 합칩니다. 모든 쌍에 calculate_distance를 호출하는 O(n²) 대신 정렬 O(n log n) + 창 안 이웃 비교로 끝납니다.
+# ---------------------------------------------------------------------------
+
+# calculate_distance와 같은 지구 반경 기준 위도 1도의 길이 (미터)
+_METERS_PER_DEGREE = 6371000.0 * math.pi / 180
+
+
+def _cluster_bursts(times, latitudes, longitudes, max_distance_m: float, max_interval_sec: float,
+                    control: Optional[_ScanControl] = None) -> List[List[int]]:
     """
-    디렉토리 내의 모든 사진 파일에서 GPS 위치 정보를 일괄 추출합니다.
+    촬영 시각순으로 정렬된 사진들을 시공간 근접성으로 묶습니다.
+    
+    거리 max_distance_m 이내이면서 촬영 간격 max_interval_sec 이내인 쌍을 같은 그룹으로 합치는 단일 연결
+    방식이므로, 1초 간격 연속 촬영은 전체 길이와 관계없이 하나의 그룹이 됩니다.
     
-    Args:
-        directory_path: 이미지 파일들이 있는 디렉토리 경로
-        
     Returns:
-        JSON 형식의 위치 정보 리스트
+        그룹별 인덱스 목록 (그룹은 첫 사진 시각순, 그룹 안 인덱스도 시각순, 한 장짜리 그룹 포함)
+    """
+    count = len(times)
+    parent = list(range(count))
+    size = [1] * count
+    
+    def find(index: int) -> int:
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+    
+    # 격자 한 칸이 max_distance_m 이상이면 가까운 쌍은 항상 이웃한 칸(3x3)에 있음
+    cell_m = max(max_distance_m, 1.0)
+    lat_cell = cell_m / _METERS_PER_DEGREE
+    max_abs_latitude = max((abs(latitude) for latitude in latitudes), default=0.0) + lat_cell
+    if max_abs_latitude >= 89.0:
+        # 극지방은 경도 1도의 길이가 0에 가까우므로 경도 방향으로는 나누지 않음
+        lon_columns = 1
+    else:
+        # 가장 고위도 기준 경도 폭(여유 1%)을 사용하고, 날짜 변경선에서 이어지도록 열 번호를 순환
+        lon_cell = lat_cell / math.cos(math.radians(max_abs_latitude)) * 1.01
+        lon_columns = max(1, int(360.0 / lon_cell))
+    
+    grid: Dict[tuple, deque] = {}
+    cells = [None] * count
+    window = deque()
+    for index in range(count):
+        if control is not None and index % CATALOG_SCAN_STRIDE == 0:
+            control.check()
+        timestamp, latitude, longitude = times[index], latitudes[index], longitudes[index]
+        
+        # 창에서 벗어난 사진 제거 (칸마다 시각순으로 쌓이므로 항상 맨 앞)
+        while window and timestamp - times[window[0]] > max_interval_sec:
+            expired = window.popleft()
+            bucket = grid[cells[expired]]
+            bucket.popleft()
+            if not bucket:
+                del grid[cells[expired]]
+        
+        row = math.floor((latitude + 90.0) / lat_cell)
+        column = int((longitude + 180.0) / 360.0 * lon_columns) % lon_columns
+        neighbor_columns = {(column - 1) % lon_columns, column, (column + 1) % lon_columns}
+        for neighbor_row in (row - 1, row, row + 1):
+            for neighbor_column in neighbor_columns:
+                for other in grid.get((neighbor_row, neighbor_column), ()):
+                    root, other_root = find(index), find(other)
+                    if root == other_root:
+                        continue
+                    if calculate_distance(latitude, longitude, latitudes[other], longitudes[other]) * 1000 \
+                            > max_distance_m:
+                        continue
+                    if size[root] < size[other_root]:
+                        root, other_root = other_root, root
+                    parent[other_root] = root
+                    size[root] += size[other_root]
+        
+        cells[index] = (row, column)
+        grid.setdefault(cells[index], deque()).append(index)
+        window.append(index)
+    
+    groups: Dict[int, List[int]] = {}
+    for index in range(count):
+        groups.setdefault(find(index), []).append(index)
+    return list(groups.values())
+
+
+def _group_photo_bursts_impl(
+    directory_path: str,
+    max_distance_m: float = 30.0,
+    max_interval_sec: float = 10.0,
+    min_group_size: int = 2,
+    recursive: bool = False,
+    include_patterns: Optional[List[str]] = None,
+    exclude_patterns: Optional[List[str]] = None,
+    max_depth: Optional[int] = None,
+    use_catalog: bool = False,
+    address_mode: str = "none",
+    control: Optional[_ScanControl] = None
+) -> str:
+    """
+    시공간으로 가까운 사진(연속 촬영, 중복 업로드)을 그룹으로 묶는 내부 구현 함수.
+    use_catalog=True이면 파일 시스템 대신 위치 카탈로그의 배열을 직접 사용합니다.
     """
     dir_path = Path(directory_path)
+    catalog = _location_catalog if use_catalog else None
     
-    if not dir_path.exists():
+    if use_catalog:
+        dir_path = dir_path.resolve()
+        if catalog is None or not catalog.covers(dir_path):
+            return json.dumps({
+                "error": f"위치 카탈로그에 색인되지 않은 디렉토리입니다: {directory_path}. build_location_catalog를 먼저 실행하세요."
+            }, ensure_ascii=False)
+    elif not dir_path.exists():
         return json.dumps({"error": f"디렉토리를 찾을 수 없습니다: {directory_path}"}, ensure_ascii=False)
     
-    if not dir_path.is_dir():
+    elif not dir_path.is_dir():
         return json.dumps({"error": f"디렉토리가 아닙니다: {directory_path}"}, ensure_ascii=False)
     
-    supported_formats = {'.jpg', '.jpeg', '.tiff', '.tif', '.png'}
-    results = []
+    if max_distance_m < 0 or max_interval_sec < 0:
+        return json.dumps({"error": "max_distance_m와 max_interval_sec는 0 이상이어야 합니다."}, ensure_ascii=False)
     
-    for image_file in dir_path.iterdir():
-        if image_file.is_file() and image_file.suffix.lower() in supported_formats:
-            gps_data = extract_gps_from_exif(str(image_file))
-            if gps_data and "error" not in gps_data:
-                result_item = {
-                    "filename": image_file.name,
-                    "path": str(image_file),
-                    "location": gps_data,
-                    "google_maps_url": f"https://www.google.com/maps?q={gps_data.get('latitude')},{gps_data.get('longitude')}"
-                }
-                # 주소 정보 추가
-                if "latitude" in gps_data and "longitude" in gps_data:
-                    address = reverse_geocode(gps_data["latitude"], gps_data["longitude"])
-                    if address:
-                        result_item["address"] = address
-                results.append(result_item)
+    if min_group_size < 1:
+        return json.dumps({"error": "min_group_size는 1 이상이어야 합니다."}, ensure_ascii=False)
     
-    return json.dumps({
+    if max_depth is not None and max_depth < 0:
+        return json.dumps({"error": "max_depth는 0 이상이어야 합니다."}, ensure_ascii=False)
+    
+    if address_mode not in ADDRESS_MODES:
+        return json.dumps({
+            "error": "address_mode는 'sync', 'deferred', 'none' 중 하나여야 합니다."
+        }, ensure_ascii=False)
+    
+    control = control or _ScanControl()
+    depth_limit = max_depth if recursive else 0
+    options = (tuple(include_patterns or ()), tuple(exclude_patterns or ()), depth_limit)
+    
+    cache_key = None
+    if catalog is None:
+        cache_key = _ResultCache.make_key(
+            "group_photo_bursts", dir_path,
+            {"max_distance_m": max_distance_m, "max_interval_sec": max_interval_sec,
+             "min_group_size": min_group_size, "address_mode": address_mode, "options": options},
+            *options
+        )
+        cached = _result_cache.get(cache_key)
+        if cached is not None:
+            return cached
+    
+    # (촬영 시각, 같은 시각일 때의 정렬 키, 위도, 경도, 항목 정보) 수집 - 촬영 시각이 없는 사진은 묶을 수 없으므로 개수만 셈
+    photos = []
+    without_timestamp = 0
+    if catalog is not None:
+        dir_ids = catalog.directory_ids_under(dir_path)
+        for row, dir_id in enumerate(catalog.dir_id):
+            if row % CATALOG_SCAN_STRIDE == 0:
+                control.check()
+                control.scanned = row
+            if dir_id not in dir_ids:
+                continue
+            taken_at = catalog.taken_at[row]
+            if math.isnan(taken_at):
+                without_timestamp += 1
+                continue
+            photos.append((taken_at, row, catalog.latitude[row], catalog.longitude[row], row))
+        control.scanned = len(catalog)
+        
+        def describe(source) -> Dict[str, Any]:
+            path = catalog.path(source)
+            return {"filename": catalog.name(source), "path": path,
+                    "relative_path": os.path.relpath(path, str(dir_path)), "location": catalog.location(source)}
+    else:
+        records = _iter_photo_records(dir_path, options, False, control=control, extractor=_extract_catalog_metadata)
+        for _, relative_path, path, gps_data in records:
+            if "latitude" not in gps_data or "longitude" not in gps_data:
+                continue
+            taken_at = gps_data.pop("taken_at", None)
+            if taken_at is None:
+                without_timestamp += 1
+                continue
+            photos.append((taken_at, path, gps_data["latitude"], gps_data["longitude"], (relative_path, path, gps_data)))
+        
+        def describe(source) -> Dict[str, Any]:
+            relative_path, path, gps_data = source
+            item = {"filename": os.path.basename(path), "path": path}
+            if recursive:
+                item["relative_path"] = relative_path
+            item["location"] = gps_data
+            return item
+    
+    # 같은 시각이면 경로(카탈로그는 행 번호)순으로 정렬하여 결과를 결정적으로 만듦
+    photos.sort(key=lambda photo: (photo[0], photo[1]))
+    times = array("d", (photo[0] for photo in photos))
+    latitudes = array("d", (photo[2] for photo in photos))
+    longitudes = array("d", (photo[3] for photo in photos))
+    clusters = _cluster_bursts(times, latitudes, longitudes, max_distance_m, max_interval_sec, control)
+    
+    groups = []
+    for members in clusters:
+        if len(members) < min_group_size:
+            continue
+        # 그룹의 첫 사진을 대표로 사용
+        first = members[0]
+        representative = describe(photos[first][4])
+        representative["taken_at"] = _format_taken_at(times[first])
+        _attach_address(representative, representative["location"], address_mode, control)
+        redundant = []
+        for index in members[1:]:
+            item = describe(photos[index][4])
+            item["taken_at"] = _format_taken_at(times[index])
+            item["interval_sec"] = round(times[index] - times[first], 3)
+            item["distance_m"] = round(calculate_distance(
+                latitudes[first], longitudes[first], latitudes[index], longitudes[index]) * 1000, 1)
+            redundant.append(item)
+        groups.append({
+            "group_id": len(groups) + 1,
+            "size": len(members),
+            "start": _format_taken_at(times[first]),
+            "end": _format_taken_at(times[members[-1]]),
+            "duration_sec": round(times[members[-1]] - times[first], 3),
+            "representative": representative,
+            "redundant_members": redundant
+        })
+    
+    output = json.dumps({
         "directory": str(dir_path),
-        "total_images": len(results),
-        "images_with_location": results
+        "max_distance_m": max_distance_m,
+        "max_interval_sec": max_interval_sec,
+        "total_images": len(photos),
+        "images_without_timestamp": without_timestamp,
+        "total_groups": len(groups),
+        "redundant_images": sum(group["size"] - 1 for group in groups),
+        "groups": groups
     }, ensure_ascii=False, indent=2)
+    if cache_key is not None and control.addresses_complete:
+        _result_cache.put(cache_key, output, [str(dir_path.resolve()), *options])
+    return output
 
 
 @mcp.tool()
-def geofence_photos(
+@_profiled
+async def group_photo_bursts(
     directory_path: str,
-    center_latitude: float,
-    center_longitude: float,
-    radius_km: float,
-    filter_mode: str = "inside"
+    max_distance_m: float = 30.0,
+    max_interval_sec: float = 10.0,
+    min_group_size: int = 2,
+    recursive: bool = False,
+    include_patterns: Optional[List[str]] = None,
+    exclude_patterns: Optional[List[str]] = None,
+    max_depth: Optional[int] = None,
+    use_catalog: bool = False,
+    address_mode: str = "none",
+    ctx: Optional[Context] = None
 ) -> str:
     """
-    지오펜싱(Geofencing) 기능: 특정 위치를 중심으로 반경 내/외에 있는 사진을 필터링합니다.
-    
-    지오펜싱이란?
-    - 특정 지리적 경계(geographic boundary)를 정의하는 기술
-    - 지정한 중심점에서 반경 거리 내에 있는지 밖에 있는지 판단
-    - 예: "서울시청에서 5km 반경 내 사진", "집 주변 1km 내 사진" 등
+    가까운 장소에서 짧은 간격으로 찍은 사진(연속 촬영, 같은 사진의 중복 업로드)을 그룹으로 묶고
+    그룹마다 대표 사진 한 장을 고릅니다. 대표 사진만 처리하면 이후 주소 변환/마스킹 작업량이 줄어듭니다.
     
     Args:
-        directory_path: 이미지 파일들이 있는 디렉토리 경로
-        center_latitude: 중심점의 위도
-        center_longitude: 중심점의 경도
-        radius_km: 반경 (킬로미터)
-        filter_mode: "inside" (반경 내) 또는 "outside" (반경 외)
+        directory_path: 사진들이 있는 디렉토리 경로
+        max_distance_m: 같은 그룹으로 볼 최대 거리 (미터, 기본값: 30)
+        max_interval_sec: 같은 그룹으로 볼 최대 촬영 간격 (초, 기본값: 10)
+            조건을 만족하는 사진끼리 이어지면 모두 한 그룹 (1초 간격 연속 촬영은 길이와 관계없이 한 그룹)
+        min_group_size: 결과에 포함할 최소 그룹 크기 (1이면 묶이지 않은 사진도 한 장짜리 그룹으로 포함)
+        recursive: True인 경우 하위 디렉토리까지 재귀적으로 스캔
+        include_patterns: 포함할 파일 glob 패턴 목록
+        exclude_patterns: 제외할 파일/디렉토리 glob 패턴 목록
+        max_depth: 재귀 스캔 최대 깊이 (None이면 제한 없음)
+        use_catalog: True인 경우 파일을 읽지 않고 위치 카탈로그 사용 (build_location_catalog로 색인된
+            디렉토리 아래 전체가 대상이며 recursive/패턴 인자는 무시)
+        address_mode: 대표 사진의 주소 해석 모드 ("none"(기본값), "sync", "deferred")
         
     Returns:
-        JSON 형식의 필터링된 사진 목록
+        JSON 형식의 그룹 목록 (그룹별 대표 사진, 나머지 사진과 대표 사진과의 간격/거리)
     """
-    dir_path = Path(directory_path)
-    
-    if not dir_path.exists():
-        return json.dumps({"error": f"디렉토리를 찾을 수 없습니다: {directory_path}"}, ensure_ascii=False)
-    
-    if not dir_path.is_dir():
-        return json.dumps({"error": f"디렉토리가 아닙니다: {directory_path}"}, ensure_ascii=False)
-    
-    if filter_mode not in ["inside", "outside"]:
-        return json.dumps({
-            "error": "filter_mode는 'inside' 또는 'outside'여야 합니다."
-        }, ensure_ascii=False)
+    return await _run_with_progress(
+        ctx, _group_photo_bursts_impl,
+        directory_path, max_distance_m, max_interval_sec, min_group_size, recursive,
+        include_patterns, exclude_patterns, max_depth, use_catalog, address_mode
+    )
+
+
+@mcp.tool()
+@_profiled
+def get_resolved_addresses(address_handles: List[str]) -> str:
+    """
+    address_mode="deferred"로 발급된 주소 핸들의 해석 결과를 일괄 조회합니다.
     
-    supported_formats = {'.jpg', '.jpeg', '.tiff', '.tif', '.png'}
-    results = []
+    Args:
+        address_handles: batch_get_photo_locations / geofence_photos가 반환한 address_handle 목록
+        
+    Returns:
+        JSON 형식의 핸들별 상태 ("pending", "resolved", "failed", "unknown")와 주소
+    """
+    addresses = {}
+    counts = {"pending": 0, "resolved": 0, "failed": 0, "unknown": 0}
     
-    for image_file in dir_path.iterdir():
-        if image_file.is_file() and image_file.suffix.lower() in supported_formats:
-            gps_data = extract_gps_from_exif(str(image_file))
-            if gps_data and "error" not in gps_data and "latitude" in gps_data and "longitude" in gps_data:
-                distance = calculate_distance(
-                    center_latitude,
-                    center_longitude,
-                    gps_data["latitude"],
-                    gps_data["longitude"]
-                )
-                
-                is_inside = distance <= radius_km
-                
-                if (filter_mode == "inside" and is_inside) or (filter_mode == "outside" and not is_inside):
-                    result_item = {
-                        "filename": image_file.name,
-                        "path": str(image_file),
-                        "location": gps_data,
-                        "distance_km": round(distance, 2),
-                        "google_maps_url": f"https://www.google.com/maps?q={gps_data.get('latitude')},{gps_data.get('longitude')}"
-                    }
-                    # 주소 정보 추가
-                    address = reverse_geocode(gps_data["latitude"], gps_data["longitude"])
-                    if address:
-                        result_item["address"] = address
-                    results.append(result_item)
+    for handle in address_handles:
+        entry = _address_resolver.get(handle)
+        if entry is None:
+            addresses[handle] = {"status": "unknown"}
+            counts["unknown"] += 1
+            continue
+        
+        item = {"status": entry["status"]}
+        if "address" in entry:
+            item["address"] = entry["address"]
+        addresses[handle] = item
+        counts[entry["status"]] += 1
     
     return json.dumps({
-        "directory": str(dir_path),
-        "center": {
-            "latitude": center_latitude,
-            "longitude": center_longitude
-        },
-        "radius_km": radius_km,
-        "filter_mode": filter_mode,
-        "total_matching_images": len(results),
-        "images": results
+        "total_handles": len(address_handles),
+        "status_counts": counts,
+        "addresses": addresses
     }, ensure_ascii=False, indent=2)
 
 
 @mcp.tool()
+@_profiled
 def remove_gps_from_photo(
     image_path: str,
     create_backup: bool = True,
@@ -562,6 +4606,7 @@ def remove_gps_from_photo(
 
 
 @mcp.tool()
+@_profiled
 def mask_location_in_photo(
     image_path: str,
     mask_latitude: float,
@@ -683,6 +4728,505 @@ def mask_location_in_photo(
         }, ensure_ascii=False)
 
 
+# ---------------------------------------------------------------------------
+# GPX 트랙 로그로 일괄 지오태깅
+#
+# GPS가 없는 카메라로 찍은 사진에 GPS 로거의 트랙 기록으로 위치를 기록합니다.
+#   1. 트랙 포인트를 시간순으로 정렬한 열(array)로 색인
+#   2. 워커 프로세스들이 사진의 Exif 세그먼트만 읽어 촬영 시각을 추출
+#   3. 현재 프로세스에서 시각 열을 이진 탐색하여 앞뒤 트랙 포인트 사이의 위치를 선형 보간
+#   4. 워커 프로세스들이 JPEG의 Exif(APP1) 세그먼트만 교체하여 기록
+#      (픽셀 데이터는 디코딩/재인코딩 없이 그대로 복사, 임시 파일에 쓴 뒤 원자적으로 교체)
+# 트랙 색인은 현재 프로세스에만 두고, 워커와는 (경로, 촬영 시각)과 (경로, GPS IFD) 같은 작은 값만 주고받습니다.
+# ---------------------------------------------------------------------------
+
+# 지오태깅(기록)을 지원하는 형식
+GEOTAG_FORMATS = {'.jpg', '.jpeg'}
+
+# 촬영 시각 태그별 (1초 미만 값 태그, UTC 오프셋 태그)
+_TAKEN_AT_DETAIL_TAGS = {
+    piexif.ExifIFD.DateTimeOriginal: (piexif.ExifIFD.SubSecTimeOriginal, piexif.ExifIFD.OffsetTimeOriginal),
+    piexif.ExifIFD.DateTimeDigitized: (piexif.ExifIFD.SubSecTimeDigitized, piexif.ExifIFD.OffsetTimeDigitized),
+    piexif.ImageIFD.DateTime: (piexif.ExifIFD.SubSecTime, piexif.ExifIFD.OffsetTime),
+}
+
+
+def _parse_gpx_time(text: str) -> Optional[float]:
+    """GPX <time> 값(ISO 8601, 예: 2024-05-01T09:30:00Z)을 UTC 기준 초 단위 값으로 변환합니다."""
+    text = text.strip()
+    if text[-1:] in ("Z", "z"):
+        text = text[:-1] + "+00:00"
+    try:
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def _parse_exif_utc_offset(value) -> Optional[float]:
+    """EXIF OffsetTime 값("+09:00")을 초 단위로 변환합니다."""
+    if isinstance(value, bytes):
+        value = value.decode("ascii", "replace")
+    if not isinstance(value, str):
+        return None
+    value = value.strip("\x00 ")
+    if len(value) != 6 or value[0] not in "+-" or value[3] != ":":
+        return None
+    try:
+        seconds = int(value[1:3]) * 3600 + int(value[4:6]) * 60
+    except ValueError:
+        return None
+    return -seconds if value[0] == "-" else seconds
+
+
+class _GpxTrack:
+    """
+    GPX 트랙 포인트를 시간순으로 정렬한 열 지향 색인입니다.
+    
+    시각 열을 이진 탐색하여 임의 시각의 위치를 앞뒤 포인트 사이에서 선형 보간합니다.
+    포인트 사이 간격이 max_gap_sec보다 길면(로거 꺼짐, 트랙 구간 사이) 보간하지 않고,
+    max_gap_sec 이내의 가장 가까운 포인트가 있으면 그 위치를 사용합니다.
+    """
+    
+    def __init__(self, times: array, latitudes: array, longitudes: array, elevations: array):
+        self.times = times
+        self.latitudes = latitudes
+        self.longitudes = longitudes
+        self.elevations = elevations
+    
+    def __len__(self) -> int:
+        return len(self.times)
+    
+    @classmethod
+    def load(cls, gpx_path: str) -> "_GpxTrack":
+        """GPX 파일의 모든 트랙(<trk>/<trkseg>/<trkpt>) 포인트 중 시각이 있는 포인트를 읽습니다."""
+        points = []
+        for _, element in ElementTree.iterparse(gpx_path, events=("end",)):
+            if element.tag.rsplit("}", 1)[-1] != "trkpt":
+                continue
+            timestamp = None
+            elevation = math.nan
+            for child in element:
+                name = child.tag.rsplit("}", 1)[-1]
+                if name == "time" and child.text:
+                    timestamp = _parse_gpx_time(child.text)
+                elif name == "ele" and child.text:
+                    try:
+                        elevation = float(child.text)
+                    except ValueError:
+                        pass
+            try:
+                latitude = float(element.get("lat"))
+                longitude = float(element.get("lon"))
+            except (TypeError, ValueError):
+                timestamp = None
+            element.clear()
+            if timestamp is not None and -90 <= latitude <= 90 and -180 <= longitude <= 180:
+                points.append((timestamp, latitude, longitude, elevation))
+        
+        points.sort(key=lambda point: point[0])
+        return cls(
+            array("d", (point[0] for point in points)),
+            array("d", (point[1] for point in points)),
+            array("d", (point[2] for point in points)),
+            array("d", (point[3] for point in points))
+        )
+    
+    def _point(self, index: int):
+        elevation = self.elevations[index]
+        return self.latitudes[index], self.longitudes[index], None if math.isnan(elevation) else elevation
+    
+    def position_at(self, timestamp: float, max_gap_sec: float):
+        """
+        UTC 시각의 위치를 구합니다.
+        
+        Returns:
+            ("matched", (위도, 경도, 고도 또는 None)) 또는 ("outside_track" | "track_gap", None)
+        """
+        times = self.times
+        index = bisect.bisect_right(times, timestamp)
+        if index > 0 and times[index - 1] == timestamp:
+            return "matched", self._point(index - 1)
+        if index == 0 or index == len(times):
+            # 트랙 시작 전/종료 후: 끝 포인트와 가까우면 그 위치 사용
+            edge = 0 if index == 0 else index - 1
+            if abs(times[edge] - timestamp) <= max_gap_sec:
+                return "matched", self._point(edge)
+            return "outside_track", None
+        
+        before, after = index - 1, index
+        t0, t1 = times[before], times[after]
+        if t1 - t0 > max_gap_sec:
+            nearest = before if timestamp - t0 <= t1 - timestamp else after
+            if abs(times[nearest] - timestamp) <= max_gap_sec:
+                return "matched", self._point(nearest)
+            return "track_gap", None
+        
+        fraction = (timestamp - t0) / (t1 - t0)
+        lat0, lon0, ele0 = self._point(before)
+        lat1, lon1, ele1 = self._point(after)
+        # 날짜 변경선(경도 ±180)을 지나는 구간은 짧은 쪽으로 보간
+        delta_lon = lon1 - lon0
+        if delta_lon > 180:
+            delta_lon -= 360
+        elif delta_lon < -180:
+            delta_lon += 360
+        longitude = (lon0 + delta_lon * fraction + 180) % 360 - 180
+        if ele0 is not None and ele1 is not None:
+            elevation = ele0 + (ele1 - ele0) * fraction
+        else:
+            elevation = ele0 if ele0 is not None else ele1
+        return "matched", (lat0 + (lat1 - lat0) * fraction, longitude, elevation)
+
+
+def _find_jpeg_exif_segment(f):
+    """
+    JPEG 마커 세그먼트를 순회하여 Exif APP1 세그먼트 위치를 찾습니다 (SOS 이후 이미지 데이터는 읽지 않음).
+    
+    Returns:
+        (세그먼트 시작 오프셋, 세그먼트 끝 오프셋, TIFF 바이트)
+        Exif 세그먼트가 없으면 시작=끝=새 세그먼트를 넣을 위치(SOI 또는 APP0(JFIF) 바로 뒤)이고 TIFF 바이트는 None
+    """
+    if f.read(2) != b"\xff\xd8":
+        raise ValueError("JPEG 파일이 아닙니다")
+    insert_at = 2
+    while True:
+        start = f.tell()
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            break
+        code = marker[1]
+        # 마커 앞의 채움 바이트(0xFF) 건너뛰기
+        while code == 0xFF:
+            next_byte = f.read(1)
+            if not next_byte:
+                return insert_at, insert_at, None
+            code = next_byte[0]
+        if code in (0xD9, 0xDA):
+            break
+        if 0xD0 <= code <= 0xD7 or code == 0x01:
+            continue
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2 or int.from_bytes(length_bytes, "big") < 2:
+            break
+        end = f.tell() + int.from_bytes(length_bytes, "big") - 2
+        if code == 0xE1:
+            data = f.read(end - f.tell())
+            if data.startswith(b"Exif\x00\x00"):
+                return start, end, data[6:]
+        f.seek(end)
+        if code == 0xE0 and start == insert_at:
+            insert_at = end
+    return insert_at, insert_at, None
+
+
+def _extract_geotag_metadata(image_path: str) -> Dict[str, Any]:
+    """
+    지오태깅용: Exif 세그먼트만 읽어 촬영 시각(taken_at, 벽시계 기준 초), UTC 오프셋(초), 기존 GPS 여부를 반환합니다.
+    (워커 프로세스에서 실행되는 모듈 수준 함수)
+    """
+    if os.path.splitext(image_path)[1].lower() not in GEOTAG_FORMATS:
+        return {"unsupported": True}
+    try:
+        with open(image_path, "rb") as f:
+            _, _, exif_bytes = _find_jpeg_exif_segment(f)
+        if not exif_bytes:
+            return {"taken_at": None, "has_gps": False}
+        exif_dict = piexif.load(exif_bytes)
+        gps_data = _gps_from_exif_dict(exif_dict)
+    except Exception as e:
+        return {"error": str(e)}
+    
+    result = {"taken_at": None, "has_gps": bool(gps_data and "latitude" in gps_data and "longitude" in gps_data)}
+    exif_ifd = exif_dict.get("Exif") or {}
+    for ifd, tag in _TAKEN_AT_TAGS:
+        taken_at = _parse_exif_datetime((exif_dict.get(ifd) or {}).get(tag))
+        if taken_at is None:
+            continue
+        subsec_tag, offset_tag = _TAKEN_AT_DETAIL_TAGS[tag]
+        subsec = exif_ifd.get(subsec_tag)
+        if isinstance(subsec, bytes):
+            digits = subsec.decode("ascii", "replace").strip("\x00 ")
+            if digits.isdigit():
+                taken_at += float("0." + digits)
+        result["taken_at"] = taken_at
+        result["utc_offset_sec"] = _parse_exif_utc_offset(exif_ifd.get(offset_tag))
+        break
+    return result
+
+
+def _to_dms_rationals(value: float):
+    """도 단위 값을 EXIF GPS 형식 ((도, 1), (분, 1), (초 x 10000, 10000))으로 변환합니다 (정밀도 약 3mm)."""
+    total = round(abs(value) * 3600 * 10000)
+    degrees, rest = divmod(total, 3600 * 10000)
+    minutes, seconds = divmod(rest, 60 * 10000)
+    return ((degrees, 1), (minutes, 1), (seconds, 10000))
+
+
+def _build_gps_ifd(latitude: float, longitude: float, altitude: Optional[float], timestamp: float) -> Dict[int, Any]:
+    """위치와 UTC 시각으로 piexif GPS IFD를 만듭니다 (_gps_from_exif_dict가 읽는 형식)."""
+    moment = datetime.fromtimestamp(timestamp, timezone.utc)
+    gps_ifd = {
+        piexif.GPSIFD.GPSVersionID: (2, 3, 0, 0),
+        piexif.GPSIFD.GPSLatitudeRef: b"S" if latitude < 0 else b"N",
+        piexif.GPSIFD.GPSLatitude: _to_dms_rationals(latitude),
+        piexif.GPSIFD.GPSLongitudeRef: b"W" if longitude < 0 else b"E",
+        piexif.GPSIFD.GPSLongitude: _to_dms_rationals(longitude),
+        piexif.GPSIFD.GPSTimeStamp: ((moment.hour, 1), (moment.minute, 1),
+                                     (moment.second * 1000 + moment.microsecond // 1000, 1000)),
+        piexif.GPSIFD.GPSDateStamp: moment.strftime("%Y:%m:%d").encode("ascii"),
+        piexif.GPSIFD.GPSMapDatum: b"WGS-84",
+    }
+    if altitude is not None:
+        gps_ifd[piexif.GPSIFD.GPSAltitudeRef] = 1 if altitude < 0 else 0
+        gps_ifd[piexif.GPSIFD.GPSAltitude] = (round(abs(altitude) * 100), 100)
+    return gps_ifd
+
+
+def _write_jpeg_gps(image_path: str, gps_ifd: Dict[int, Any], create_backup: bool) -> Optional[str]:
+    """
+    JPEG의 Exif 세그먼트만 GPS IFD를 넣은 새 세그먼트로 교체합니다 (다른 EXIF 태그와 픽셀 데이터는 그대로).
+    
+    같은 디렉토리의 임시 파일에 쓴 뒤 원본과 원자적으로 교체하므로 중간에 실패해도 원본은 손상되지 않습니다.
+    백업은 원본 파일에 하드 링크를 만들어 복사 없이 남깁니다 (하드 링크를 지원하지 않으면 복사).
+    
+    Returns:
+        백업 파일 경로 (create_backup=False이면 None)
+    """
+    directory, name = os.path.split(image_path)
+    temp_path = os.path.join(directory, f".{name}.{os.getpid()}.geotag.tmp")
+    with open(image_path, "rb") as f:
+        start, end, exif_bytes = _find_jpeg_exif_segment(f)
+        exif_dict = piexif.load(exif_bytes) if exif_bytes else {}
+        exif_dict["GPS"] = gps_ifd
+        payload = piexif.dump(exif_dict)
+        if len(payload) + 2 > 0xFFFF:
+            raise ValueError("EXIF 데이터가 JPEG 세그먼트 최대 크기(64KB)를 넘습니다")
+        try:
+            with open(temp_path, "wb") as out:
+                f.seek(0)
+                out.write(f.read(start))
+                out.write(b"\xff\xe1" + (len(payload) + 2).to_bytes(2, "big") + payload)
+                f.seek(end)
+                shutil.copyfileobj(f, out, 1024 * 1024)
+            shutil.copymode(image_path, temp_path)
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+    
+    backup_path = None
+    try:
+        if create_backup:
+            backup_path = image_path + ".bak"
+            if os.path.lexists(backup_path):
+                os.unlink(backup_path)
+            try:
+                os.link(image_path, backup_path)
+            except OSError:
+                shutil.copy2(image_path, backup_path)
+        # 사진 수천 장을 기록하므로 파일마다 fsync하지 않음 (교체는 원자적이며 원본은 백업으로 남음)
+        os.replace(temp_path, image_path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+    return backup_path
+
+
+def _write_geotag_batch(batch, create_backup: bool = True):
+    """[(항목 번호, 경로, GPS IFD), ...] 묶음을 기록합니다 (워커 프로세스에서 실행 가능)."""
+    results = []
+    for number, path, gps_ifd in batch:
+        try:
+            results.append((number, _write_jpeg_gps(path, gps_ifd, create_backup), None))
+        except Exception as e:
+            results.append((number, None, str(e)))
+    return results
+
+
+def _geotag_photos_from_gpx_impl(
+    gpx_path: str,
+    directory_path: str,
+    recursive: bool = False,
+    include_patterns: Optional[List[str]] = None,
+    exclude_patterns: Optional[List[str]] = None,
+    max_depth: Optional[int] = None,
+    utc_offset_hours: Optional[float] = None,
+    clock_offset_sec: float = 0.0,
+    max_gap_sec: float = 300.0,
+    overwrite_existing: bool = False,
+    dry_run: bool = False,
+    create_backup: bool = True,
+    control: Optional[_ScanControl] = None
+) -> str:
+    """
+    GPX 트랙 로그로 디렉토리 사진에 위치를 기록하는 내부 구현 함수.
+    촬영 시각 추출 → 트랙 보간 → 기록 단계가 스트리밍으로 이어지며, 앞 단계와 기록이 동시에 진행됩니다.
+    """
+    gpx_file = Path(gpx_path)
+    dir_path = Path(directory_path)
+    
+    if not gpx_file.is_file():
+        return json.dumps({"error": f"GPX 파일을 찾을 수 없습니다: {gpx_path}"}, ensure_ascii=False)
+    
+    if not dir_path.exists():
+        return json.dumps({"error": f"디렉토리를 찾을 수 없습니다: {directory_path}"}, ensure_ascii=False)
+    
+    if not dir_path.is_dir():
+        return json.dumps({"error": f"디렉토리가 아닙니다: {directory_path}"}, ensure_ascii=False)
+    
+    if max_depth is not None and max_depth < 0:
+        return json.dumps({"error": "max_depth는 0 이상이어야 합니다."}, ensure_ascii=False)
+    
+    if max_gap_sec < 0:
+        return json.dumps({"error": "max_gap_sec는 0 이상이어야 합니다."}, ensure_ascii=False)
+    
+    try:
+        track = _GpxTrack.load(str(gpx_file))
+    except ElementTree.ParseError as e:
+        return json.dumps({"error": f"GPX 파일을 해석할 수 없습니다: {str(e)}"}, ensure_ascii=False)
+    if not len(track):
+        return json.dumps({"error": "GPX 파일에 시각 정보가 있는 트랙 포인트가 없습니다."}, ensure_ascii=False)
+    
+    control = control or _ScanControl()
+    depth_limit = max_depth if recursive else 0
+    options = (tuple(include_patterns or ()), tuple(exclude_patterns or ()), depth_limit)
+    records = _iter_photo_records(dir_path, options, True, control=control, extractor=_extract_geotag_metadata)
+    items: List[Dict[str, Any]] = []
+    
+    def matched_photos():
+        """촬영 시각으로 트랙 위치를 보간하여 기록할 (항목 번호, 경로, GPS IFD)를 yield합니다."""
+        for _, relative_path, path, metadata in records:
+            item = {"filename": os.path.basename(path), "path": path}
+            if recursive:
+                item["relative_path"] = relative_path
+            items.append(item)
+            
+            if "error" in metadata:
+                item["status"] = "error"
+                item["error"] = metadata["error"]
+                continue
+            if metadata.get("unsupported"):
+                item["status"] = "unsupported_format"
+                continue
+            if metadata["taken_at"] is None:
+                item["status"] = "no_timestamp"
+                continue
+            if metadata["has_gps"] and not overwrite_existing:
+                item["status"] = "already_tagged"
+                continue
+            
+            if utc_offset_hours is not None:
+                offset_sec = utc_offset_hours * 3600
+            else:
+                offset_sec = metadata.get("utc_offset_sec") or 0
+            timestamp = metadata["taken_at"] - offset_sec - clock_offset_sec
+            item["taken_at"] = _format_taken_at(metadata["taken_at"])
+            item["time_utc"] = _format_taken_at(timestamp) + "Z"
+            
+            status, position = track.position_at(timestamp, max_gap_sec)
+            if position is None:
+                item["status"] = status
+                continue
+            latitude, longitude, altitude = position
+            item["location"] = {"latitude": latitude, "longitude": longitude}
+            if altitude is not None:
+                item["location"]["altitude"] = altitude
+            item["status"] = "matched" if dry_run else "tagged"
+            yield len(items) - 1, path, _build_gps_ifd(latitude, longitude, altitude, timestamp)
+    
+    if dry_run:
+        for _ in matched_photos():
+            pass
+    else:
+        written = _iter_parsed_in_order(
+            matched_photos(), control,
+            parse_batch=functools.partial(_write_geotag_batch, create_backup=create_backup),
+            record=control.record_written
+        )
+        for number, backup_path, error in written:
+            item = items[number]
+            if error is not None:
+                item["status"] = "error"
+                item["error"] = f"위치 기록 중 오류 발생: {error}"
+            elif backup_path:
+                item["backup_path"] = backup_path
+    
+    counts: Dict[str, int] = {}
+    for item in items:
+        counts[item["status"]] = counts.get(item["status"], 0) + 1
+    
+    return json.dumps({
+        "gpx_path": str(gpx_file),
+        "directory": str(dir_path),
+        "dry_run": dry_run,
+        "track_points": len(track),
+        "track_start": _format_taken_at(track.times[0]) + "Z",
+        "track_end": _format_taken_at(track.times[-1]) + "Z",
+        "total_files": len(items),
+        "tagged_images": counts.get("matched" if dry_run else "tagged", 0),
+        "status_counts": counts,
+        "results": items
+    }, ensure_ascii=False, indent=2)
+
+
+@mcp.tool()
+@_profiled
+async def geotag_photos_from_gpx(
+    gpx_path: str,
+    directory_path: str,
+    recursive: bool = False,
+    include_patterns: Optional[List[str]] = None,
+    exclude_patterns: Optional[List[str]] = None,
+    max_depth: Optional[int] = None,
+    utc_offset_hours: Optional[float] = None,
+    clock_offset_sec: float = 0.0,
+    max_gap_sec: float = 300.0,
+    overwrite_existing: bool = False,
+    dry_run: bool = False,
+    create_backup: bool = True,
+    ctx: Optional[Context] = None
+) -> str:
+    """
+    GPX 트랙 로그로 디렉토리 사진들에 GPS 위치를 기록합니다. (사용자가 명시적으로 요청한 경우에만 실행)
+    
+    사진의 촬영 시각(DateTimeOriginal)으로 트랙에서 앞뒤 포인트를 찾아 위치를 보간하고,
+    JPEG의 EXIF 세그먼트만 교체하여 기록합니다 (이미지 재인코딩 없음, 다른 EXIF 태그 보존).
+    주의: 원본 파일을 수정합니다. 먼저 dry_run=True로 결과를 확인하는 것을 권장합니다.
+    
+    Args:
+        gpx_path: GPS 로거의 GPX 트랙 파일 경로
+        directory_path: 사진들이 있는 디렉토리 경로 (JPEG만 기록 가능)
+        recursive: True인 경우 하위 디렉토리까지 재귀적으로 처리
+        include_patterns: 포함할 파일 glob 패턴 목록
+        exclude_patterns: 제외할 파일/디렉토리 glob 패턴 목록
+        max_depth: 재귀 스캔 최대 깊이 (None이면 제한 없음)
+        utc_offset_hours: 카메라 시계의 UTC 오프셋 (예: 한국 시간이면 9). None이면 EXIF의
+            OffsetTimeOriginal을 사용하고, 그것도 없으면 카메라 시계를 UTC로 간주
+        clock_offset_sec: 카메라 시계가 실제보다 빠른 초 (느리면 음수)
+        max_gap_sec: 보간을 허용하는 트랙 포인트 사이 최대 간격(초). 간격이 더 길거나 트랙 범위 밖이면
+            이 시간 이내의 가장 가까운 포인트 위치를 사용하고, 없으면 건너뜀 (기본값: 300)
+        overwrite_existing: True인 경우 이미 GPS 정보가 있는 사진도 덮어씀
+        dry_run: True인 경우 파일을 수정하지 않고 보간 결과만 반환
+        create_backup: True인 경우 원본 파일을 .bak 확장자로 백업
+        
+    Returns:
+        JSON 형식의 작업 결과 (사진별 상태와 기록한 위치, 상태별 개수)
+    """
+    return await _run_with_progress(
+        ctx, _geotag_photos_from_gpx_impl,
+        gpx_path, directory_path, recursive, include_patterns, exclude_patterns, max_depth,
+        utc_offset_hours, clock_offset_sec, max_gap_sec, overwrite_existing, dry_run, create_backup
+    )
+
+
 if __name__ == "__main__":
     import sys
     import os
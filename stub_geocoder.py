@@ -0,0 +1,171 @@
+"""
+테스트용 로컬 역지오코딩 스텁 서버
+Nominatim reverse API와 같은 형식의 응답을 돌려주며, 지연/장애/속도 제한 상황을 흉내낼 수 있습니다.
+
+사용법:
+    python stub_geocoder.py --port 8089 --latency-ms 50
+    GEOCODER_URL=http://127.0.0.1:8089/reverse python server.py
+
+실행 중에 동작 모드를 바꾸려면:
+    curl "http://127.0.0.1:8089/_control?mode=down"
+    curl "http://127.0.0.1:8089/_control?mode=ok&latency_ms=0"
+
+모드:
+    ok        정상 응답
+    slow      hang_ms만큼 지연 후 정상 응답 (타임아웃 유도)
+    error     HTTP 500
+    ratelimit HTTP 429 (Retry-After: 1)
+    down      응답 없이 연결 종료
+"""
+import sys
+import json
+import time
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+MODES = ("ok", "slow", "error", "ratelimit", "down")
+
+
+class StubGeocoder:
+    """별도 스레드에서 동작하는 스텁 서버. 테스트 코드에서 직접 시작/종료할 수 있습니다."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, mode: str = "ok",
+                 latency_ms: float = 0.0, hang_ms: float = 10000.0):
+        self.mode = mode
+        self.latency_ms = latency_ms
+        self.hang_ms = hang_ms
+        self.request_count = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread: threading.Thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/reverse"
+
+    def set(self, mode: str = None, latency_ms: float = None, hang_ms: float = None) -> None:
+        """동작 모드와 지연 시간을 변경합니다."""
+        if mode is not None:
+            if mode not in MODES:
+                raise ValueError(f"알 수 없는 모드입니다: {mode}")
+            self.mode = mode
+        if latency_ms is not None:
+            self.latency_ms = latency_ms
+        if hang_ms is not None:
+            self.hang_ms = hang_ms
+
+    def start(self) -> "StubGeocoder":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-geocoder", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        self._server.serve_forever()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status: int, payload, headers=None):
+                body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+
+                if parsed.path == "/_control":
+                    try:
+                        stub.set(
+                            mode=query.get("mode"),
+                            latency_ms=float(query["latency_ms"]) if "latency_ms" in query else None,
+                            hang_ms=float(query["hang_ms"]) if "hang_ms" in query else None
+                        )
+                    except ValueError as e:
+                        self._send_json(400, {"error": str(e)})
+                        return
+                    self._send_json(200, {"mode": stub.mode, "latency_ms": stub.latency_ms,
+                                          "hang_ms": stub.hang_ms, "request_count": stub.request_count})
+                    return
+
+                if parsed.path != "/reverse":
+                    self._send_json(404, {"error": "not found"})
+                    return
+
+                with stub._lock:
+                    stub.request_count += 1
+                mode = stub.mode
+                if stub.latency_ms:
+                    time.sleep(stub.latency_ms / 1000.0)
+
+                if mode == "down":
+                    self.close_connection = True
+                    self.connection.close()
+                    return
+                if mode == "error":
+                    self._send_json(500, {"error": "stub error"})
+                    return
+                if mode == "ratelimit":
+                    self._send_json(429, {"error": "rate limited"}, {"Retry-After": "1"})
+                    return
+                if mode == "slow":
+                    time.sleep(stub.hang_ms / 1000.0)
+
+                try:
+                    lat = float(query.get("lat", "0"))
+                    lon = float(query.get("lon", "0"))
+                except ValueError:
+                    self._send_json(400, {"error": "invalid coordinates"})
+                    return
+                self._send_json(200, {
+                    "lat": str(lat),
+                    "lon": str(lon),
+                    "display_name": f"스텁 주소 ({lat:.4f}, {lon:.4f})",
+                    "address": {
+                        "road": f"스텁로 {abs(int(lat * 100)) % 100}",
+                        "city": "스텁시",
+                        "country": "대한민국"
+                    }
+                })
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="테스트용 역지오코딩 스텁 서버")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--mode", choices=MODES, default="ok")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--hang-ms", type=float, default=10000.0)
+    args = parser.parse_args()
+
+    stub = StubGeocoder(args.host, args.port, args.mode, args.latency_ms, args.hang_ms)
+    print(f"스텁 지오코더 실행 중: {stub.url} (mode={args.mode})")
+    try:
+        stub.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
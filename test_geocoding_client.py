@@ -0,0 +1,130 @@
+"""역지오코딩 클라이언트 계층 테스트 스크립트 (로컬 스텁 서버 사용, 외부 네트워크 불필요)"""
+import sys
+import os
+import time
+
+# Windows 콘솔 인코딩 설정
+if sys.platform == 'win32':
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+try:
+    import server
+    from stub_geocoder import StubGeocoder
+
+    primary = StubGeocoder().start()
+    secondary = StubGeocoder().start()
+
+    # 1. 정상 응답
+    server._geocoding_client = server._GeocodingClient(primary.url, rate_per_sec=20.0)
+    address = server.reverse_geocode(37.5665, 126.9780)
+    assert address and "스텁시" in address, address
+    print(f"[OK] 스텁 서버 역지오코딩: {address}")
+
+    # 2. 속도 제한: 초당 5회로 제한하면 6번 요청에 약 1초 소요
+    server._geocoding_client = server._GeocodingClient(primary.url, rate_per_sec=5.0)
+    start = time.monotonic()
+    for _ in range(6):
+        server.reverse_geocode(37.5, 127.0)
+    elapsed = time.monotonic() - start
+    assert elapsed >= 0.9, elapsed
+    print(f"[OK] 속도 제한 적용: 6회 요청 {elapsed:.2f}초")
+
+    # 3. 서킷 브레이커: 장애 시 threshold번 실패 후에는 네트워크 요청 없이 즉시 실패
+    primary.set(mode="error")
+    client = server._GeocodingClient(primary.url, rate_per_sec=100.0, breaker_threshold=3,
+                                     breaker_reset_sec=0.5)
+    server._geocoding_client = client
+    for _ in range(3):
+        assert server.reverse_geocode(37.5, 127.0) is None
+    before = primary.request_count
+    start = time.monotonic()
+    for _ in range(100):
+        assert server.reverse_geocode(37.5, 127.0) is None
+    per_call_ms = (time.monotonic() - start) * 1000 / 100
+    assert primary.request_count == before, "차단 중에는 요청이 나가지 않아야 합니다"
+    assert client.status()[0]["breaker"] == "open"
+    print(f"[OK] 서킷 브레이커 차단: 사진당 {per_call_ms:.3f}ms")
+
+    # 차단 시간이 지나고 서버가 복구되면 시험 요청 후 다시 닫힘
+    primary.set(mode="ok")
+    time.sleep(0.6)
+    assert server.reverse_geocode(37.5, 127.0)
+    assert client.status()[0]["breaker"] == "closed"
+    print("[OK] 서킷 브레이커 복구 (half-open → closed)")
+
+    # 4. 429 응답 시 요청 속도 감소
+    primary.set(mode="ratelimit")
+    client = server._GeocodingClient(primary.url, rate_per_sec=4.0)
+    server._geocoding_client = client
+    server.reverse_geocode(37.5, 127.0, timeout=0.5)
+    assert client.status()[0]["rate_per_sec"] < 4.0
+    print(f"[OK] 429 응답 후 요청 속도 감소: {client.status()[0]['rate_per_sec']}회/초")
+    primary.set(mode="ok")
+
+    # 5. 헤지 요청: 기본 엔드포인트가 느리면 보조 엔드포인트 응답 사용
+    primary.set(mode="slow", hang_ms=3000)
+    server._geocoding_client = server._GeocodingClient(primary.url, secondary.url, rate_per_sec=20.0,
+                                                       hedge_delay_sec=0.1)
+    start = time.monotonic()
+    address = server.reverse_geocode(37.5, 127.0)
+    elapsed = time.monotonic() - start
+    assert address and elapsed < 1.0, (address, elapsed)
+    print(f"[OK] 헤지 요청: 보조 엔드포인트 응답 {elapsed * 1000:.0f}ms")
+
+    # 6. 우회: 기본 엔드포인트가 다운되면 보조 엔드포인트 사용
+    primary.set(mode="down")
+    server._geocoding_client = server._GeocodingClient(primary.url, secondary.url, rate_per_sec=20.0)
+    assert server.reverse_geocode(37.5, 127.0)
+    print("[OK] 기본 엔드포인트 장애 시 보조 엔드포인트로 우회")
+
+    # 7. 지연 주소 해석기는 클라이언트의 속도 제한만 따름 (별도 요청 간격 없음)
+    primary.set(mode="ok")
+    server._geocoding_client = server._GeocodingClient(primary.url, rate_per_sec=20.0)
+    resolver = server._AddressResolver()
+    start = time.monotonic()
+    handles = [resolver.submit(36.0 + i * 0.01, 127.0) for i in range(10)]
+    while any(resolver.get(handle)["status"] == "pending" for handle in handles):
+        assert time.monotonic() - start < 5.0, "지연 주소 해석이 끝나지 않았습니다"
+        time.sleep(0.02)
+    elapsed = time.monotonic() - start
+    assert all(resolver.get(handle)["status"] == "resolved" for handle in handles)
+    assert elapsed < 2.0, elapsed
+    print(f"[OK] 지연 주소 해석 10건 {elapsed:.2f}초 (클라이언트 속도 제한 초당 20회)")
+
+    # 8. 장애 중 실패한 주소 핸들은 같은 좌표를 다시 요청하면 재시도됨
+    primary.set(mode="error")
+    server._geocoding_client = server._GeocodingClient(primary.url, rate_per_sec=100.0, breaker_threshold=100)
+    resolver = server._AddressResolver()
+    handle = resolver.submit(35.1796, 129.0756)
+    start = time.monotonic()
+    while resolver.get(handle)["status"] == "pending":
+        assert time.monotonic() - start < 5.0, "실패 처리가 끝나지 않았습니다"
+        time.sleep(0.02)
+    assert resolver.get(handle)["status"] == "failed"
+    primary.set(mode="ok")
+    before = primary.request_count
+    assert resolver.submit(35.1796, 129.0756) == handle
+    while resolver.get(handle)["status"] == "pending":
+        assert time.monotonic() - start < 5.0, "재시도한 주소 해석이 끝나지 않았습니다"
+        time.sleep(0.02)
+    assert resolver.get(handle)["status"] == "resolved" and primary.request_count > before
+    print("[OK] 실패한 주소 핸들 재요청 시 재시도")
+    
+    primary.stop()
+    secondary.stop()
+    print("\n[SUCCESS] 역지오코딩 클라이언트 검증 완료!")
+
+except AssertionError as e:
+    print(f"[ERROR] 검증 실패: {e}")
+    import traceback
+    traceback.print_exc()
+    sys.exit(1)
+except Exception as e:
+    print(f"[ERROR] 오류 발생: {e}")
+    import traceback
+    traceback.print_exc()
+    sys.exit(1)
@@ -11,6 +11,84 @@ if sys.platform == 'win32':
 # 현재 디렉토리를 경로에 추가
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+import json
+import functools
+import time
+import shutil
+import calendar
+import tempfile
+from pathlib import Path
+
+import piexif
+from PIL import Image
+
+# 테스트 중에는 사용자의 카탈로그/스냅샷 파일을 건드리지 않도록 임시 경로 사용
+TEST_DIR = Path(tempfile.mkdtemp(prefix="mcp-photo-test-"))
+os.environ["LOCATION_CATALOG_PATH"] = str(TEST_DIR / "catalog.bin")
+os.environ["SNAPSHOT_PATH"] = str(TEST_DIR / "snapshot.json.gz")
+os.environ["SNAPSHOT_INTERVAL_SEC"] = "0"
+
+
+def fixture_dir(name: str) -> Path:
+    path = TEST_DIR / name
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def to_dms(value: float):
+    """십진 도 값을 EXIF 도/분/초 유리수 튜플로 변환합니다."""
+    value = abs(value)
+    degrees = int(value)
+    minutes = int((value - degrees) * 60)
+    seconds = round(((value - degrees) * 60 - minutes) * 60 * 10000)
+    return ((degrees, 1), (minutes, 1), (seconds, 10000))
+
+
+def make_exif(latitude=None, longitude=None, taken_at=None) -> bytes:
+    """테스트용 EXIF(piexif.dump 결과, "Exif\\0\\0"로 시작)를 만듭니다."""
+    exif = {"0th": {}, "Exif": {}, "GPS": {}}
+    if latitude is not None:
+        exif["GPS"] = {
+            piexif.GPSIFD.GPSLatitudeRef: b"N" if latitude >= 0 else b"S",
+            piexif.GPSIFD.GPSLatitude: to_dms(latitude),
+            piexif.GPSIFD.GPSLongitudeRef: b"E" if longitude >= 0 else b"W",
+            piexif.GPSIFD.GPSLongitude: to_dms(longitude),
+        }
+    if taken_at is not None:
+        exif["Exif"][piexif.ExifIFD.DateTimeOriginal] = \
+            time.strftime("%Y:%m:%d %H:%M:%S", time.gmtime(taken_at)).encode("ascii")
+    return piexif.dump(exif)
+
+
+def make_jpeg(path, latitude=None, longitude=None, taken_at=None) -> Path:
+    """위치/촬영 시각을 EXIF에 기록한 작은 JPEG를 만듭니다."""
+    Image.new("RGB", (16, 16), (120, 80, 40)).save(path, "JPEG", exif=make_exif(latitude, longitude, taken_at))
+    return Path(path)
+
+
+def make_heif(path, latitude, longitude) -> Path:
+    """meta(iinf/iloc) 박스가 mdat 안의 Exif 아이템을 가리키는 최소 HEIF 파일을 만듭니다."""
+    import struct
+    
+    def box(box_type, payload):
+        return struct.pack(">I", 8 + len(payload)) + box_type + payload
+    
+    def full_box(box_type, version, payload):
+        return box(box_type, bytes([version, 0, 0, 0]) + payload)
+    
+    exif_item = struct.pack(">I", 6) + make_exif(latitude, longitude)
+    ftyp = box(b"ftyp", b"heic" + b"\x00" * 4 + b"mif1heic")
+    iinf = full_box(b"iinf", 0, struct.pack(">H", 1) + full_box(b"infe", 2, struct.pack(">HH", 1, 0) + b"Exif\x00"))
+    
+    def meta(exif_offset):
+        iloc = full_box(b"iloc", 0, bytes([0x44, 0x00]) + struct.pack(">HHHHII", 1, 1, 0, 1, exif_offset, len(exif_item)))
+        return full_box(b"meta", 0, iinf + iloc)
+    
+    exif_offset = len(ftyp) + len(meta(0)) + 8
+    Path(path).write_bytes(ftyp + meta(exif_offset) + box(b"mdat", exif_item + b"\x00" * 4096))
+    return Path(path)
+
+
 try:
     import server
     print("[OK] 서버 모듈 로드 성공")
@@ -40,9 +118,604 @@ try:
     if hasattr(server, 'extract_gps_from_exif'):
         print("[OK] extract_gps_from_exif 함수 존재")
     
+    # PNG(eXIf)/WebP(EXIF 청크)/HEIF(meta/iloc)에서 픽셀을 디코딩하지 않고 GPS 추출
+    formats_dir = fixture_dir("formats")
+    Image.new("RGB", (64, 64), (10, 120, 200)).save(formats_dir / "a.png", "PNG", exif=make_exif(35.6812, 139.7671))
+    Image.new("RGB", (64, 64), (10, 120, 200)).save(formats_dir / "b.webp", "WEBP", exif=make_exif(-33.8568, 151.2153))
+    make_heif(formats_dir / "c.heic", 48.8584, 2.2945)
+    for name, expected in (("a.png", (35.6812, 139.7671)), ("b.webp", (-33.8568, 151.2153)), ("c.heic", (48.8584, 2.2945))):
+        gps_data = server.extract_gps_from_exif(str(formats_dir / name))
+        assert gps_data and abs(gps_data["latitude"] - expected[0]) < 1e-6 \
+            and abs(gps_data["longitude"] - expected[1]) < 1e-6, (name, gps_data)
+    # 픽셀 데이터가 잘려 있어도 메타데이터만 읽으므로 위치를 찾음
+    png_bytes = (formats_dir / "a.png").read_bytes()
+    (formats_dir / "cut.png").write_bytes(png_bytes[:png_bytes.index(b"IDAT") + 16])
+    assert abs(server.extract_gps_from_exif(str(formats_dir / "cut.png"))["latitude"] - 35.6812) < 1e-6
+    Image.new("RGB", (8, 8)).save(formats_dir / "plain.png", "PNG")
+    assert server.extract_gps_from_exif(str(formats_dir / "plain.png")) is None
+    print("[OK] PNG/WebP/HEIF 위치 추출 (픽셀 디코딩 없음)")
+    
+    # 결과 캐시: 같은 인자는 캐시에서 반환하고, 디렉토리가 바뀌면 다시 계산
+    cache_puts = []
+    cache_put = server._result_cache.put
+    
+    def counting_put(key, value, *origin):
+        cache_puts.append(key)
+        cache_put(key, value, *origin)
+    
+    server._result_cache.put = counting_put
+    cache_dir = fixture_dir("cache")
+    make_jpeg(cache_dir / "a.jpg", 37.5665, 126.9780, 1714500000)
+    make_jpeg(cache_dir / "b.jpg", 37.5700, 126.9800, 1714500005)
+    first = server._batch_get_photo_locations_impl(str(cache_dir), address_mode="none")
+    assert len(cache_puts) == 1
+    assert server._batch_get_photo_locations_impl(str(cache_dir), address_mode="none") == first
+    assert len(cache_puts) == 1, "두 번째 호출은 캐시에서 반환되어야 합니다"
+    make_jpeg(cache_dir / "c.jpg", 37.5800, 126.9900, 1714500010)
+    changed = json.loads(server._batch_get_photo_locations_impl(str(cache_dir), address_mode="none"))
+    assert changed["total_images"] == 3 and len(cache_puts) == 2, changed
+    print("[OK] 결과 캐시 적중 및 디렉토리 변경 시 무효화")
+    
+    # 지문은 TTL 동안 재사용되어 페이지마다 트리 전체를 다시 stat하지 않음
+    fingerprint_calls = []
+    directory_fingerprint = server._directory_fingerprint
+    
+    def counting_fingerprint(*args):
+        fingerprint_calls.append(args)
+        return directory_fingerprint(*args)
+    
+    server._directory_fingerprint = counting_fingerprint
+    server._fingerprint_memo.clear()
+    page = json.loads(server._batch_get_photo_locations_impl(str(cache_dir), address_mode="none", page_size=1))
+    while page.get("next_cursor"):
+        page = json.loads(server._batch_get_photo_locations_impl(
+            str(cache_dir), address_mode="none", page_size=1, cursor=page["next_cursor"]))
+    assert len(fingerprint_calls) == 1, fingerprint_calls
+    nested_dir = fixture_dir("cache_nested")
+    make_jpeg(fixture_dir("cache_nested/sub") / "a.jpg", 37.5665, 126.9780, 1714500000)
+    first = json.loads(server._batch_get_photo_locations_impl(str(nested_dir), recursive=True, address_mode="none"))
+    make_jpeg(nested_dir / "sub" / "b.jpg", 37.5700, 126.9800, 1714500005)
+    ttl = server.FINGERPRINT_TTL_SEC
+    server.FINGERPRINT_TTL_SEC = 0
+    second = json.loads(server._batch_get_photo_locations_impl(str(nested_dir), recursive=True, address_mode="none"))
+    server.FINGERPRINT_TTL_SEC = ttl
+    server._directory_fingerprint = directory_fingerprint
+    assert first["total_images"] == 1 and second["total_images"] == 2, (first, second)
+    print("[OK] 디렉토리 지문 TTL 재사용")
+    
+    # 지오코더 장애 중 주소 없이 나온 결과는 캐시하지 않으므로, 복구 후 같은 호출에서 주소를 받음
+    from stub_geocoder import StubGeocoder
+    stub = StubGeocoder().start()
+    geocoding_client = server._geocoding_client
+    server._geocoding_client = server._GeocodingClient(stub.url, rate_per_sec=100.0, breaker_threshold=100)
+    calls = {
+        "geofence_photos": lambda: server._geofence_photos_impl(str(cache_dir), 37.5665, 126.9780, 5.0),
+        "batch_get_photo_locations": lambda: server._batch_get_photo_locations_impl(str(cache_dir)),
+        "group_photo_bursts": lambda: server._group_photo_bursts_impl(
+            str(cache_dir), max_distance_m=5000, max_interval_sec=1e9, address_mode="sync")
+    }
+    for tool_name, call in calls.items():
+        stub.set(mode="error")
+        puts = len(cache_puts)
+        assert "address" not in call()
+        assert len(cache_puts) == puts, f"{tool_name}: 주소 변환 실패 결과가 캐시되었습니다"
+        stub.set(mode="ok")
+        recovered = call()
+        assert "스텁시" in recovered, f"{tool_name}: 지오코더 복구 후에도 주소가 없습니다"
+        puts = len(cache_puts)
+        assert call() == recovered and len(cache_puts) == puts
+        server._address_resolver = server._AddressResolver()
+    server._geocoding_client = geocoding_client
+    stub.stop()
+    print("[OK] 지오코더 장애 중 결과는 캐시하지 않고, 복구 후 주소를 다시 받음")
+    
+    # 재귀 스캔: 깊이 제한과 include/exclude 패턴, 워커 프로세스 분산 결과가 순차 스캔과 같음
+    tree_dir = fixture_dir("tree")
+    for relative_path in ["a.jpg", "skip_a.jpg", "d1/b.jpg", "d1/skip_b.jpg", "d1/d2/c.jpg",
+                          "d1/d2/d3/d.jpg", "raw/e.jpg"] + [f"d1/many/{index:02d}.jpg" for index in range(9)]:
+        (tree_dir / relative_path).parent.mkdir(parents=True, exist_ok=True)
+        make_jpeg(tree_dir / relative_path, 37.5, 127.0, 1714500000)
+    (tree_dir / "d1" / "notes.txt").write_text("not an image")
+    many = {f"d1/many/{index:02d}.jpg" for index in range(9)}
+    scan_cases = [
+        ({"max_depth": 0}, {"a.jpg", "skip_a.jpg"}),
+        ({"max_depth": 1}, {"a.jpg", "skip_a.jpg", "d1/b.jpg", "d1/skip_b.jpg", "raw/e.jpg"}),
+        ({"max_depth": 2}, {"a.jpg", "skip_a.jpg", "d1/b.jpg", "d1/skip_b.jpg", "d1/d2/c.jpg", "raw/e.jpg"} | many),
+        ({"max_depth": None, "exclude": ["skip_*", "raw"]}, {"a.jpg", "d1/b.jpg", "d1/d2/c.jpg", "d1/d2/d3/d.jpg"} | many),
+        ({"max_depth": None, "include": ["d1/d2/*"]}, {"d1/d2/c.jpg", "d1/d2/d3/d.jpg"}),  # fnmatch의 *는 /도 포함
+        ({"max_depth": None, "include": ["*.jpg"], "exclude": ["many", "d3"]},
+         {"a.jpg", "skip_a.jpg", "d1/b.jpg", "d1/skip_b.jpg", "d1/d2/c.jpg", "raw/e.jpg"}),
+    ]
+    scan_workers, scan_chunk_size = server.SCAN_WORKERS, server.SCAN_CHUNK_SIZE
+    try:
+        for workers in (1, 2):
+            server.SCAN_WORKERS = workers
+            server.SCAN_CHUNK_SIZE = 4  # 큰 디렉토리 분할 작업도 거치도록
+            server._reset_scan_pool()
+            for kwargs, expected in scan_cases:
+                scanned = [item[0] for item in server._iter_scanned_photos(tree_dir, **kwargs)]
+                assert len(scanned) == len(set(scanned)), (workers, kwargs, scanned)
+                assert set(scanned) == expected, (workers, kwargs, sorted(scanned))
+    finally:
+        if server._scan_pool is not None:
+            server._scan_pool.shutdown()
+        server.SCAN_WORKERS, server.SCAN_CHUNK_SIZE = scan_workers, scan_chunk_size
+        server._reset_scan_pool()
+    print("[OK] 재귀 스캔 깊이 제한/패턴 필터 (순차 = 워커 분산)")
+    
+    # 커서 페이지네이션: 페이지를 이어 받으면 중복/누락 없이 전체 결과와 같음
+    pages_dir = fixture_dir("pages")
+    for index in range(7):
+        make_jpeg(pages_dir / f"IMG_{index:02d}.jpg", 37.0 + index / 100, 127.0)
+    make_jpeg(pages_dir / "IMG_no_gps.jpg")
+    paged, cursor = [], None
+    while True:
+        page = json.loads(server._batch_get_photo_locations_impl(
+            str(pages_dir), address_mode="none", page_size=3, cursor=cursor))
+        assert len(page["images_with_location"]) <= 3, page
+        paged += [item["filename"] for item in page["images_with_location"]]
+        cursor = page.get("next_cursor")
+        if not cursor:
+            break
+    assert paged == [f"IMG_{index:02d}.jpg" for index in range(7)], paged
+    first_page = json.loads(server._batch_get_photo_locations_impl(str(pages_dir), address_mode="none", page_size=3))
+    other_query = json.loads(server._batch_get_photo_locations_impl(
+        str(pages_dir), address_mode="none", page_size=3, recursive=True, cursor=first_page["next_cursor"]))
+    assert "error" in other_query, "다른 인자로 받은 cursor는 거부되어야 합니다"
+    print("[OK] 커서 페이지네이션")
+    
+    # 취소와 진행 알림: 스캔 중 취소하면 워커가 멈추고 예약한 주소 핸들을 반납함
+    import anyio
+    cancel_dir = fixture_dir("cancel")
+    for index in range(60):
+        make_jpeg(fixture_dir(f"cancel/d{index // 10}") / f"IMG_{index:02d}.jpg", 37.0 + index / 100, 127.0)
+    controls, released, reports = [], [], []
+    
+    class RecordingControl(server._ScanControl):
+        def __init__(self):
+            super().__init__()
+            controls.append(self)
+    
+    class FakeContext:
+        async def report_progress(self, progress, total=None, message=None):
+            reports.append(progress)
+    
+    resolver = server._AddressResolver()
+    resolver_submit, resolver_release = resolver.submit, resolver.release
+    
+    def slow_submit(latitude, longitude):
+        time.sleep(0.03)
+        return resolver_submit(latitude, longitude)
+    
+    def recording_release(handles):
+        released.append(list(handles))
+        resolver_release(handles)
+    
+    resolver.submit, resolver.release = slow_submit, recording_release
+    saved = (server._ScanControl, server._address_resolver, server.reverse_geocode,
+             server.PROGRESS_INTERVAL_SEC, server.PIPELINE_QUEUE_SIZE)
+    server._ScanControl, server._address_resolver = RecordingControl, resolver
+    server.reverse_geocode = lambda latitude, longitude, timeout=5.0: "테스트시"
+    server.PROGRESS_INTERVAL_SEC, server.PIPELINE_QUEUE_SIZE = 0.05, 4
+    finished = []
+    
+    async def cancel_scan():
+        async def run():
+            await server._run_with_progress(FakeContext(), server._batch_get_photo_locations_impl,
+                                            str(cancel_dir), "deferred", recursive=True)
+            finished.append(True)
+        
+        async with anyio.create_task_group() as task_group:
+            task_group.start_soon(run)
+            while len(reports) < 3:
+                await anyio.sleep(0.01)
+            task_group.cancel_scope.cancel()
+    
+    try:
+        anyio.run(cancel_scan)
+        control = controls[-1]
+        for _ in range(200):
+            if released:
+                break
+            time.sleep(0.025)
+        assert not finished and control.cancelled
+        assert released == [control.address_handles] and control.address_handles, "예약한 핸들이 반납되지 않았습니다"
+        parsed = control.parsed
+        time.sleep(0.3)
+        assert control.parsed == parsed < 60, f"취소 후에도 스캔이 계속되었습니다: {parsed} -> {control.parsed}"
+        assert reports == sorted(reports) and reports[0] < reports[-1], reports
+    finally:
+        (server._ScanControl, server._address_resolver, server.reverse_geocode,
+         server.PROGRESS_INTERVAL_SEC, server.PIPELINE_QUEUE_SIZE) = saved
+    print("[OK] 스캔 취소 (워커 중단, 주소 핸들 반납) 및 진행 알림 증가")
+    
+    # 시간 예산: 주소 변환이 느리면 지금까지의 결과를 partial로 반환하고, 커서로 나머지를 이어 받음
+    reverse_geocode = server.reverse_geocode
+    
+    def slow_geocode(latitude, longitude, timeout=5.0):
+        # 요청마다 100ms 걸리는 지오코더 (그보다 짧은 timeout이면 시간 초과)
+        time.sleep(min(0.1, timeout))
+        return f"주소 ({latitude:.4f}, {longitude:.4f})" if timeout >= 0.1 else None
+    
+    server.reverse_geocode = slow_geocode
+    deadline_dir = fixture_dir("deadline")
+    for index in range(6):
+        make_jpeg(deadline_dir / f"IMG_{index}.jpg", 36.0 + index / 10, 128.0)
+    resumed, handles, cursor, calls = [], [], None, 0
+    while True:
+        started = time.monotonic()
+        page = json.loads(server._batch_get_photo_locations_impl(str(deadline_dir), deadline_ms=250, cursor=cursor))
+        calls += 1
+        assert time.monotonic() - started < 1.0, "시간 예산을 크게 넘겼습니다"
+        assert all("address" in item or "address_handle" in item for item in page["images_with_location"]), page
+        resumed += [item["filename"] for item in page["images_with_location"]]
+        handles += [item["address_handle"] for item in page["images_with_location"] if "address_handle" in item]
+        cursor = page["next_cursor"]
+        if not page["partial"]:
+            assert cursor is None
+            break
+        assert cursor, page
+    assert calls > 1, "느린 지오코더에서 partial 결과가 나와야 합니다"
+    assert resumed == [f"IMG_{index}.jpg" for index in range(6)], resumed
+    # 예산을 넘겨 핸들로 남긴 주소는 백그라운드에서 해석됨
+    waited = time.monotonic()
+    while any(server._address_resolver.get(handle)["status"] == "pending" for handle in handles):
+        assert time.monotonic() - waited < 5.0, "주소 핸들이 해석되지 않았습니다"
+        time.sleep(0.05)
+    assert all(server._address_resolver.get(handle)["status"] == "resolved" for handle in handles)
+    server.reverse_geocode = reverse_geocode
+    print("[OK] 시간 예산 초과 시 partial 결과와 이어 받기 커서")
+    
+    # 위치 카탈로그: 색인한 뒤 카탈로그 조회 결과가 파일 스캔 결과와 같음
+    catalog_dir = fixture_dir("catalog")
+    may_first = calendar.timegm((2024, 5, 1, 0, 0, 0))
+    for index, (hour, latitude) in enumerate([(9, 33.25), (18, 33.45), (32, 33.50), (-3, 37.55)]):
+        make_jpeg(catalog_dir / f"photo{index}.jpg", latitude, 126.55, may_first + hour * 3600)
+    built = json.loads(server._build_location_catalog_impl(str(catalog_dir)))
+    assert built["indexed_images"] == 4 and built["catalog_images"] == 4, built
+    fenced = {}
+    for use_catalog in (False, True):
+        result = json.loads(server._geofence_photos_impl(
+            str(catalog_dir), 33.3, 126.55, 30.0, address_mode="none", use_catalog=use_catalog))
+        fenced[use_catalog] = sorted(item["filename"] for item in result["images"])
+    assert fenced[True] == fenced[False] == ["photo0.jpg", "photo1.jpg", "photo2.jpg"], fenced
+    print("[OK] 위치 카탈로그 색인 및 카탈로그 지오펜스")
+    
+    # query_photos: 위도/촬영 시각 정렬 인덱스로 후보를 줄인 뒤 나머지 조건 적용
+    ranged = json.loads(server._query_photos_impl(
+        taken_after="2024-05-01T09:00:00", taken_before="2024-05-01T18:00:00", sort_by="taken_at"))
+    assert ranged["query_plan"]["index"] == "taken_at", ranged
+    assert [item["filename"] for item in ranged["images"]] == ["photo0.jpg", "photo1.jpg"], ranged
+    boxed = json.loads(server._query_photos_impl(bbox=[33.0, 126.0, 34.0, 127.0], sort_by="taken_at", descending=True))
+    assert boxed["query_plan"]["index"] == "latitude", boxed
+    assert [item["filename"] for item in boxed["images"]] == ["photo2.jpg", "photo1.jpg", "photo0.jpg"], boxed
+    # 서 > 동이면 날짜변경선을 넘는 영역: [126, 180] + [-180, -170]
+    crossing = json.loads(server._query_photos_impl(bbox=[33.0, 126.0, 34.0, -170.0], sort_by="taken_at"))
+    assert [item["filename"] for item in crossing["images"]] == ["photo0.jpg", "photo1.jpg", "photo2.jpg"], crossing
+    outside = json.loads(server._query_photos_impl(bbox=[33.0, 127.0, 34.0, -170.0]))
+    assert outside["total_matching_images"] == 0, outside
+    until_morning = json.loads(server._query_photos_impl(taken_before="2024-05-01T09:00:00"))
+    assert until_morning["total_matching_images"] == 2, until_morning
+    print("[OK] query_photos 범위 조건과 정렬")
+    
+    # 날짜만 준 taken_before는 그날 전체를 포함
+    same_day = json.loads(server._query_photos_impl(taken_after="2024-05-01", taken_before="2024-05-01", sort_by="taken_at"))
+    assert [item["filename"] for item in same_day["images"]] == ["photo0.jpg", "photo1.jpg"], same_day
+    print("[OK] query_photos 날짜만 준 taken_before는 그날 전체 포함")
+    
+    # 위치 카탈로그 병합: 하위 디렉토리를 다시 색인하면 그 아래 항목만 교체되고 경로 순서 유지
+    make_jpeg(fixture_dir("catalog/sub") / "inner.jpg", 35.10, 129.04, may_first)
+    merged = json.loads(server._build_location_catalog_impl(str(catalog_dir / "sub")))
+    assert merged["indexed_images"] == 1 and merged["catalog_images"] == 5, merged
+    everything = json.loads(server._query_photos_impl(limit=10))
+    paths = [item["path"] for item in everything["images"]]
+    assert paths == sorted(paths, key=os.path.split) and len(paths) == 5, paths
+    tiles = json.loads(server._photo_density_tiles_impl(str(catalog_dir), zoom_levels=[0, 6], use_catalog=True))
+    assert tiles["levels"][0]["cells"][0]["count"] == 5, tiles
+    assert sum(cell["count"] for cell in tiles["levels"][1]["cells"]) == 5, tiles
+    print("[OK] 위치 카탈로그 병합")
+    
+    # 밀도 타일: 레벨마다 개수 합이 전체와 같고, 영역/셀 수 제한을 적용하며, 피라미드를 재사용
+    tiles_dir = fixture_dir("tiles")
+    for index in range(5):
+        make_jpeg(tiles_dir / f"seoul{index}.jpg", 37.5665 + index / 1000, 126.9780)
+    for index in range(2):
+        make_jpeg(tiles_dir / f"busan{index}.jpg", 35.1796, 129.0756 + index / 1000)
+    make_jpeg(tiles_dir / "no_gps.jpg")
+    tiles = json.loads(server._photo_density_tiles_impl(str(tiles_dir), zoom_levels=[2, 12]))
+    assert tiles["total_images"] == 7, tiles
+    for level in tiles["levels"]:
+        assert sum(cell["count"] for cell in level["cells"]) == 7, level
+    top = tiles["levels"][1]["cells"][0]
+    assert top["count"] == 5 and top["weight"] == 1.0, top
+    assert top["bounds"][0] <= 37.5665 <= top["bounds"][2] and top["bounds"][1] <= 126.9780 <= top["bounds"][3], top
+    pyramids = dict(server._tile_pyramids)
+    limited = json.loads(server._photo_density_tiles_impl(
+        str(tiles_dir), zoom_levels=[12], bounds=[34.0, 128.0, 36.0, 130.0], max_cells=1))
+    assert [cell["count"] for cell in limited["levels"][0]["cells"]] == [2], limited
+    assert dict(server._tile_pyramids) == pyramids, "기존 피라미드에 있는 줌 레벨 요청은 다시 스캔하지 않아야 합니다"
+    truncated = json.loads(server._photo_density_tiles_impl(str(tiles_dir), zoom_levels=[12], max_cells=1))
+    assert truncated["levels"][0]["truncated"] and truncated["levels"][0]["cells"][0]["count"] == 5, truncated
+    from_catalog = json.loads(server._photo_density_tiles_impl(str(catalog_dir), zoom_levels=[0, 9], use_catalog=True))
+    from_files = json.loads(server._photo_density_tiles_impl(str(catalog_dir), zoom_levels=[0, 9]))
+    assert from_catalog["levels"] == from_files["levels"], (from_catalog, from_files)
+    fiji_dir = fixture_dir("tiles_antimeridian")
+    make_jpeg(fiji_dir / "east.jpg", -17.0, 179.5)
+    make_jpeg(fiji_dir / "west.jpg", -17.0, -179.5)
+    make_jpeg(fiji_dir / "seoul.jpg", 37.5665, 126.9780)
+    crossing = json.loads(server._photo_density_tiles_impl(
+        str(fiji_dir), zoom_levels=[4], bounds=[-20.0, 170.0, -10.0, -170.0]))
+    assert sorted(cell["count"] for cell in crossing["levels"][0]["cells"]) == [1, 1], crossing
+    assert "error" in json.loads(server._photo_density_tiles_impl(str(fiji_dir), bounds=[10.0, 0.0, -10.0, 1.0]))
+    print("[OK] 밀도 타일 집계/영역 제한/피라미드 재사용 (날짜변경선을 넘는 영역 포함)")
+    
+    # 스냅샷: 체크포인트 후 재시작하면 결과를 복원하고, 그 사이 바뀐 디렉토리의 결과만 제거
+    import gzip
+    result_cache = server._result_cache
+    server._result_cache = server._ResultCache()
+    try:
+        snapshot_path = TEST_DIR / "warm.json.gz"
+        kept_dir, edited_dir = fixture_dir("snapshot_kept"), fixture_dir("snapshot_edited")
+        make_jpeg(kept_dir / "a.jpg", 37.5665, 126.9780)
+        make_jpeg(edited_dir / "b.jpg", 35.1796, 129.0756)
+        kept = server._batch_get_photo_locations_impl(str(kept_dir), "none")
+        server._batch_get_photo_locations_impl(str(edited_dir), "none")
+        keys = {Path(origin[0]).name: key for key, _, origin in server._result_cache.export()}
+        assert set(keys) == {"snapshot_kept", "snapshot_edited"}, keys
+        manager = server._SnapshotManager(snapshot_path, 60)
+        manager.state = "ready"
+        assert manager.checkpoint() and not manager.checkpoint(), "변경이 없으면 다시 기록하지 않아야 합니다"
+        
+        make_jpeg(edited_dir / "c.jpg", 35.1800, 129.0800)
+        server._result_cache = server._ResultCache()
+        restarted = server._SnapshotManager(snapshot_path, 60)
+        restarted.validate(restarted.restore())
+        assert restarted.restored_results == 2 and restarted.invalidated_results == 1, restarted.status()
+        assert server._result_cache.get(keys["snapshot_edited"]) is None
+        version = server._result_cache.version
+        assert server._batch_get_photo_locations_impl(str(kept_dir), "none") == kept
+        assert server._result_cache.version == version, "바뀌지 않은 디렉토리는 복원한 결과를 반환해야 합니다"
+        edited = json.loads(server._batch_get_photo_locations_impl(str(edited_dir), "none"))
+        assert edited["total_images"] == 2, edited
+        
+        other_version = {"version": server.SNAPSHOT_FORMAT_VERSION + 1,
+                         "results": [[keys["snapshot_kept"], kept, [str(kept_dir), [], [], 0]]]}
+        for name, content in [("other_version.json.gz", gzip.compress(json.dumps(other_version).encode("utf-8"))),
+                              ("corrupt.json.gz", b"not a gzip file"),
+                              ("truncated.json.gz", gzip.compress(b'{"version": 1, "results": [')[:-8])]:
+            (TEST_DIR / name).write_bytes(content)
+            ignored = server._SnapshotManager(TEST_DIR / name, 60)
+            assert ignored.restore() == [] and ignored.restored_results == 0, name
+        assert server._SnapshotManager(TEST_DIR / "missing.json.gz", 60).restore() == []
+    finally:
+        server._result_cache = result_cache
+    print("[OK] 스냅샷 체크포인트/복원 (바뀐 디렉토리 제거, 버전 불일치/손상 파일 무시)")
+    
+    # 동시 실행 제한: 스캔 격벽이 가득 차면 즉시 거절하고, 그동안 조회 호출은 계속 실행됨
+    from types import SimpleNamespace
+    from fastmcp.exceptions import ToolError
+    
+    def tool_call(name, client=None):
+        fastmcp_context = SimpleNamespace(client_id=client, session_id=client) if client else None
+        return SimpleNamespace(message=SimpleNamespace(name=name), fastmcp_context=fastmcp_context)
+    
+    async def exercise_limits():
+        gate = anyio.Event()
+        
+        async def blocked(context):
+            await gate.wait()
+            return context.message.name
+        
+        async def immediate(context):
+            return context.message.name
+        
+        async def rejection(limits, context):
+            try:
+                await limits.on_call_tool(context, immediate)
+            except ToolError as e:
+                return json.loads(str(e))
+            raise AssertionError("거절되어야 할 호출이 실행되었습니다")
+        
+        limits = server._ConcurrencyLimitMiddleware(
+            scan=server._Bulkhead("scan", 1, 1), lookup=server._Bulkhead("lookup", 2, 0),
+            tool_limits={}, client_max_concurrent=0
+        )
+        finished = []
+        
+        async def scan():
+            finished.append(await limits.on_call_tool(tool_call("batch_get_photo_locations"), blocked))
+        
+        async with anyio.create_task_group() as task_group:
+            task_group.start_soon(scan)
+            task_group.start_soon(scan)
+            await anyio.sleep(0.05)
+            assert limits.status()["scan"]["active"] == 1 and limits.status()["scan"]["queued"] == 1
+            rejected = await rejection(limits, tool_call("geofence_photos"))
+            assert rejected["retryable"] and rejected["limit"]["max_queue"] == 1, rejected
+            assert await limits.on_call_tool(tool_call("get_photo_location"), immediate) == "get_photo_location"
+            gate.set()
+        assert len(finished) == 2 and limits.status()["scan"]["active"] == 0 and limits.status()["scan"]["rejected"] == 1
+        
+        gate = anyio.Event()
+        limits = server._ConcurrencyLimitMiddleware(
+            scan=server._Bulkhead("scan", 4, 0), lookup=server._Bulkhead("lookup", 4, 4),
+            tool_limits={"geofence_photos": 1}, client_max_concurrent=1
+        )
+        async with anyio.create_task_group() as task_group:
+            task_group.start_soon(limits.on_call_tool, tool_call("geofence_photos", "alice"), blocked)
+            await anyio.sleep(0.05)
+            rejected = await rejection(limits, tool_call("get_photo_location", "alice"))
+            assert rejected["limit"] == {"client_max_concurrent": 1}, rejected
+            assert await limits.on_call_tool(tool_call("get_photo_location", "bob"), immediate) == "get_photo_location"
+            rejected = await rejection(limits, tool_call("geofence_photos", "bob"))
+            assert rejected["tool"] == "geofence_photos" and rejected["limit"]["max_concurrent"] == 1, rejected
+            gate.set()
+        assert limits.status()["clients_active"] == 0
+    
+    anyio.run(exercise_limits)
+    print("[OK] 동시 실행 제한 (격벽 거절, 스캔 포화 중 조회, 클라이언트별/도구별 상한)")
+    
+    # 프로파일링: PROFILE_DIR에 호출별 파일을 남기고, 분당 횟수 제한을 넘으면 프로파일 없이 실행
+    profile_saved = (server.PROFILE_DIR, server.PROFILE_MODE, server._profile_budget, server._CPROFILE_EXCLUSIVE)
+    profile_photo = str(cache_dir / "a.jpg")
+    expected_location = server.get_photo_location(profile_photo)
+    
+    class BusyProfile:
+        """다른 프로파일링 도구가 이미 켜져 있는 상태 (Python 3.12+의 cProfile 충돌)"""
+        def enable(self):
+            raise ValueError("Another profiling tool is already active")
+    
+    try:
+        for mode, exclusive, extension in [("cprofile", False, ".prof"), ("sample", False, ".folded"),
+                                           ("cprofile", True, ".folded")]:
+            profile_dir = TEST_DIR / f"profiles-{mode}-{exclusive}"
+            server.PROFILE_DIR, server.PROFILE_MODE, server._CPROFILE_EXCLUSIVE = str(profile_dir), mode, exclusive
+            server._profile_budget = server._TokenBucket(2 / 60.0)
+            for _ in range(3):
+                assert server.get_photo_location(profile_photo) == expected_location
+            written = sorted(path.suffix for path in profile_dir.iterdir())
+            assert written == [extension], (mode, exclusive, written)
+            asynchronous = json.loads(anyio.run(functools.partial(
+                server.batch_get_photo_locations, str(cache_dir), "none")))
+            assert asynchronous["total_images"] == 3, asynchronous
+            assert len(list(profile_dir.iterdir())) == 1, "분당 횟수 제한을 넘은 호출은 프로파일링하지 않아야 합니다"
+        
+        server.PROFILE_DIR, server.PROFILE_MODE, server._CPROFILE_EXCLUSIVE = str(TEST_DIR / "profiles-busy"), "cprofile", False
+        server._profile_budget = server._TokenBucket(60.0)
+        cprofile_class = server.cProfile.Profile
+        server.cProfile.Profile = BusyProfile
+        try:
+            assert server.get_photo_location(profile_photo) == expected_location
+        finally:
+            server.cProfile.Profile = cprofile_class
+        assert not (TEST_DIR / "profiles-busy").exists()
+    finally:
+        server.PROFILE_DIR, server.PROFILE_MODE, server._profile_budget, server._CPROFILE_EXCLUSIVE = profile_saved
+    print("[OK] 호출 프로파일링 (.prof/.folded 기록, 분당 횟수 제한, 프로파일러 충돌 시 생략)")
+    
+    # 업로드 경로: 원본 바이트와 multipart 본문
+    from starlette.applications import Starlette
+    from starlette.routing import Route
+    from starlette.testclient import TestClient
+    upload_app = Starlette(routes=[Route("/upload", server.upload_photo_location, methods=["POST"])])
+    client = TestClient(upload_app)
+    photo = make_jpeg(TEST_DIR / "upload.jpg", 37.5665, 126.9780).read_bytes()
+    response = client.post("/upload?address_mode=none", content=photo)
+    assert response.status_code == 200 and abs(response.json()["location"]["latitude"] - 37.5665) < 1e-6, response.text
+    response = client.post("/upload?address_mode=none", files=[
+        ("file", ("a.jpg", photo, "image/jpeg")), ("file", ("b.jpg", photo, "image/jpeg"))
+    ])
+    assert response.status_code == 200 and response.json()["images_with_location"] == 2, response.text
+    response = client.post("/upload?address_mode=none", content=b"not an image")
+    assert response.status_code == 400 and "error" in response.json(), response.text
+    print("[OK] 업로드 경로 (원본 바이트, multipart)")
+    
+    # 잘렸거나 형식이 잘못된 multipart 본문은 400
+    truncated = (
+        b'--XyZ\r\nContent-Disposition: form-data; name="file"; filename="a.jpg"\r\n'
+        b'Content-Type: image/jpeg\r\n\r\n' + photo[:len(photo) // 2]
+    )
+    for body in (truncated, b"not a multipart body"):
+        response = client.post("/upload?address_mode=none", content=body,
+                               headers={"content-type": "multipart/form-data; boundary=XyZ"})
+        assert response.status_code == 400 and "error" in response.json(), response.text
+    print("[OK] 잘린 multipart 업로드는 400")
+    
+    # 압축 파일 스캔: ZIP/tar/tar.gz 안의 사진이 압축을 푼 디렉토리 스캔 결과와 같음
+    import tarfile
+    import zipfile
+    archive_src = fixture_dir("archive_src")
+    make_jpeg(archive_src / "top.jpg", 37.1, 127.1)
+    make_jpeg(fixture_dir("archive_src/2024/05") / "deep.jpg", 37.2, 127.2)
+    make_jpeg(archive_src / "2024" / "no_gps.jpg")
+    (archive_src / "notes.txt").write_text("not a photo")
+    expected = json.loads(server._batch_get_photo_locations_impl(str(archive_src), "none", recursive=True))
+    expected_paths = sorted(item["relative_path"] for item in expected["images_with_location"])
+    assert expected_paths == ["2024/05/deep.jpg", "top.jpg"], expected_paths
+    members = sorted(path for path in archive_src.rglob("*") if path.is_file())
+    with zipfile.ZipFile(TEST_DIR / "photos.zip", "w") as archive:
+        for path in members:
+            archive.write(path, path.relative_to(archive_src).as_posix())
+    for name, mode in (("photos.tar", "w"), ("photos.tar.gz", "w:gz")):
+        with tarfile.open(TEST_DIR / name, mode) as archive:
+            for path in members:
+                archive.add(path, path.relative_to(archive_src).as_posix())
+    for name, kind in (("photos.zip", "zip"), ("photos.tar", "tar"), ("photos.tar.gz", "tar")):
+        scanned = json.loads(server._batch_get_photo_locations_impl(str(TEST_DIR / name), "none", recursive=True))
+        assert scanned["archive"] == kind, scanned
+        assert sorted(item["relative_path"] for item in scanned["images_with_location"]) == expected_paths, scanned
+        top_only = json.loads(server._batch_get_photo_locations_impl(str(TEST_DIR / name), "none"))
+        assert [item["filename"] for item in top_only["images_with_location"]] == ["top.jpg"], top_only
+    print("[OK] ZIP/tar 압축 파일 스캔")
+    
+    # GPX 지오태깅: 촬영 시각(현지 시각 + utc_offset_hours)으로 트랙을 보간해 GPS를 기록
+    geotag_dir = fixture_dir("geotag")
+    track_start = calendar.timegm((2024, 5, 1, 0, 0, 0))
+    points = "".join(
+        f'<trkpt lat="{37.0 + index * 0.001}" lon="127.0"><ele>{100 + index}</ele>'
+        f'<time>{time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(track_start + index * 10))}</time></trkpt>'
+        for index in range(10)
+    )
+    (TEST_DIR / "track.gpx").write_text(
+        '<?xml version="1.0"?><gpx version="1.1" xmlns="http://www.topografix.com/GPX/1/1">'
+        f'<trk><trkseg>{points}</trkseg></trk></gpx>')
+    korea = 9 * 3600
+    make_jpeg(geotag_dir / "a.jpg", taken_at=track_start + korea + 15)
+    make_jpeg(geotag_dir / "b.jpg", taken_at=track_start + korea + 42)
+    make_jpeg(geotag_dir / "tagged.jpg", 33.5, 126.5, track_start + korea + 20)
+    make_jpeg(geotag_dir / "late.jpg", taken_at=track_start + korea + 86400)
+    originals = {path.name: path.read_bytes() for path in geotag_dir.iterdir()}
+    
+    def geotag(**options):
+        return json.loads(server._geotag_photos_from_gpx_impl(
+            str(TEST_DIR / "track.gpx"), str(geotag_dir), utc_offset_hours=9, **options))
+    
+    preview = geotag(dry_run=True)
+    assert preview["status_counts"]["matched"] == 2, preview
+    assert {path.name: path.read_bytes() for path in geotag_dir.iterdir()} == originals, "dry_run이 파일을 수정했습니다"
+    written = geotag()
+    counts = written["status_counts"]
+    assert counts["tagged"] == 2 and counts["already_tagged"] == 1 and counts["outside_track"] == 1, counts
+    for name, seconds in (("a.jpg", 15), ("b.jpg", 42)):
+        gps_data = server.extract_gps_from_exif(str(geotag_dir / name))
+        assert abs(gps_data["latitude"] - (37.0 + seconds / 10 * 0.001)) < 1e-7, (name, gps_data)
+        assert abs(gps_data["altitude"] - (100 + seconds / 10)) < 0.01, (name, gps_data)
+        assert (geotag_dir / f"{name}.bak").read_bytes() == originals[name]
+        with Image.open(geotag_dir / name) as tagged, Image.open(geotag_dir / f"{name}.bak") as backup:
+            assert tagged.tobytes() == backup.tobytes(), "픽셀 데이터가 바뀌었습니다"
+    assert abs(server.extract_gps_from_exif(str(geotag_dir / "tagged.jpg"))["latitude"] - 33.5) < 1e-6
+    assert geotag(create_backup=False)["status_counts"]["already_tagged"] == 3
+    print("[OK] GPX 트랙 지오태깅 (dry_run, 보간, 백업, 기존 GPS 유지)")
+    
+    # 연사/중복 그룹: 시간 간격과 거리 조건을 이어서 만족하는 사진끼리 묶음
+    bursts_dir = fixture_dir("bursts")
+    burst_start = calendar.timegm((2024, 5, 1, 9, 0, 0))
+    for index, seconds in enumerate((0, 8, 16)):
+        make_jpeg(bursts_dir / f"chain{index}.jpg", 37.5 + index * 0.00005, 127.0, burst_start + seconds)
+    make_jpeg(bursts_dir / "far0.jpg", 37.505, 127.0, burst_start + 1)
+    make_jpeg(bursts_dir / "far1.jpg", 37.505, 127.0001, burst_start + 4)
+    make_jpeg(bursts_dir / "later.jpg", 37.5, 127.0, burst_start + 600)
+    make_jpeg(bursts_dir / "no_time.jpg", 37.5, 127.0)
+    
+    def burst_groups(**options):
+        result = json.loads(server._group_photo_bursts_impl(str(bursts_dir), address_mode="none", **options))
+        return result, [
+            [group["representative"]["filename"]] + [member["filename"] for member in group["redundant_members"]]
+            for group in result["groups"]
+        ]
+    
+    result, groups = burst_groups()
+    assert sorted(groups) == [["chain0.jpg", "chain1.jpg", "chain2.jpg"], ["far0.jpg", "far1.jpg"]], groups
+    assert result["images_without_timestamp"] == 1 and result["redundant_images"] == 3, result
+    assert burst_groups(min_group_size=3)[1] == [["chain0.jpg", "chain1.jpg", "chain2.jpg"]]
+    assert burst_groups(max_interval_sec=5)[1] == [["far0.jpg", "far1.jpg"]]
+    server._build_location_catalog_impl(str(bursts_dir))
+    assert sorted(burst_groups(use_catalog=True)[1]) == sorted(groups), "카탈로그와 파일 스캔 결과가 다릅니다"
+    print("[OK] 연사/중복 사진 그룹 (연쇄 묶음, 거리/간격/크기 조건, 카탈로그)")
+    
     print("\n[SUCCESS] 서버 코드 검증 완료!")
     print("서버를 실행하려면: python server.py")
-    
+
 except ImportError as e:
     print(f"[ERROR] 모듈을 가져올 수 없습니다: {e}")
     print("가상환경이 활성화되어 있고 필요한 패키지가 설치되어 있는지 확인하세요.")
@@ -55,4 +728,5 @@ except Exception as e:
     import traceback
     traceback.print_exc()
     sys.exit(1)
-
+finally:
+    shutil.rmtree(TEST_DIR, ignore_errors=True)